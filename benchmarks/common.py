@@ -0,0 +1,14 @@
+"""
+Helpers shared by the benchmarks
+"""
+from pathlib import Path
+
+def remove_database_files(db):
+    """
+    Remove the database file of a closed database together with its WAL and shared memory files
+    :param db: closed Database
+    :return: None
+    """
+    db_path = db.get_db_path()
+    for suffix in ("", "-wal", "-shm"):
+        Path(f"{db_path}{suffix}").unlink(missing_ok=True)
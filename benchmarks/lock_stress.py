@@ -0,0 +1,116 @@
+"""
+Stress the locking of one repository shared by several processes
+
+Every process opens its own Database on the same repository and creates notes and
+note-tag links as fast as it can, then the throughput, failure rate and lock waits are reported
+
+Usage: python -m benchmarks.lock_stress [processes] [operations_per_process] [busy_timeout_ms] [retry_attempts]
+"""
+import multiprocessing
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from server.database.database import Database
+from server.database.retry import RetryPolicy
+from server.application.models.notebook_model import NotebookModel
+from server.application.models.note_model import NoteModel
+from server.application.models.tag_model import TagModel
+from server.application.models.note_tag_model import NoteTagModel
+from benchmarks.common import remove_database_files
+
+def worker(repository, worker_id, operations, busy_timeout, retry_attempts, start_event, results):
+    """
+    Create notes and tag them, one commit per operation
+    :param repository: path of the shared repository
+    :param worker_id: number of the process
+    :param operations: number of notes to create (each note is also tagged)
+    :param busy_timeout: busy timeout in milliseconds
+    :param retry_attempts: attempts of the retry policy
+    :param start_event: event releasing all processes at once
+    :param results: queue receiving the result dictionary
+    :return: None
+    """
+    db = Database(repository, busy_timeout=busy_timeout, retry_policy=RetryPolicy(max_attempts=retry_attempts))
+    note_model = NoteModel(db)
+    note_tag_model = NoteTagModel(db)
+    notebook_id = NotebookModel(db).get_notebook_id("stress")
+    tag_id = TagModel(db).get_tag_id("stress")
+    succeeded = 0
+    errors = {}
+    start_event.wait()
+    start = time.perf_counter()
+    for i in range(operations):
+        try:
+            title = f"worker {worker_id} note {i}"
+            note_model.create_note(title, notebook_id)
+            note_tag_model.add_tag_to_note(note_model.get_note_id(title, notebook_id), tag_id)
+            succeeded += 1
+        except Exception as e:
+            name = type(e).__name__
+            errors[name] = errors.get(name, 0) + 1
+    elapsed = time.perf_counter() - start
+    results.put({
+        "succeeded": succeeded,
+        "errors": errors,
+        "elapsed": elapsed,
+        "locks": db.get_lock_stats()
+    })
+    db.close()
+
+def main():
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    operations = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    busy_timeout = int(sys.argv[3]) if len(sys.argv) > 3 else 5000
+    retry_attempts = int(sys.argv[4]) if len(sys.argv) > 4 else 5
+    with tempfile.TemporaryDirectory() as directory:
+        # The database file is named after the repository, so every run gets a fresh name
+        repository = Path(directory) / f"bench_locks_{uuid.uuid4().hex[:8]}"
+        db = Database(str(repository))
+        try:
+            NotebookModel(db).create_notebook("stress", None)
+            TagModel(db).create_tag("stress")
+            context = multiprocessing.get_context("spawn")
+            start_event = context.Event()
+            results = context.Queue()
+            workers = [
+                context.Process(
+                    target=worker,
+                    args=(str(repository), i, operations, busy_timeout, retry_attempts, start_event, results)
+                )
+                for i in range(processes)
+            ]
+            for process in workers:
+                process.start()
+            start = time.perf_counter()
+            start_event.set()
+            reports = [results.get() for _ in workers]
+            elapsed = time.perf_counter() - start
+            for process in workers:
+                process.join()
+            total = processes * operations
+            succeeded = sum(report["succeeded"] for report in reports)
+            errors = {}
+            for report in reports:
+                for name, count in report["errors"].items():
+                    errors[name] = errors.get(name, 0) + count
+            retries = sum(report["locks"]["retries"] for report in reports)
+            lock_failures = sum(report["locks"]["failures"] for report in reports)
+            max_wait = max(report["locks"]["max_wait_time"] for report in reports)
+            total_wait = sum(report["locks"]["total_wait_time"] for report in reports)
+            acquisitions = sum(report["locks"]["acquisitions"] for report in reports)
+            print(f"{processes} processes x {operations} operations, busy timeout {busy_timeout} ms, "
+                  f"{retry_attempts} attempts")
+            print(f"throughput      {succeeded / elapsed:>10.1f} operations/sec")
+            print(f"failure rate    {(total - succeeded) / total * 100:>10.2f} %  {errors or ''}")
+            print(f"lock waits      {acquisitions:>10} acquisitions, {retries} retries, {lock_failures} gave up")
+            print(f"wait time       {total_wait / max(acquisitions, 1) * 1000:>10.3f} ms avg, {max_wait * 1000:.1f} ms max")
+            stored = db.fetchvalue("SELECT count(*) FROM note_tags")
+            print(f"links stored    {stored:>10}")
+        finally:
+            db.close()
+            remove_database_files(db)
+
+if __name__ == "__main__":
+    main()
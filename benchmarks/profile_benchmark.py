@@ -0,0 +1,48 @@
+"""
+Measure commits per second of every performance profile on a synthetic repository
+
+Usage: python -m benchmarks.profile_benchmark [number_of_notes]
+"""
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from server.database.database import Database, PERFORMANCE_PROFILES
+from server.application.models.notebook_model import NotebookModel
+from server.application.models.note_model import NoteModel
+from benchmarks.common import remove_database_files
+
+def run_profile(profile, note_count):
+    """
+    Create notes one commit at a time with the given profile
+    :param profile: name of the performance profile
+    :param note_count: number of notes (and commits) to create
+    :return: commits per second
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        # The database file is named after the repository, so every run gets a fresh name
+        repository = Path(directory) / f"bench_{profile}_{uuid.uuid4().hex[:8]}"
+        db = Database(str(repository), profile=profile)
+        try:
+            notebook_model = NotebookModel(db)
+            note_model = NoteModel(db)
+            notebook_model.create_notebook("benchmark", None)
+            notebook_id = notebook_model.get_notebook_id("benchmark")
+            start = time.perf_counter()
+            for i in range(note_count):
+                note_model.create_note(f"note {i}", notebook_id)
+            elapsed = time.perf_counter() - start
+            return note_count / elapsed
+        finally:
+            db.close()
+            remove_database_files(db)
+
+def main():
+    note_count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print(f"{'profile':<10}{'commits/sec':>14}")
+    for profile in PERFORMANCE_PROFILES:
+        print(f"{profile:<10}{run_profile(profile, note_count):>14.1f}")
+
+if __name__ == "__main__":
+    main()
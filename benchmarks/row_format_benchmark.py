@@ -0,0 +1,57 @@
+"""
+Compare memory and throughput of the row formats when listing notes
+
+Usage: python -m benchmarks.row_format_benchmark [number_of_notes]
+"""
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from pathlib import Path
+from server.database.database import Database, ROW_FORMATS
+from server.database.records import NoteRow
+from server.application.models.notebook_model import NotebookModel
+from server.application.models.note_model import NoteModel
+from benchmarks.common import remove_database_files
+
+def measure(db, row_format, repeat=5):
+    """
+    Fetch all notes in the given row format
+    :param db: database filled with notes
+    :param row_format: row format to fetch with
+    :param repeat: number of timed runs
+    :return: (rows per second, peak bytes allocated while holding the result)
+    """
+    sql = "SELECT * FROM notes"
+    start = time.perf_counter()
+    for _ in range(repeat):
+        rows = db.fetchall(sql, record=NoteRow, row_format=row_format)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    rows = db.fetchall(sql, record=NoteRow, row_format=row_format)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(rows) * repeat / elapsed, peak
+
+def main():
+    note_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    with tempfile.TemporaryDirectory() as directory:
+        # The database file is named after the repository, so every run gets a fresh name
+        repository = Path(directory) / f"bench_rows_{uuid.uuid4().hex[:8]}"
+        db = Database(str(repository), profile="fast")
+        try:
+            NotebookModel(db).create_notebook("benchmark", None)
+            notebook_id = NotebookModel(db).get_notebook_id("benchmark")
+            NoteModel(db).create_notes((f"note {i}", notebook_id) for i in range(note_count))
+            print(f"{note_count} notes")
+            print(f"{'format':<8}{'rows/sec':>14}{'peak MiB':>12}")
+            for row_format in ROW_FORMATS:
+                rate, peak = measure(db, row_format)
+                print(f"{row_format:<8}{rate:>14.0f}{peak / 1024 / 1024:>12.1f}")
+        finally:
+            db.close()
+            remove_database_files(db)
+
+if __name__ == "__main__":
+    main()
@@ -13,11 +13,11 @@ from server.application.services.notebook_service import NotebookService
 from server.application.services.note_service import NoteService
 from server.application.services.note_tag_service import NoteTagService
 from server.application.services.tag_service import TagService
-from server.application.exceptions import NoteTagError
 
 class KnowgentGUI:
     def __init__(self, root, db, base_path):
         self.root = root
+        self.db = db
         self.text_processor = TextProcessor()
         self.markdown_mode = False
         self.chat_mode=False
@@ -421,14 +421,14 @@ class KnowgentGUI:
 
     def populate_tree(self):
         self.tree.delete(*self.tree.get_children())
-        # 获取所有笔记本
-        notebooks = self.notebook_service.get_all_notebooks()
-        for notebook in notebooks:
-            notebook_node = self.tree.insert("", "end", text=notebook['notebook_name'], open=True)
-            # 获取笔记本中的所有笔记
-            notes = self.note_service.get_all_notes_in_notebook(notebook['notebook_name'])
-            for note in notes:
-                self.tree.insert(notebook_node, "end", text=note['title'], open=False)
+        # 记录刷新树形结构的查询 (仅在开启数据库统计时生效)
+        with self.db.action("populate tree"):
+            # 一次查询获取所有笔记本及其笔记
+            for notebook in self.notebook_service.get_tree():
+                notebook_node = self.tree.insert("", "end", text=notebook['notebook_name'], open=True)
+                # 笔记本中的所有笔记
+                for note in notebook['notes']:
+                    self.tree.insert(notebook_node, "end", text=note['title'], open=False)
 
 
     def on_double_click(self, event):
@@ -443,14 +443,16 @@ class KnowgentGUI:
             self.current_notebook = notebook_name
             self.current_note = note_title
             try:
-                # 获取笔记内容
-                content = self.note_service.get_note_content(note_title, notebook_name)
+                # 记录打开笔记的查询 (仅在开启数据库统计时生效)
+                with self.db.action("open note"):
+                    # 一次获取笔记内容和标签
+                    note = self.note_service.open_note(note_title, notebook_name)
+                content = note["content"]
+                tags = note["tags"]
                 self.text_area.delete(1.0, tk.END)  # 清空编辑区
                 self.text_area.insert(tk.END, content)  # 显示笔记内容
                 self.root.title(f"Knowgent - {note_title} in {notebook_name}")  # 更新窗口标题
 
-                # 查询笔记的标签
-                tags = self.note_tag_service.get_tags_for_note(note_title, notebook_name)
                 self.tag_text = "; ".join(tags) if tags else ""  # 更新 self.tag_text
                 self.render_tags(tags)  # 渲染标签
 
@@ -667,13 +669,13 @@ class KnowgentGUI:
         notebook_name = self.tree.item(notebook_item, "text")  # 获取笔记本名称
         if messagebox.askyesno("Confirm Delete", f"Are you sure you want to delete notebook '{notebook_name}' and all its notes?"):
             try:
-                # 获取该笔记本下的所有笔记
-                notes = self.note_service.get_all_notes_in_notebook(notebook_name)  # 获取所有笔记
-                for note in notes:
-                    self.note_service.delete_note(note['title'], notebook_name)  # 删除每个笔记
-                
-                # 删除笔记本
+                # 删除笔记本 (笔记及其标签关联由数据库级联删除, 笔记文件随目录一起删除)
                 self.notebook_service.delete_notebook(notebook_name)
+                # 被删除的笔记本包含正在编辑区的笔记
+                if self.current_notebook == notebook_name:
+                    self.text_area.delete(1.0, tk.END)  # 清空编辑区
+                    self.current_notebook = None  # 重置当前笔记本
+                    self.current_note = None  # 重置当前笔记
                 self.populate_tree()  # 刷新树形结构
                 messagebox.showinfo("Success", f"Notebook '{notebook_name}' and all its notes deleted successfully!")
             except Exception as e:
@@ -747,31 +749,6 @@ class KnowgentGUI:
             except Exception as e:
                 messagebox.showerror("Error", f"Failed to rename note: {str(e)}")
 
-    def save_file(self, content, file_path=None):
-        if not file_path:
-            return False
-            
-        try: 
-            with open(file_path, "w") as file:
-                file.write(content)
-        except:
-            try:
-                with open(file_path, "w", encoding="utf-8") as file:
-                    file.write(content)
-            except Exception as e:
-                messagebox.showerror("Error", f"Could not save file: {e}")
-                return False
-        return True
-
-        # try:
-        #     with open(file_path, 'w') as file:
-        #         file.write(content)
-        #     # messagebox.showinfo("Success", f"File saved successfully at {save_path}")
-        #     return True
-        # except Exception as e:
-        #     messagebox.showerror("Error", f"Could not save file: {e}")
-        #     return False
-
     def save_note(self):
         """
         保存当前编辑区的内容到笔记
@@ -786,14 +763,9 @@ class KnowgentGUI:
         content = self.text_area.get(1.0, tk.END)  # 获取编辑区的内容
 
         try:
-            # 获取笔记的文件路径
-            file_path = self.note_service.get_note_file_path(note_title, notebook_name)
-
-            # 保存内容到文件
-            if self.save_file(content, file_path):
-                messagebox.showinfo("Success", f"Note '{note_title}' saved successfully!")
-            else:
-                messagebox.showerror("Error", f"Failed to save note '{note_title}'.")
+            # 保存内容到文件并更新笔记大小 (笔记本的统计由触发器维护)
+            self.note_service.save_note_content(note_title, notebook_name, content)
+            messagebox.showinfo("Success", f"Note '{note_title}' saved successfully!")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to save note: {str(e)}")
 
@@ -820,18 +792,13 @@ class KnowgentGUI:
             # 在选定的笔记本中创建新的笔记
             success = self.note_service.create_note(note_title, notebook_name)
             if success:
-                # 获取新笔记的文件路径
-                file_path = self.note_service.get_note_file_path(note_title, notebook_name)
-
-                # 保存内容到文件
-                if self.save_file(content, file_path):
-                    messagebox.showinfo("Success", f"Note '{note_title}' saved successfully in notebook '{notebook_name}'!")
-                    self.current_notebook = notebook_name
-                    self.current_note = note_title
-                    self.tag_text = ""
-                    self.populate_tree()  # 刷新树形结构
-                else:
-                    messagebox.showerror("Error", f"Failed to save note '{note_title}'.")
+                # 保存内容到文件并更新笔记大小
+                self.note_service.save_note_content(note_title, notebook_name, content)
+                messagebox.showinfo("Success", f"Note '{note_title}' saved successfully in notebook '{notebook_name}'!")
+                self.current_notebook = notebook_name
+                self.current_note = note_title
+                self.tag_text = ""
+                self.populate_tree()  # 刷新树形结构
             else:
                 messagebox.showerror("Error", f"Failed to create note '{note_title}' in notebook '{notebook_name}'.")
         except Exception as e:
@@ -890,42 +857,14 @@ class KnowgentGUI:
             # 格式化标签并生成tag_list
             tag_list = [tag.strip() for tag in re.split(r'[;；]', new_tags) if tag.strip()]  # 去除空格并过滤空标签
 
-            # 调用后端服务获取该笔记的现有标签
+            # 由后端在同一个事务中计算差异: 创建缺少的标签, 添加新标签, 删除不再需要的标签
             try:
-                existing_tags = self.note_tag_service.get_tags_for_note(self.current_note, self.current_notebook)
+                self.note_tag_service.set_tags_for_note(self.current_note, self.current_notebook, tag_list)
             except Exception as e:
-                messagebox.showerror("Error", f"Failed to fetch existing tags: {str(e)}")
+                messagebox.showerror("Error", f"Failed to save tags: {str(e)}")
+                # 保存失败时没有任何标签被修改, 保留当前显示的标签
                 return
 
-            # 将现有标签和新的标签列表转换为集合，方便对比
-            existing_tags_set = set(existing_tags)
-            new_tags_set = set(tag_list)
-
-            # 计算需要添加的标签和需要删除的标签
-            tags_to_add = new_tags_set - existing_tags_set
-            tags_to_remove = existing_tags_set - new_tags_set
-
-            # 添加新标签
-            for tag in tags_to_add:
-                try:
-                    self.note_tag_service.add_tag_to_note(self.current_note, self.current_notebook, tag)
-                except NoteTagError:
-                    try:
-                        self.tag_service.create_tag(tag)  # 调用 tag_service 创建 tag
-                        self.note_tag_service.add_tag_to_note(self.current_note, self.current_notebook, tag)  # 重新添加标签
-                    except Exception as e:
-                        pass
-                        messagebox.showerror("Error", f"Failed to create tag '{tag}': {str(e)}")
-                except Exception as e:
-                    messagebox.showerror("Error", f"Failed to add tag '{tag}': {str(e)}")
-
-            # 删除不再需要的标签
-            for tag in tags_to_remove:
-                try:
-                    self.note_tag_service.remove_tag_from_note(self.current_note, self.current_notebook, tag)
-                except Exception as e:
-                    messagebox.showerror("Error", f"Failed to remove tag '{tag}': {str(e)}")
-
             # 更新 self.tag_text
             self.tag_text = '; '.join(tag_list) + '; '  # 保存用户输入的标签
 
@@ -1,21 +1,62 @@
 import tkinter as tk
 from client.gui import KnowgentGUI
-from server.database.database import Database
+from server.database.database import Database, DEFAULT_PROFILE, DEFAULT_ROW_FORMAT
+from server.database.retry import RetryPolicy
+from server.database.maintenance import MaintenanceScheduler
 
 def main():
     base_path = "./MyRepository"
+    db_profile = DEFAULT_PROFILE
+    db_row_format = DEFAULT_ROW_FORMAT
+    db_slow_query_ms = None
+    db_busy_timeout_ms = None
+    db_retry_attempts = None
+    db_maintenance_minutes = 60
+    db_cache_size = 1024
     # 读取配置文件
     try:
         with open("config.txt", "r") as config_file:
             for line in config_file:
-                if line.startswith("base_path"):
-                    base_path = line.split("=")[1].strip()  # 获取bath_path的值
-                    break  # 找到后退出循环
+                if "=" not in line:
+                    continue
+                key, value = line.split("=", 1)
+                key, value = key.strip(), value.strip()
+                if key == "base_path":
+                    base_path = value  # 获取bath_path的值
+                elif key == "db_profile":
+                    db_profile = value  # 数据库性能配置: safe / balanced / fast
+                elif key == "db_row_format":
+                    db_row_format = value  # 查询结果的行格式: dict / row / record
+                elif key == "db_slow_query_ms":
+                    db_slow_query_ms = float(value)  # 开启SQL统计, 超过该耗时(毫秒)的查询记录执行计划
+                elif key == "db_busy_timeout_ms":
+                    db_busy_timeout_ms = int(value)  # 数据库被其他进程锁定时的等待时间(毫秒)
+                elif key == "db_retry_attempts":
+                    db_retry_attempts = int(value)  # 等待超时后的最大尝试次数
+                elif key == "db_maintenance_minutes":
+                    db_maintenance_minutes = float(value)  # 空闲时数据库维护的间隔(分钟), 0为关闭
+                elif key == "db_cache_size":
+                    db_cache_size = int(value)  # 笔记本/笔记/标签缓存的最大条目数, 0为关闭
     except FileNotFoundError:
         pass
     # 初始化数据库
-    db = Database(base_path)
+    retry_policy = RetryPolicy(max_attempts=db_retry_attempts) if db_retry_attempts is not None else None
+    db = Database(
+        base_path,
+        profile=db_profile,
+        row_format=db_row_format,
+        busy_timeout=db_busy_timeout_ms,
+        retry_policy=retry_policy,
+        cache_size=db_cache_size
+    )
     db.initialize()
+    if db_slow_query_ms is not None:
+        db.enable_instrumentation(slow_query_threshold=db_slow_query_ms / 1000)
+    # 空闲时在后台进行数据库维护
+    scheduler = None
+    if db_maintenance_minutes > 0:
+        scheduler = MaintenanceScheduler(db, interval=db_maintenance_minutes * 60)
+        scheduler.start()
 
     # 初始化主窗口
     root = tk.Tk()
@@ -24,5 +65,14 @@ def main():
     app = KnowgentGUI(root, db,base_path)
     root.mainloop()
 
+    if scheduler:
+        scheduler.stop()
+
+    # 退出时输出SQL统计报告
+    stats = db.get_query_stats()
+    if stats:
+        print(stats.format_report())
+        print(f"Entity cache: {db.get_cache_stats()}")
+
 if __name__ == "__main__":
     main() 
@@ -5,6 +5,7 @@ Application-wide exceptions for handling various error cases in the notebook app
 from .base import BaseError
 from .database import (
     DatabaseError,
+    DatabaseLockedError,
     ValidationError
 )
 from .resource import (
@@ -23,13 +24,16 @@ from .operation import (
     NotebookError,
     NoteError,
     TagError,
-    NoteTagError
+    NoteTagError,
+    SyncError,
+    StatsError
 )
 from .ollama import OllamaError
 
 __all__ = [
     'BaseError',
     'DatabaseError',
+    'DatabaseLockedError',
     'ValidationError',
     'ResourceNotFoundError',
     'NotebookNotFoundError',
@@ -40,6 +44,8 @@ __all__ = [
     'NoteError',
     'TagError',
     'NoteTagError',
+    'SyncError',
+    'StatsError',
     'DuplicateResourceError',
     'DuplicateNotebookError',
     'DuplicateNoteError',
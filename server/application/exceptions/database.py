@@ -10,4 +10,10 @@ class ValidationError(BaseError):
     """
     Raised when data validation fails (e.g., invalid input, missing required fields)
     """
-    pass
\ No newline at end of file
+    pass
+
+class DatabaseLockedError(DatabaseError):
+    """
+    Raised when the database stays locked by another connection or process after all retries
+    """
+    pass
@@ -22,4 +22,16 @@ class NoteTagError(BaseError):
     """
     Raised when note-tag relationship operations fail
     """
-    pass
\ No newline at end of file
+    pass
+
+class SyncError(BaseError):
+    """
+    Raised when synchronizing two repositories fails
+    """
+    pass
+
+class StatsError(BaseError):
+    """
+    Raised when reading or checking the note counters fails
+    """
+    pass
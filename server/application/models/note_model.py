@@ -1,12 +1,18 @@
+import json
 import sqlite3
+from server.database.records import NoteRow
 from server.application.exceptions import (
     DatabaseError,
+    DatabaseLockedError,
     ValidationError,
     NoteNotFoundError,
     NotebookNotFoundError,
     DuplicateNoteError
 )
 
+# Columns notes can be paged by, the note ID breaks ties
+PAGE_SORT_KEYS = ("title", "created_at", "updated_at")
+
 class NoteModel:
     def __init__(self, db):
         """
@@ -27,11 +33,21 @@ class NoteModel:
         if not isinstance(notebook_id, int) or notebook_id <= 0:
             return False
         check_sql = "SELECT id FROM notebooks WHERE id = ?"
-        result = self.db.fetchone(check_sql, [notebook_id])
+        result = self.db.fetchvalue(check_sql, [notebook_id])
         if result is None:
             return False
         return True
         
+    def __find_missing_notebooks(self, notebook_ids):
+        """
+        Find which of the given notebook IDs do not exist (one query for the whole set)
+        :param notebook_ids: set of notebook IDs
+        :return: set of IDs that do not exist
+        """
+        check_sql = "SELECT id FROM notebooks WHERE id IN (SELECT value FROM json_each(?))"
+        existing = {row["id"] for row in self.db.fetchall(check_sql, [json.dumps(list(notebook_ids))])}
+        return notebook_ids - existing
+
     def create_note(self, title, notebook_id):
         """
         Create a new note
@@ -47,25 +63,66 @@ class NoteModel:
             raise ValidationError("Note title cannot be None")
         if not isinstance(notebook_id, int) or notebook_id <= 0:
             raise ValidationError("Invalid notebook ID")
-        # Check if the notebook exists
-        if not self.__is_notebook_exists(notebook_id):
-            raise NotebookNotFoundError(f"Notebook with ID {notebook_id} does not exist")
+        # A missing notebook is rejected by the foreign key, a duplicate by the unique constraint
         try:
-            with self.db.transaction():
-                # Create the note
-                sql = """
-                INSERT INTO notes (title, notebook_id)
-                VALUES (?, ?)
-                """
-                params = [title, notebook_id]
-                self.db.execute(sql, params)
+            # Create the note
+            sql = """
+            INSERT INTO notes (title, notebook_id)
+            VALUES (?, ?)
+            """
+            params = [title, notebook_id]
+            self.db.execute(sql, params)
+        except DatabaseLockedError:
+            raise
         except sqlite3.IntegrityError as e:
             if "UNIQUE constraint" in str(e):
                 raise DuplicateNoteError(f"Note with title {title} already exists")
+            if "FOREIGN KEY constraint" in str(e):
+                raise NotebookNotFoundError(f"Notebook with ID {notebook_id} does not exist")
             raise DatabaseError(f"Failed to create note: {str(e)}")
         except (DatabaseError, sqlite3.Error, Exception) as e:
             raise DatabaseError(f"Failed to create note: {str(e)}")
-        
+
+    def create_notes(self, notes):
+        """
+        Create many notes in one transaction
+        :param notes: iterable of (title, notebook_id) pairs
+        :raises ValidationError: if any title is None or any notebook ID is invalid
+        :raises DuplicateNoteError: if a note already exists or appears twice in the batch
+        :raises NotebookNotFoundError: if any notebook does not exist
+        :raises DatabaseError: if database operation fails
+        :return: NULL
+        """
+        notes = [tuple(note) for note in notes]
+        if not notes:
+            return
+        # Validate the whole batch before touching the database
+        for title, notebook_id in notes:
+            if title is None:
+                raise ValidationError("Note title cannot be None")
+            if not isinstance(notebook_id, int) or notebook_id <= 0:
+                raise ValidationError("Invalid notebook ID")
+        if len(set(notes)) != len(notes):
+            raise DuplicateNoteError("The same note appears more than once in the batch")
+        try:
+            sql = """
+            INSERT INTO notes (title, notebook_id)
+            VALUES (?, ?)
+            """
+            self.db.executemany(sql, notes)
+        except DatabaseLockedError:
+            raise
+        except sqlite3.IntegrityError as e:
+            if "UNIQUE constraint" in str(e):
+                raise DuplicateNoteError(f"Some notes already exist: {str(e)}")
+            if "FOREIGN KEY constraint" in str(e):
+                # The batch was rolled back, find the missing notebooks with a single query
+                missing = self.__find_missing_notebooks({notebook_id for _, notebook_id in notes})
+                raise NotebookNotFoundError(f"Notebooks with IDs {sorted(missing)} do not exist")
+            raise DatabaseError(f"Failed to create notes: {str(e)}")
+        except (DatabaseError, sqlite3.Error, Exception) as e:
+            raise DatabaseError(f"Failed to create notes: {str(e)}")
+
     def get_note_id(self, title, notebook_id):
         """
         Retrieve a note's ID by title
@@ -81,16 +138,18 @@ class NoteModel:
             raise ValidationError("Note title cannote be None")
         if not isinstance(notebook_id, int) or notebook_id <= 0:
             raise ValidationError("Invalid notebook ID")
-        # Check if the notebook exists
-        if not self.__is_notebook_exists(notebook_id):
-            raise NotebookNotFoundError(f"Notebook with ID {notebook_id} does not exist")
         # Try to get the note's ID
         try:
             sql = "SELECT id FROM notes WHERE title = ? AND notebook_id = ?"
-            result = self.db.fetchone(sql, [title, notebook_id])
+            result = self.db.cached_id(
+                "notes", (title, notebook_id), lambda: self.db.fetchvalue(sql, [title, notebook_id])
+            )
             if result is None:
+                # Only a miss has to tell a missing notebook from a missing note
+                if not self.__is_notebook_exists(notebook_id):
+                    raise NotebookNotFoundError(f"Notebook with ID {notebook_id} does not exist")
                 raise NoteNotFoundError(f"Note with title {title} does not exist")
-            return result["id"]
+            return result
         except sqlite3.Error as e:
             raise DatabaseError(f"Failed to get note ID: {str(e)}")
 
@@ -108,13 +167,88 @@ class NoteModel:
             raise ValidationError("Invalid note ID")
         try:
             sql = "SELECT * FROM notes WHERE id = ?"
-            result = self.db.fetchone(sql, [note_id])
+            result = self.db.cached("notes", note_id, lambda: self.db.fetchone(sql, [note_id], record=NoteRow))
             if result is None:
                 raise NoteNotFoundError(f"Note with ID {note_id} does not exist")
             return result
         except sqlite3.Error as e:
             raise DatabaseError(f"Failed to get note: {str(e)}")
 
+    def get_note_with_tags(self, title, notebook_id):
+        """
+        Retrieve a note's details together with its tag names in a single query
+        :param title: title of the note
+        :param notebook_id: ID of the notebook which the note belongs to
+        :raises ValidationError: if the title is None, or notebook_id is invalid
+        :raises NoteNotFoundError: if the note does not exist
+        :raises NotebookNotFoundError: if the notebook does not exist
+        :raises DatabaseError: if database operation fails
+        :return: dictionary of the note with an additional "tags" list
+        """
+        if title is None:
+            raise ValidationError("Note title cannot be None")
+        if not isinstance(notebook_id, int) or notebook_id <= 0:
+            raise ValidationError("Invalid notebook ID")
+        try:
+            # The tags are aggregated into a JSON array so that the note stays a single row
+            sql = """
+            SELECT notes.id, notes.title, notes.notebook_id, notes.created_at, notes.updated_at,
+                   (SELECT json_group_array(tags.tag_name)
+                    FROM note_tags
+                    JOIN tags ON tags.id = note_tags.tag_id
+                    WHERE note_tags.note_id = notes.id)
+            FROM notes
+            WHERE notes.title = ? AND notes.notebook_id = ?
+            """
+            row = self.db.fetchone(sql, [title, notebook_id], row_format="tuple")
+            if row is None:
+                # Only a miss has to tell a missing notebook from a missing note
+                if not self.__is_notebook_exists(notebook_id):
+                    raise NotebookNotFoundError(f"Notebook with ID {notebook_id} does not exist")
+                raise NoteNotFoundError(f"Note with title {title} does not exist")
+        except sqlite3.Error as e:
+            raise DatabaseError(f"Failed to get note with tags: {str(e)}")
+        note_id, title, notebook_id, created_at, updated_at, tags = row
+        return {
+            "id": note_id,
+            "title": title,
+            "notebook_id": notebook_id,
+            "created_at": created_at,
+            "updated_at": updated_at,
+            "tags": json.loads(tags)
+        }
+
+    def get_notes_by_ids(self, note_ids):
+        """
+        Retrieve many notes' details with a single query
+        :param note_ids: iterable of note IDs
+        :raises ValidationError: if any note ID is invalid
+        :raises NoteNotFoundError: if any note does not exist
+        :raises DatabaseError: if database operation fails
+        :return: list of notes (dictionaries) in the order of the given IDs
+        """
+        note_ids = list(note_ids)
+        for note_id in note_ids:
+            if not isinstance(note_id, int) or note_id <= 0:
+                raise ValidationError("Invalid note ID")
+        if not note_ids:
+            return []
+        try:
+            # The IDs are passed as one JSON array, so the statement does not depend on their number
+            sql = """
+            SELECT notes.*
+            FROM json_each(?) AS ids
+            JOIN notes ON notes.id = ids.value
+            ORDER BY ids.key
+            """
+            notes = self.db.fetchall(sql, [json.dumps(note_ids)], record=NoteRow)
+        except sqlite3.Error as e:
+            raise DatabaseError(f"Failed to get notes: {str(e)}")
+        if len(notes) != len(note_ids):
+            missing = set(note_ids) - {note["id"] for note in notes}
+            raise NoteNotFoundError(f"Notes with IDs {sorted(missing)} do not exist")
+        return notes
+
     def update_note(self, note_id, new_title=None, new_notebook_id=None):
         """
         Update a note by ID
@@ -132,43 +266,73 @@ class NoteModel:
             raise ValidationError("Invalid note ID")
         if not any([new_title, new_notebook_id]):
             raise ValidationError("At least one update parameter must be provided")
-        # If new notebook_id is provided, check if the notebook id is valid and if the notebook exists
+        # If new notebook_id is provided, check if the notebook id is valid
+        # (a missing notebook is rejected by the foreign key)
         if new_notebook_id:
             if not isinstance(new_notebook_id, int) or new_notebook_id <= 0:
                 raise ValidationError("Invalid notebook ID")
-            if not self.__is_notebook_exists(new_notebook_id):
-                raise NotebookNotFoundError(f"Notebook with ID {new_notebook_id} does not exist")
         # Try to update the note
         try:
-            # Check whether the note exists
-            if not self.get_note(note_id):
-                raise NoteNotFoundError(f"Note with ID {note_id} does not exist")
-            with self.db.transaction():
-                sql = "UPDATE notes SET"
-                updates = [] # Fileds need to be updated
-                params = [] # Parameters for the SQL query
-                # Add conditions for fields that need to be updated
-                if new_title:
-                    updates.append(" title = ?")
-                    params.append(new_title)
-                # Use get_id_by_name() in NotebookModel to get id of a notebook
-                if new_notebook_id:
-                    updates.append(" notebook_id = ?")
-                    params.append(new_notebook_id)
-                # Set update time by CURRENT_TIMESTAMP
-                updates.append(" updated_at = CURRENT_TIMESTAMP")
-                # Join updates
-                sql += ", ".join(updates)
-                sql += " WHERE id = ?"
-                params.append(note_id)
-                # Execute update
-                self.db.execute(sql, params)
+            sql = "UPDATE notes SET"
+            updates = [] # Fileds need to be updated
+            params = [] # Parameters for the SQL query
+            # Add conditions for fields that need to be updated
+            if new_title:
+                updates.append(" title = ?")
+                params.append(new_title)
+            # Use get_id_by_name() in NotebookModel to get id of a notebook
+            if new_notebook_id:
+                updates.append(" notebook_id = ?")
+                params.append(new_notebook_id)
+            # Set update time by CURRENT_TIMESTAMP
+            updates.append(" updated_at = CURRENT_TIMESTAMP")
+            # Join updates
+            sql += ", ".join(updates)
+            sql += " WHERE id = ?"
+            params.append(note_id)
+            # Execute update
+            updated = self.db.execute(sql, params)
+        except DatabaseLockedError:
+            raise
         except sqlite3.IntegrityError as e:
             if "UNIQUE constraint" in str(e):
                 raise DuplicateNoteError(f"Note with title {new_title} already exists")
+            if "FOREIGN KEY constraint" in str(e):
+                raise NotebookNotFoundError(f"Notebook with ID {new_notebook_id} does not exist")
             raise DatabaseError(f"Failed to update note: {str(e)}")
         except (DatabaseError, sqlite3.Error, Exception) as e:
             raise DatabaseError(f"Failed to update note: {str(e)}")
+        self.db.invalidate_cached("notes", note_id)
+        # No row updated means the note does not exist
+        if updated == 0:
+            raise NoteNotFoundError(f"Note with ID {note_id} does not exist")
+
+    def set_note_size(self, note_id, size):
+        """
+        Record the size of a note's file after its content was saved
+        The counters of the notebook follow through the notes_update_stats trigger
+        :param note_id: ID of the note
+        :param size: size of the note file in bytes
+        :raises ValidationError: if the note ID or the size is invalid
+        :raises NoteNotFoundError: if the note does not exist
+        :raises DatabaseError: if database operation fails
+        :return: NULL
+        """
+        if not isinstance(note_id, int) or note_id <= 0:
+            raise ValidationError("Invalid note ID")
+        if not isinstance(size, int) or size < 0:
+            raise ValidationError("Invalid note size")
+        try:
+            sql = "UPDATE notes SET size = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?"
+            updated = self.db.execute(sql, [size, note_id])
+        except DatabaseLockedError:
+            raise
+        except (DatabaseError, sqlite3.Error, Exception) as e:
+            raise DatabaseError(f"Failed to set note size: {str(e)}")
+        self.db.invalidate_cached("notes", note_id)
+        # No row updated means the note does not exist
+        if updated == 0:
+            raise NoteNotFoundError(f"Note with ID {note_id} does not exist")
 
     def delete_note(self, note_id):
         """
@@ -181,16 +345,18 @@ class NoteModel:
         """
         if not isinstance(note_id, int) or note_id <= 0:
             raise ValidationError("Invalid note ID")
-        # Check whether the note exists
-        if not self.get_note(note_id):
-            raise NoteNotFoundError(f"Note with ID {note_id} does not exist")
         try:
-            with self.db.transaction():
-                sql = "DELETE FROM notes WHERE id = ?"
-                # Execute delete
-                self.db.execute(sql, [note_id])
+            sql = "DELETE FROM notes WHERE id = ?"
+            # Execute delete
+            deleted = self.db.execute(sql, [note_id])
+        except DatabaseLockedError:
+            raise
         except (DatabaseError, sqlite3.Error, Exception) as e:
             raise DatabaseError(f"Failed to delete note: {str(e)}")
+        self.db.invalidate_cached("notes", note_id)
+        # No row deleted means the note does not exist
+        if deleted == 0:
+            raise NoteNotFoundError(f"Note with ID {note_id} does not exist")
         
     def delete_all_notes_in_notebook(self, notebook_id):
         """
@@ -202,16 +368,19 @@ class NoteModel:
         """
         if not isinstance(notebook_id, int) or notebook_id <= 0:
             raise ValidationError("Invalid notebook ID")
-        # Check whether the notebook exists
-        if not self.__is_notebook_exists(notebook_id):
-            raise NotebookNotFoundError(f"Notebook with ID {notebook_id} does not exist")
         # Try to delete notes in database
         try:
-            with self.db.transaction():
-                sql = "DELETE FROM notes WHERE notebook_id = ?"
-                self.db.execute(sql, [notebook_id])
+            sql = "DELETE FROM notes WHERE notebook_id = ?"
+            deleted = self.db.execute(sql, [notebook_id])
+            # Only an empty result has to tell an empty notebook from a missing one
+            notebook_exists = deleted > 0 or self.__is_notebook_exists(notebook_id)
+        except DatabaseLockedError:
+            raise
         except (DatabaseError, sqlite3.Error, Exception) as e:
             raise DatabaseError(f"Failed to delete notes in Notebook with ID {notebook_id}: {str(e)}")
+        self.db.invalidate_cached("notes")
+        if not notebook_exists:
+            raise NotebookNotFoundError(f"Notebook with ID {notebook_id} does not exist")
         
     def get_all_notes_in_notebook(self, notebook_id):
         """
@@ -224,12 +393,13 @@ class NoteModel:
         """
         if not isinstance(notebook_id, int) or notebook_id <= 0:
             raise ValidationError("Invalid notebook ID")
-        # Check whether the notebook exists
-        if not self.__is_notebook_exists(notebook_id):
-            raise NotebookNotFoundError(f"Notebook with ID {notebook_id} does not exist")
         try:
             sql = "SELECT * FROM notes WHERE notebook_id = ?"
-            return self.db.fetchall(sql, [notebook_id])
+            notes = self.db.fetchall(sql, [notebook_id], record=NoteRow)
+            # Only an empty result has to tell an empty notebook from a missing one
+            if not notes and not self.__is_notebook_exists(notebook_id):
+                raise NotebookNotFoundError(f"Notebook with ID {notebook_id} does not exist")
+            return notes
         except sqlite3.Error as e:
             raise DatabaseError(f"Failed to get all notes in notebook with ID {notebook_id}: {str(e)}")
         
@@ -241,6 +411,69 @@ class NoteModel:
         """
         try:
             sql = "SELECT * FROM notes"
-            return self.db.fetchall(sql)
+            return self.db.fetchall(sql, record=NoteRow)
+        except sqlite3.Error as e:
+            raise DatabaseError(f"Failed to get all notes: {str(e)}")
+
+    def get_notes_page(self, notebook_id=None, sort="title", cursor=None, limit=100, descending=False):
+        """
+        Retrieve one page of notes in a stable order using keyset pagination
+        A page starts right after the cursor, so its cost does not grow with the number of pages before it
+        :param notebook_id: ID of the notebook to list, None for all notes
+        :param sort: column the notes are ordered by ("title", "created_at" or "updated_at")
+        :param cursor: cursor returned with the previous page, None for the first page
+        :param limit: maximum number of notes in the page
+        :param descending: True to list the notes in descending order
+        :raises ValidationError: if the notebook ID, sort key, cursor or limit is invalid
+        :raises NotebookNotFoundError: if the notebook does not exist
+        :raises DatabaseError: if database operation fails
+        :return: (list of notes, cursor of the next page or None after the last page)
+        """
+        if notebook_id is not None and (not isinstance(notebook_id, int) or notebook_id <= 0):
+            raise ValidationError("Invalid notebook ID")
+        if sort not in PAGE_SORT_KEYS:
+            raise ValidationError(f"Invalid sort key {sort}, expected one of {', '.join(PAGE_SORT_KEYS)}")
+        if not isinstance(limit, int) or limit <= 0:
+            raise ValidationError("Page limit must be a positive integer")
+        if cursor is not None and (not isinstance(cursor, (list, tuple)) or len(cursor) != 2):
+            raise ValidationError("Invalid page cursor")
+        conditions = []
+        params = []
+        if notebook_id is not None:
+            conditions.append("notebook_id = ?")
+            params.append(notebook_id)
+        if cursor is not None:
+            # Row value comparison lets SQLite seek the (column, rowid) index to the cursor
+            conditions.append(f"({sort}, id) {'<' if descending else '>'} (?, ?)")
+            params.extend(cursor)
+        order = "DESC" if descending else "ASC"
+        sql = "SELECT * FROM notes"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += f" ORDER BY {sort} {order}, id {order} LIMIT ?"
+        # One extra row tells whether another page follows
+        params.append(limit + 1)
+        try:
+            notes = self.db.fetchall(sql, params, record=NoteRow)
+            # Only an empty first page has to tell an empty notebook from a missing one
+            if not notes and cursor is None and notebook_id is not None and not self.__is_notebook_exists(notebook_id):
+                raise NotebookNotFoundError(f"Notebook with ID {notebook_id} does not exist")
+        except sqlite3.Error as e:
+            raise DatabaseError(f"Failed to get page of notes: {str(e)}")
+        if len(notes) <= limit:
+            return notes, None
+        notes = notes[:limit]
+        return notes, (notes[-1][sort], notes[-1]["id"])
+
+    def iter_all_notes(self, batch_size=500):
+        """
+        Iterate over all notes without loading them into memory at once
+        :param batch_size: number of rows read from the database per round trip
+        :raises DatabaseError: if database operation fails
+        :return: generator of notes (dictionaries)
+        """
+        try:
+            sql = "SELECT * FROM notes"
+            yield from self.db.iterfetch(sql, batch_size=batch_size, record=NoteRow)
         except sqlite3.Error as e:
-            raise DatabaseError(f"Failed to get all notes: {str(e)}")
\ No newline at end of file
+            raise DatabaseError(f"Failed to iterate over all notes: {str(e)}")
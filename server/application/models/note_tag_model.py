@@ -1,7 +1,9 @@
+import json
 import sqlite3
 from server.application.exceptions import (
     ValidationError,
     DatabaseError,
+    DatabaseLockedError,
     NoteNotFoundError,
     TagNotFoundError,
     DuplicateNoteTagError
@@ -17,34 +19,24 @@ class NoteTagModel:
             raise ValidationError("Database connection cannot be None")
         self.db = db
         
-    def __is_note_exists(self, note_id):
+    def __raise_if_missing(self, note_id=None, tag_id=None):
         """
-        Check whether a note exists
-        :param note_id: ID of the note
-        :return: True if the note exists, False otherwise
-        """
-        if not isinstance(note_id, int) or note_id <= 0:
-            return False
-        check_sql = "SELECT id FROM notes WHERE id = ?"
-        result = self.db.fetchone(check_sql, [note_id])
-        if result is None:
-            return False
-        return True
-        
-    def __is_tag_exists(self, tag_id):
+        Raise the error of a missing note or tag with a single query
+        Only called after a statement was rejected or affected no rows, so the common path needs no check
+        :param note_id: ID of the note to check, None to skip
+        :param tag_id: ID of the tag to check, None to skip
+        :raises NoteNotFoundError: if the note does not exist
+        :raises TagNotFoundError: if the tag does not exist
+        :return: None
         """
-        Check whether a tag exists
-        :param tag_id: ID of the tag
-        :return: True if the tag exists, False otherwise
+        check_sql = """
+        SELECT EXISTS (SELECT 1 FROM notes WHERE id = ?), EXISTS (SELECT 1 FROM tags WHERE id = ?)
         """
-        if not isinstance(tag_id, int) or tag_id <= 0:
-            return False
-        check_sql = "SELECT id FROM tags WHERE id = ?"
-        result = self.db.fetchone(check_sql, [tag_id])
-        if result is None:
-            return False
-        return True
-
+        note_exists, tag_exists = self.db.fetchone(check_sql, [note_id, tag_id], row_format="tuple")
+        if note_id is not None and not note_exists:
+            raise NoteNotFoundError(f"Note with ID {note_id} does not exist")
+        if tag_id is not None and not tag_exists:
+            raise TagNotFoundError(f"Tag with ID {tag_id} does not exist")
 
     def add_tag_to_note(self, note_id, tag_id):
         """
@@ -62,29 +54,88 @@ class NoteTagModel:
             raise ValidationError("Invalid note ID")
         if not isinstance(tag_id, int) or tag_id <= 0:
             raise ValidationError("Invalid tag ID")
-        # Check if the note and tag exist
-        if not self.__is_note_exists(note_id):
-            raise NoteNotFoundError(f"Note with ID {note_id} does not exist")
-        if not self.__is_tag_exists(tag_id):
-            raise TagNotFoundError(f"Tag with ID {tag_id} does not exist")
-        # Try to associate the tag with the note
+        # Try to associate the tag with the note, a missing note or tag is rejected by the foreign keys
         try:
-            with self.db.transaction():
-                sql = """
-                INSERT INTO note_tags (note_id, tag_id)
-                VALUES (?, ?)
-                """
-                self.db.execute(sql, [note_id, tag_id])
+            sql = """
+            INSERT INTO note_tags (note_id, tag_id)
+            VALUES (?, ?)
+            """
+            self.db.execute(sql, [note_id, tag_id])
+        except DatabaseLockedError:
+            raise
         except sqlite3.IntegrityError as e:
             err_info = str(e)
             if "UNIQUE constraint failed" in err_info:
                 raise DuplicateNoteTagError(
                     f"Note with id {note_id} is already associated with tag with id {tag_id}"
                 )
+            if "FOREIGN KEY constraint failed" in err_info:
+                # The error does not tell which key failed
+                self.__raise_if_missing(note_id, tag_id)
             raise DatabaseError(f"Failed to associate tag with note: {err_info}")
         except (DatabaseError, sqlite3.Error, Exception) as e:
             raise DatabaseError(f"Failed to associate tag with note: {str(e)}")
 
+    def __find_missing(self, table, ids):
+        """
+        Find which of the given IDs do not exist in a table (one query for the whole set)
+        :param table: name of the table ("notes" or "tags")
+        :param ids: set of IDs
+        :return: set of IDs that do not exist
+        """
+        if not ids:
+            return set()
+        check_sql = f"SELECT id FROM {table} WHERE id IN (SELECT value FROM json_each(?))"
+        existing = {row["id"] for row in self.db.fetchall(check_sql, [json.dumps(list(ids))])}
+        return ids - existing
+
+    def add_tags_to_notes(self, pairs):
+        """
+        Associate many tags with notes in one transaction
+        :param pairs: iterable of (note_id, tag_id) pairs
+        :raises ValidationError: if any note_id or tag_id is invalid
+        :raises DuplicateNoteTagError: if an association already exists or appears twice in the batch
+        :raises NoteNotFoundError: if any note does not exist
+        :raises TagNotFoundError: if any tag does not exist
+        :raises DatabaseError: if database operation fails
+        :return: NULL
+        """
+        pairs = [tuple(pair) for pair in pairs]
+        if not pairs:
+            return
+        # Validate the whole batch before touching the database
+        for note_id, tag_id in pairs:
+            if not isinstance(note_id, int) or note_id <= 0:
+                raise ValidationError("Invalid note ID")
+            if not isinstance(tag_id, int) or tag_id <= 0:
+                raise ValidationError("Invalid tag ID")
+        if len(set(pairs)) != len(pairs):
+            raise DuplicateNoteTagError("The same note-tag association appears more than once in the batch")
+        # Try to associate the tags with the notes, missing notes or tags are rejected by the foreign keys
+        try:
+            sql = """
+            INSERT INTO note_tags (note_id, tag_id)
+            VALUES (?, ?)
+            """
+            self.db.executemany(sql, pairs)
+        except DatabaseLockedError:
+            raise
+        except sqlite3.IntegrityError as e:
+            err_info = str(e)
+            if "UNIQUE constraint failed" in err_info:
+                raise DuplicateNoteTagError(f"Some note-tag associations already exist: {err_info}")
+            if "FOREIGN KEY constraint failed" in err_info:
+                # The batch was rolled back, find the missing notes and tags with one query each
+                missing_notes = self.__find_missing("notes", {note_id for note_id, _ in pairs})
+                if missing_notes:
+                    raise NoteNotFoundError(f"Notes with IDs {sorted(missing_notes)} do not exist")
+                missing_tags = self.__find_missing("tags", {tag_id for _, tag_id in pairs})
+                if missing_tags:
+                    raise TagNotFoundError(f"Tags with IDs {sorted(missing_tags)} do not exist")
+            raise DatabaseError(f"Failed to associate tags with notes: {err_info}")
+        except (DatabaseError, sqlite3.Error, Exception) as e:
+            raise DatabaseError(f"Failed to associate tags with notes: {str(e)}")
+
     def get_tags_for_note(self, note_id):
         """
         Retrieve all tags associated a note
@@ -96,8 +147,6 @@ class NoteTagModel:
         """
         if not isinstance(note_id, int) or note_id <= 0:
             raise ValidationError("Invalid note ID")
-        if not self.__is_note_exists(note_id):
-            raise NoteNotFoundError(f"Note with ID {note_id} does not exist")
         # Try to get the tags associated with the note
         try:
             sql = """
@@ -107,6 +156,9 @@ class NoteTagModel:
             WHERE note_tags.note_id = ?
             """
             results = self.db.fetchall(sql, [note_id])
+            # Only an empty result has to tell an untagged note from a missing one
+            if not results:
+                self.__raise_if_missing(note_id=note_id)
             return [result["tag_name"] for result in results]
         except sqlite3.Error as e:
             raise DatabaseError(f"Failed to get tags for note: {str(e)}")
@@ -122,21 +174,133 @@ class NoteTagModel:
         """
         if not isinstance(tag_id, int) or tag_id <= 0:
             raise ValidationError("Invalid tag ID")
-        if not self.__is_tag_exists(tag_id):
-            raise TagNotFoundError(f"Tag with ID {tag_id} does not exist")
         # Try to get the notes associated with the tag
         try:
-            sql = """
-            SELECT notes.id
-            FROM notes
-            JOIN note_tags ON notes.id = note_tags.note_id
-            WHERE note_tags.tag_id = ?
-            """
+            # The foreign key guarantees the notes exist, so the links alone are enough
+            sql = "SELECT note_id FROM note_tags WHERE tag_id = ?"
             results = self.db.fetchall(sql, [tag_id])
-            return [result["id"] for result in results]
+            # Only an empty result has to tell an unused tag from a missing one
+            if not results:
+                self.__raise_if_missing(tag_id=tag_id)
+            return [result["note_id"] for result in results]
         except sqlite3.Error as e:
             raise DatabaseError(f"Failed to get notes for tag: {str(e)}")
 
+    def get_tags_for_notes(self, note_ids):
+        """
+        Retrieve the tags of many notes with a single query
+        :param note_ids: iterable of note IDs
+        :raises ValidationError: if any note ID is invalid
+        :raises NoteNotFoundError: if any note does not exist
+        :raises DatabaseError: if database operation fails
+        :return: dictionary mapping every given note ID to the list of its tag names
+        """
+        note_ids = set(note_ids)
+        for note_id in note_ids:
+            if not isinstance(note_id, int) or note_id <= 0:
+                raise ValidationError("Invalid note ID")
+        tags = {note_id: [] for note_id in note_ids}
+        if not note_ids:
+            return tags
+        try:
+            sql = """
+            SELECT note_tags.note_id, tags.tag_name
+            FROM note_tags
+            JOIN tags ON tags.id = note_tags.tag_id
+            WHERE note_tags.note_id IN (SELECT value FROM json_each(?))
+            """
+            for note_id, tag_name in self.db.fetchall(sql, [json.dumps(list(note_ids))], row_format="tuple"):
+                tags[note_id].append(tag_name)
+            # Only the untagged notes have to be told apart from missing ones
+            missing = self.__find_missing("notes", {note_id for note_id, names in tags.items() if not names})
+        except sqlite3.Error as e:
+            raise DatabaseError(f"Failed to get tags for notes: {str(e)}")
+        if missing:
+            raise NoteNotFoundError(f"Notes with IDs {sorted(missing)} do not exist")
+        return tags
+
+    def get_notes_for_tags(self, tag_ids):
+        """
+        Retrieve the notes of many tags with a single query
+        :param tag_ids: iterable of tag IDs
+        :raises ValidationError: if any tag ID is invalid
+        :raises TagNotFoundError: if any tag does not exist
+        :raises DatabaseError: if database operation fails
+        :return: dictionary mapping every given tag ID to the list of its note ids
+        """
+        tag_ids = set(tag_ids)
+        for tag_id in tag_ids:
+            if not isinstance(tag_id, int) or tag_id <= 0:
+                raise ValidationError("Invalid tag ID")
+        notes = {tag_id: [] for tag_id in tag_ids}
+        if not tag_ids:
+            return notes
+        try:
+            sql = "SELECT tag_id, note_id FROM note_tags WHERE tag_id IN (SELECT value FROM json_each(?))"
+            for tag_id, note_id in self.db.fetchall(sql, [json.dumps(list(tag_ids))], row_format="tuple"):
+                notes[tag_id].append(note_id)
+            # Only the unused tags have to be told apart from missing ones
+            missing = self.__find_missing("tags", {tag_id for tag_id, note_ids in notes.items() if not note_ids})
+        except sqlite3.Error as e:
+            raise DatabaseError(f"Failed to get notes for tags: {str(e)}")
+        if missing:
+            raise TagNotFoundError(f"Tags with IDs {sorted(missing)} do not exist")
+        return notes
+
+    def set_tags_for_note(self, note_id, tag_names):
+        """
+        Replace the tags of a note in one transaction, creating the tags that do not exist yet
+        Only the difference to the current tags is written
+        :param note_id: ID of the note
+        :param tag_names: iterable of tag names the note should carry
+        :raises ValidationError: if note_id or any tag name is invalid
+        :raises NoteNotFoundError: if the note does not exist
+        :raises DatabaseError: if database operation fails
+        :return: dictionary with the number of tags created, links added and links removed
+        """
+        if not isinstance(note_id, int) or note_id <= 0:
+            raise ValidationError("Invalid note ID")
+        tag_names = set(tag_names)
+        if None in tag_names:
+            raise ValidationError("Tag name cannot be None")
+        names = json.dumps(list(tag_names))
+        try:
+            with self.db.transaction():
+                # Tags that already exist are skipped by the unique constraint on tag_name
+                created = self.db.execute(
+                    "INSERT OR IGNORE INTO tags (tag_name) SELECT value FROM json_each(?)", [names]
+                )
+                removed = self.db.execute(
+                    """
+                    DELETE FROM note_tags
+                    WHERE note_id = ?
+                    AND tag_id NOT IN (SELECT id FROM tags WHERE tag_name IN (SELECT value FROM json_each(?)))
+                    """,
+                    [note_id, names]
+                )
+                # Links that already exist are skipped by the primary key, a missing note fails the foreign key
+                added = self.db.execute(
+                    """
+                    INSERT OR IGNORE INTO note_tags (note_id, tag_id)
+                    SELECT ?, id FROM tags WHERE tag_name IN (SELECT value FROM json_each(?))
+                    """,
+                    [note_id, names]
+                )
+                # Nothing changed, either the tags were already set or the note does not exist
+                if not (created or removed or added):
+                    self.__raise_if_missing(note_id=note_id)
+        except DatabaseLockedError:
+            raise
+        except sqlite3.IntegrityError as e:
+            if "FOREIGN KEY constraint failed" in str(e):
+                raise NoteNotFoundError(f"Note with ID {note_id} does not exist")
+            raise DatabaseError(f"Failed to set tags for note: {str(e)}")
+        except NoteNotFoundError:
+            raise
+        except (DatabaseError, sqlite3.Error, Exception) as e:
+            raise DatabaseError(f"Failed to set tags for note: {str(e)}")
+        return {"created": created, "added": added, "removed": removed}
+
     def remove_tag_from_note(self, note_id, tag_id):
         """
         Remove a tag from a note by deleting an entry in the note_tags table
@@ -152,18 +316,17 @@ class NoteTagModel:
             raise ValidationError("Invalid note ID")
         if not isinstance(tag_id, int) or tag_id <= 0:
             raise ValidationError("Invalid tag ID")
-        # Check if the note and tag exist
-        if not self.__is_note_exists(note_id):
-            raise NoteNotFoundError(f"Note with ID {note_id} does not exist")
-        if not self.__is_tag_exists(tag_id):
-            raise TagNotFoundError(f"Tag with ID {tag_id} does not exist")
         # Try to remove the tag from the note
         try:
-            with self.db.transaction():
-                sql = "DELETE FROM note_tags WHERE note_id = ? AND tag_id = ?"
-                self.db.execute(sql, [note_id, tag_id])
+            sql = "DELETE FROM note_tags WHERE note_id = ? AND tag_id = ?"
+            deleted = self.db.execute(sql, [note_id, tag_id])
+        except DatabaseLockedError:
+            raise
         except (DatabaseError, sqlite3.Error, Exception) as e:
             raise DatabaseError(f"Failed to remove tag from note: {str(e)}")
+        # Nothing deleted, either the note was not tagged or the note or tag does not exist
+        if deleted == 0:
+            self.__raise_if_missing(note_id, tag_id)
 
     def remove_all_tags_for_note(self, note_id):
         """
@@ -176,15 +339,16 @@ class NoteTagModel:
         """
         if not isinstance(note_id, int) or note_id <= 0:
             raise ValidationError("Invalid note ID")
-        if not self.__is_note_exists(note_id):
-            raise NoteNotFoundError(f"Note with ID {note_id} does not exist")
         # Try to remove all tags associated with the note
         try:
-            with self.db.transaction():
-                sql = "DELETE FROM note_tags WHERE note_id = ?"
-                self.db.execute(sql, [note_id])
+            sql = "DELETE FROM note_tags WHERE note_id = ?"
+            deleted = self.db.execute(sql, [note_id])
+        except DatabaseLockedError:
+            raise
         except (DatabaseError, sqlite3.Error, Exception) as e:
             raise DatabaseError(f"Failed to remove all tags for note: {str(e)}")
+        if deleted == 0:
+            self.__raise_if_missing(note_id=note_id)
 
     def remove_all_notes_for_tag(self, tag_id):
         """
@@ -197,12 +361,13 @@ class NoteTagModel:
         """
         if not isinstance(tag_id, int) or tag_id <= 0:
             raise ValidationError("Invalid tag ID")
-        if not self.__is_tag_exists(tag_id):
-            raise TagNotFoundError(f"Tag with ID {tag_id} does not exist")
         # Try to remove all notes associated with the tag
         try:
-            with self.db.transaction():
-                sql = "DELETE FROM note_tags WHERE tag_id = ?"
-                self.db.execute(sql, [tag_id])
+            sql = "DELETE FROM note_tags WHERE tag_id = ?"
+            deleted = self.db.execute(sql, [tag_id])
+        except DatabaseLockedError:
+            raise
         except (DatabaseError, sqlite3.Error, Exception) as e:
-            raise DatabaseError(f"Failed to remove all notes for tag: {str(e)}")
\ No newline at end of file
+            raise DatabaseError(f"Failed to remove all notes for tag: {str(e)}")
+        if deleted == 0:
+            self.__raise_if_missing(tag_id=tag_id)
\ No newline at end of file
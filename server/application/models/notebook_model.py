@@ -1,6 +1,8 @@
 import sqlite3
+from server.database.records import NotebookRow
 from server.application.exceptions import (
     DatabaseError,
+    DatabaseLockedError,
     ValidationError,
     NotebookNotFoundError,
     DuplicateNotebookError
@@ -31,13 +33,14 @@ class NotebookModel:
             raise ValidationError("Notebook name cannot be None")
         # Try to create the notebook
         try:
-            with self.db.transaction():
-                sql = """
-                INSERT INTO notebooks (notebook_name, description)
-                VALUES (?, ?)
-                """
-                params = [notebook_name, description]
-                self.db.execute(sql, params)
+            sql = """
+            INSERT INTO notebooks (notebook_name, description)
+            VALUES (?, ?)
+            """
+            params = [notebook_name, description]
+            self.db.execute(sql, params)
+        except DatabaseLockedError:
+            raise
         except sqlite3.IntegrityError as e:
             if "UNIQUE constraint" in str(e):
                 raise DuplicateNotebookError(f"Note book with name {notebook_name} already exists: {str(e)}")
@@ -59,10 +62,12 @@ class NotebookModel:
         # Try to get the notebook's ID
         try:
             sql = "SELECT id FROM notebooks WHERE notebook_name = ?"
-            result = self.db.fetchone(sql, [notebook_name])
+            result = self.db.resolve_name(
+                "notebooks", notebook_name, lambda: self.db.fetchvalue(sql, [notebook_name])
+            )
             if result is None:
                 raise NotebookNotFoundError(f"Notebook with name {notebook_name} does not exist")
-            return result["id"]
+            return result
         except sqlite3.Error as e:
             raise DatabaseError(f"Failed to get notebook ID: {str(e)}")
 
@@ -81,7 +86,9 @@ class NotebookModel:
         # Try to get the notebook
         try:
             sql = "SELECT * FROM notebooks WHERE id = ?"
-            result =  self.db.fetchone(sql, [notebook_id])
+            result = self.db.cached(
+                "notebooks", notebook_id, lambda: self.db.fetchone(sql, [notebook_id], record=NotebookRow)
+            )
             if result is None:
                 raise NotebookNotFoundError(f"Notebook with ID {notebook_id} does not exist")
             return result
@@ -106,34 +113,36 @@ class NotebookModel:
             raise ValidationError("At least one update parameter must be provided")
         # Try to update the notebook
         try:
-            # Check whether the notebook exists
-            if not self.get_notebook(notebook_id):
-                raise NotebookNotFoundError(f"Notebook with ID {notebook_id} does not exist")
-            with self.db.transaction():
-                sql = "UPDATE notebooks SET"
-                updates = [] # Fields that need to be updated
-                params = [] # Parameters for the SQL query
-                # Add conditions for fields that need to be updated
-                if new_name:
-                    updates.append(" notebook_name = ?")
-                    params.append(new_name)
-                if new_description:
-                    updates.append(" description = ?")
-                    params.append(new_description)
-                # Set update time by CURRENT_TIMESTAMP
-                updates.append(" updated_at = CURRENT_TIMESTAMP")
-                # Join updates
-                sql += ", ".join(updates)
-                sql += " WHERE id = ?"
-                params.append(notebook_id) 
-                # Execute update
-                self.db.execute(sql, params)
+            sql = "UPDATE notebooks SET"
+            updates = [] # Fields that need to be updated
+            params = [] # Parameters for the SQL query
+            # Add conditions for fields that need to be updated
+            if new_name:
+                updates.append(" notebook_name = ?")
+                params.append(new_name)
+            if new_description:
+                updates.append(" description = ?")
+                params.append(new_description)
+            # Set update time by CURRENT_TIMESTAMP
+            updates.append(" updated_at = CURRENT_TIMESTAMP")
+            # Join updates
+            sql += ", ".join(updates)
+            sql += " WHERE id = ?"
+            params.append(notebook_id) 
+            # Execute update
+            updated = self.db.execute(sql, params)
+        except DatabaseLockedError:
+            raise
         except sqlite3.IntegrityError as e:
             if "UNIQUE constraint" in str(e):
                 raise DuplicateNotebookError(f"Notebook with name {new_name} already exists")
             raise DatabaseError(f"Failed to update notebook: {str(e)}")
         except (DatabaseError, sqlite3.Error, Exception) as e:
             raise DatabaseError(f"Failed to update notebook: {str(e)}")
+        self.db.invalidate_cached("notebooks", notebook_id)
+        # No row updated means the notebook does not exist
+        if updated == 0:
+            raise NotebookNotFoundError(f"Notebook with ID {notebook_id} does not exist")
 
     def delete_notebook(self, notebook_id):
         """
@@ -146,17 +155,86 @@ class NotebookModel:
         """
         if not isinstance(notebook_id, int) or notebook_id <= 0:
             raise ValidationError("Invalid notebook ID")
-        # Try to delete the notebook
+        # Try to delete the notebook, its notes and their tag links are removed by ON DELETE CASCADE
         try:
-            # Check whether the notebook exists
-            if not self.get_notebook(notebook_id):
-                raise NotebookNotFoundError(f"Notebook with ID {notebook_id} does not exist")
-            with self.db.transaction():
-                sql = "DELETE FROM notebooks WHERE id = ?"
-                # Execute delete
-                self.db.execute(sql, [notebook_id])
+            sql = "DELETE FROM notebooks WHERE id = ?"
+            # Execute delete
+            deleted = self.db.execute(sql, [notebook_id])
+        except DatabaseLockedError:
+            raise
         except (DatabaseError, sqlite3.Error, Exception) as e:
             raise DatabaseError(f"Failed to delete notebook: {str(e)}")
+        self.db.invalidate_cached("notebooks", notebook_id)
+        # The cascade removed the notebook's notes as well
+        self.db.invalidate_cached("notes")
+        # No row deleted means the notebook does not exist
+        if deleted == 0:
+            raise NotebookNotFoundError(f"Notebook with ID {notebook_id} does not exist")
+
+    def get_tree(self, include_notes=True):
+        """
+        Retrieve all notebooks together with their notes in a single query
+        :param include_notes: False to only read the counters of every notebook
+        :raises DatabaseError: if database operation fails
+        :return: list of notebooks in creation order, each a dictionary with id, notebook_name,
+                 description, updated_at, note_count, total_size and notes (id, title, updated_at
+                 and size of every note, ordered by title, empty if include_notes is False)
+        """
+        if not include_notes:
+            try:
+                # The counters are maintained by triggers in notebook_stats
+                sql = """
+                SELECT notebooks.id, notebooks.notebook_name, notebooks.description, notebooks.updated_at,
+                       coalesce(notebook_stats.note_count, 0), coalesce(notebook_stats.total_size, 0)
+                FROM notebooks
+                LEFT JOIN notebook_stats ON notebook_stats.notebook_id = notebooks.id
+                ORDER BY notebooks.id
+                """
+                rows = self.db.fetchall(sql, row_format="tuple")
+            except sqlite3.Error as e:
+                raise DatabaseError(f"Failed to get notebook tree: {str(e)}")
+            return [
+                {
+                    "id": notebook_id,
+                    "notebook_name": notebook_name,
+                    "description": description,
+                    "updated_at": updated_at,
+                    "note_count": note_count,
+                    "total_size": total_size,
+                    "notes": []
+                }
+                for notebook_id, notebook_name, description, updated_at, note_count, total_size in rows
+            ]
+        try:
+            # Notes come in the order of the (notebook_id, title) index, so no sorting is needed
+            sql = """
+            SELECT notebooks.id, notebooks.notebook_name, notebooks.description, notebooks.updated_at,
+                   notes.id, notes.title, notes.updated_at, notes.size
+            FROM notebooks
+            LEFT JOIN notes ON notes.notebook_id = notebooks.id
+            ORDER BY notebooks.id, notes.title
+            """
+            rows = self.db.fetchall(sql, row_format="tuple")
+        except sqlite3.Error as e:
+            raise DatabaseError(f"Failed to get notebook tree: {str(e)}")
+        tree = []
+        for notebook_id, notebook_name, description, updated_at, note_id, title, note_updated_at, size in rows:
+            if not tree or tree[-1]["id"] != notebook_id:
+                tree.append({
+                    "id": notebook_id,
+                    "notebook_name": notebook_name,
+                    "description": description,
+                    "updated_at": updated_at,
+                    "note_count": 0,
+                    "total_size": 0,
+                    "notes": []
+                })
+            # A notebook without notes is joined with a single row of NULLs
+            if note_id is not None:
+                tree[-1]["notes"].append({"id": note_id, "title": title, "updated_at": note_updated_at, "size": size})
+                tree[-1]["note_count"] += 1
+                tree[-1]["total_size"] += size
+        return tree
 
     def get_all_notebooks(self):
         """
@@ -166,6 +244,6 @@ class NotebookModel:
         """
         try:
             sql = "SELECT * FROM notebooks"
-            return self.db.fetchall(sql)
+            return self.db.fetchall(sql, record=NotebookRow)
         except sqlite3.Error as e:
             raise DatabaseError(f"Failed to get all notebooks: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,170 @@
+import sqlite3
+from server.application.exceptions import (
+    DatabaseError,
+    DatabaseLockedError,
+    ValidationError,
+    NotebookNotFoundError,
+    TagNotFoundError
+)
+
+# Counters computed from scratch, compared with the stored ones by check() and written by rebuild()
+NOTEBOOK_COUNTS_SQL = """
+SELECT notebooks.id AS id, count(notes.id) AS note_count, coalesce(sum(notes.size), 0) AS total_size
+FROM notebooks
+LEFT JOIN notes ON notes.notebook_id = notebooks.id
+GROUP BY notebooks.id
+"""
+TAG_COUNTS_SQL = """
+SELECT tags.id AS id, count(note_tags.note_id) AS note_count
+FROM tags
+LEFT JOIN note_tags ON note_tags.tag_id = tags.id
+GROUP BY tags.id
+"""
+
+class StatsModel:
+    def __init__(self, db):
+        """
+        Initialize the StatsModel with a connection to the database
+        The counters in notebook_stats and tag_stats are maintained by triggers
+        :param db: connection to the database
+        :raises ValidationError: if the database connection is invalid
+        """
+        if db is None:
+            raise ValidationError("Database connection cannot be None")
+        self.db = db
+
+    def get_notebook_stats(self, notebook_id):
+        """
+        Retrieve the counters of a notebook
+        :param notebook_id: ID of the notebook
+        :raises ValidationError: if the notebook ID is invalid
+        :raises NotebookNotFoundError: if the notebook does not exist
+        :raises DatabaseError: if database operation fails
+        :return: dictionary with note_count and total_size (bytes of all note files)
+        """
+        if not isinstance(notebook_id, int) or notebook_id <= 0:
+            raise ValidationError("Invalid notebook ID")
+        try:
+            sql = "SELECT note_count, total_size FROM notebook_stats WHERE notebook_id = ?"
+            row = self.db.fetchone(sql, [notebook_id], row_format="tuple")
+        except sqlite3.Error as e:
+            raise DatabaseError(f"Failed to get notebook stats: {str(e)}")
+        if row is None:
+            raise NotebookNotFoundError(f"Notebook with ID {notebook_id} does not exist")
+        return {"note_count": row[0], "total_size": row[1]}
+
+    def get_tag_stats(self, tag_id):
+        """
+        Retrieve the counters of a tag
+        :param tag_id: ID of the tag
+        :raises ValidationError: if the tag ID is invalid
+        :raises TagNotFoundError: if the tag does not exist
+        :raises DatabaseError: if database operation fails
+        :return: dictionary with note_count
+        """
+        if not isinstance(tag_id, int) or tag_id <= 0:
+            raise ValidationError("Invalid tag ID")
+        try:
+            sql = "SELECT note_count FROM tag_stats WHERE tag_id = ?"
+            note_count = self.db.fetchvalue(sql, [tag_id])
+        except sqlite3.Error as e:
+            raise DatabaseError(f"Failed to get tag stats: {str(e)}")
+        if note_count is None:
+            raise TagNotFoundError(f"Tag ID {tag_id} does not exist")
+        return {"note_count": note_count}
+
+    def get_all_tag_stats(self):
+        """
+        Retrieve the counters of all tags
+        :raises DatabaseError: if database operation fails
+        :return: dictionary mapping each tag name to its note_count
+        """
+        try:
+            sql = """
+            SELECT tags.tag_name, tag_stats.note_count
+            FROM tags
+            JOIN tag_stats ON tag_stats.tag_id = tags.id
+            """
+            return dict(self.db.fetchall(sql, row_format="tuple"))
+        except sqlite3.Error as e:
+            raise DatabaseError(f"Failed to get all tag stats: {str(e)}")
+
+    def update_sizes(self, sizes):
+        """
+        Set the sizes of many notes, the notebook counters follow through the triggers
+        :param sizes: dictionary mapping note IDs to their size in bytes
+        :raises DatabaseError: if database operation fails
+        :return: number of notes whose size changed
+        """
+        if not sizes:
+            return 0
+        try:
+            sql = "UPDATE notes SET size = ? WHERE id = ? AND size IS NOT ?"
+            changed = self.db.executemany(sql, [(size, note_id, size) for note_id, size in sizes.items()])
+        except DatabaseLockedError:
+            raise
+        except (DatabaseError, sqlite3.Error, Exception) as e:
+            raise DatabaseError(f"Failed to update note sizes: {str(e)}")
+        self.db.invalidate_cached("notes")
+        return changed
+
+    def check(self):
+        """
+        Compare the stored counters with counters computed from the notes and note-tag links
+        :raises DatabaseError: if database operation fails
+        :return: list of mismatches, each with table, id, stored and actual counters
+        """
+        try:
+            notebook_sql = f"""
+            SELECT actual.id, notebook_stats.note_count, notebook_stats.total_size, actual.note_count, actual.total_size
+            FROM ({NOTEBOOK_COUNTS_SQL}) AS actual
+            LEFT JOIN notebook_stats ON notebook_stats.notebook_id = actual.id
+            WHERE notebook_stats.note_count IS NOT actual.note_count
+               OR notebook_stats.total_size IS NOT actual.total_size
+            """
+            tag_sql = f"""
+            SELECT actual.id, tag_stats.note_count, actual.note_count
+            FROM ({TAG_COUNTS_SQL}) AS actual
+            LEFT JOIN tag_stats ON tag_stats.tag_id = actual.id
+            WHERE tag_stats.note_count IS NOT actual.note_count
+            """
+            notebook_rows = self.db.fetchall(notebook_sql, row_format="tuple")
+            tag_rows = self.db.fetchall(tag_sql, row_format="tuple")
+        except sqlite3.Error as e:
+            raise DatabaseError(f"Failed to check stats: {str(e)}")
+        mismatches = [
+            {
+                "table": "notebook_stats",
+                "id": notebook_id,
+                "stored": {"note_count": stored_count, "total_size": stored_size},
+                "actual": {"note_count": note_count, "total_size": total_size}
+            }
+            for notebook_id, stored_count, stored_size, note_count, total_size in notebook_rows
+        ]
+        mismatches.extend(
+            {
+                "table": "tag_stats",
+                "id": tag_id,
+                "stored": {"note_count": stored_count},
+                "actual": {"note_count": note_count}
+            }
+            for tag_id, stored_count, note_count in tag_rows
+        )
+        return mismatches
+
+    def rebuild(self):
+        """
+        Recompute all counters from the notes and note-tag links
+        :raises DatabaseError: if database operation fails
+        :return: NULL
+        """
+        try:
+            with self.db.transaction():
+                self.db.execute("DELETE FROM notebook_stats")
+                self.db.execute(f"INSERT INTO notebook_stats (notebook_id, note_count, total_size) {NOTEBOOK_COUNTS_SQL}")
+                self.db.execute("DELETE FROM tag_stats")
+                self.db.execute(f"INSERT INTO tag_stats (tag_id, note_count) {TAG_COUNTS_SQL}")
+        except DatabaseLockedError:
+            raise
+        except (DatabaseError, sqlite3.Error, Exception) as e:
+            raise DatabaseError(f"Failed to rebuild stats: {str(e)}")
@@ -1,7 +1,10 @@
+import json
 import sqlite3
+from server.database.records import TagRow
 from server.application.exceptions import (
     ValidationError,
     DatabaseError,
+    DatabaseLockedError,
     TagNotFoundError,
     DuplicateTagError
 )
@@ -30,9 +33,10 @@ class TagModel:
             raise ValidationError("Tag name cannot be None")
         # Try to create the tag
         try:
-            with self.db.transaction():
-                sql = "INSERT INTO tags (tag_name) VALUES (?)"
-                self.db.execute(sql, [tag_name])
+            sql = "INSERT INTO tags (tag_name) VALUES (?)"
+            self.db.execute(sql, [tag_name])
+        except DatabaseLockedError:
+            raise
         except sqlite3.IntegrityError as e:
             if "UNIQUE constraint" in str(e):
                 raise DuplicateTagError(f"Tag name {tag_name} already exists")
@@ -40,6 +44,35 @@ class TagModel:
         except (DatabaseError, sqlite3.Error, Exception) as e:
             raise DatabaseError(f"Failed to create tag: {str(e)}")
 
+    def create_tags(self, tag_names):
+        """
+        Create many tags in one transaction
+        :param tag_names: iterable of tag names
+        :raises ValidationError: if any tag name is None
+        :raises DuplicateTagError: if a tag already exists or appears twice in the batch
+        :raises DatabaseError: if database operation fails
+        :return: NULL
+        """
+        tag_names = list(tag_names)
+        if not tag_names:
+            return
+        if any(tag_name is None for tag_name in tag_names):
+            raise ValidationError("Tag name cannot be None")
+        if len(set(tag_names)) != len(tag_names):
+            raise DuplicateTagError("The same tag appears more than once in the batch")
+        # Try to create the tags
+        try:
+            sql = "INSERT INTO tags (tag_name) VALUES (?)"
+            self.db.executemany(sql, [[tag_name] for tag_name in tag_names])
+        except DatabaseLockedError:
+            raise
+        except sqlite3.IntegrityError as e:
+            if "UNIQUE constraint" in str(e):
+                raise DuplicateTagError(f"Some tags already exist: {str(e)}")
+            raise DatabaseError(f"Failed to create tags: {str(e)}")
+        except (DatabaseError, sqlite3.Error, Exception) as e:
+            raise DatabaseError(f"Failed to create tags: {str(e)}")
+
     def get_tag_id(self, tag_name):
         """
         Retrieve a tag's ID by its name
@@ -54,13 +87,37 @@ class TagModel:
         # Try to get the tag's ID
         try:
             sql = "SELECT id FROM tags WHERE tag_name = ?"
-            result = self.db.fetchone(sql, [tag_name])
+            result = self.db.resolve_name("tags", tag_name, lambda: self.db.fetchvalue(sql, [tag_name]))
             if result is None:
                 raise TagNotFoundError(f"Tag name {tag_name} does not exist")
-            return result["id"]
+            return result
         except sqlite3.Error as e:
             raise DatabaseError(f"Failed to get tag ID: {str(e)}")
 
+    def get_tag_ids(self, tag_names):
+        """
+        Retrieve many tags' IDs by their names with a single query
+        :param tag_names: iterable of tag names
+        :raises ValidationError: if any tag name is None
+        :raises TagNotFoundError: if any tag does not exist
+        :raises DatabaseError: if database operation fails
+        :return: dictionary mapping each tag name to its ID
+        """
+        tag_names = set(tag_names)
+        if None in tag_names:
+            raise ValidationError("Tag name cannot be None")
+        if not tag_names:
+            return {}
+        try:
+            sql = "SELECT tag_name, id FROM tags WHERE tag_name IN (SELECT value FROM json_each(?))"
+            tag_ids = dict(self.db.fetchall(sql, [json.dumps(list(tag_names))], row_format="tuple"))
+        except sqlite3.Error as e:
+            raise DatabaseError(f"Failed to get tag IDs: {str(e)}")
+        missing = tag_names - tag_ids.keys()
+        if missing:
+            raise TagNotFoundError(f"Tag names {sorted(missing)} do not exist")
+        return tag_ids
+
     # Use get_tag_id() before using following methods
     def get_tag(self, tag_id):
         """
@@ -76,7 +133,7 @@ class TagModel:
         # Try to get the tag
         try:
             sql = "SELECT * FROM tags WHERE id = ?"
-            result = self.db.fetchone(sql, [tag_id])
+            result = self.db.cached("tags", tag_id, lambda: self.db.fetchone(sql, [tag_id], record=TagRow))
             if result is None:
                 raise TagNotFoundError(f"Tag ID {tag_id} does not exist")
             return result
@@ -100,20 +157,22 @@ class TagModel:
             raise ValidationError("New tag name must be provided to update the tag")
         # Try to update the tag
         try:
-            # Check whether the tag exists
-            if not self.get_tag(tag_id):
-                raise TagNotFoundError(f"Tag ID {tag_id} does not exist")
-            with self.db.transaction():
-                sql = "UPDATE tags SET tag_name = ? WHERE id = ?"
-                params = [new_name, tag_id]
-                # Execute update
-                self.db.execute(sql, params)
+            sql = "UPDATE tags SET tag_name = ? WHERE id = ?"
+            params = [new_name, tag_id]
+            # Execute update
+            updated = self.db.execute(sql, params)
+        except DatabaseLockedError:
+            raise
         except sqlite3.IntegrityError as e:
             if "UNIQUE constraint" in str(e):
                 raise DuplicateTagError(f"Tag name {new_name} already exists")
             raise DatabaseError(f"Failed to update tag: {str(e)}")
         except (DatabaseError, sqlite3.Error, Exception) as e:
             raise DatabaseError(f"Failed to update tag: {str(e)}")
+        self.db.invalidate_cached("tags", tag_id)
+        # No row updated means the tag does not exist
+        if updated == 0:
+            raise TagNotFoundError(f"Tag ID {tag_id} does not exist")
 
     def delete_tag(self, tag_id):
         """
@@ -128,15 +187,17 @@ class TagModel:
             raise ValidationError("Invalid tag ID")
         # Try to delete the tag
         try:
-            # Check whether the tag exists
-            if not self.get_tag(tag_id):
-                raise TagNotFoundError(f"Tag ID {tag_id} does not exist")
-            with self.db.transaction():
-                sql = "DELETE FROM tags WHERE id = ?"
-                # Execute delete
-                self.db.execute(sql, [tag_id])
+            sql = "DELETE FROM tags WHERE id = ?"
+            # Execute delete
+            deleted = self.db.execute(sql, [tag_id])
+        except DatabaseLockedError:
+            raise
         except (DatabaseError, sqlite3.Error, Exception) as e:
             raise DatabaseError(f"Failed to delete tag: {str(e)}")
+        self.db.invalidate_cached("tags", tag_id)
+        # No row deleted means the tag does not exist
+        if deleted == 0:
+            raise TagNotFoundError(f"Tag ID {tag_id} does not exist")
 
     def get_all_tags(self):
         """
@@ -146,6 +207,19 @@ class TagModel:
         """
         try:
             sql = "SELECT * FROM tags"
-            return self.db.fetchall(sql)
+            return self.db.fetchall(sql, record=TagRow)
+        except sqlite3.Error as e:
+            raise DatabaseError(f"Failed to get all tags: {str(e)}")
+
+    def iter_all_tags(self, batch_size=500):
+        """
+        Iterate over all tags without loading them into memory at once
+        :param batch_size: number of rows read from the database per round trip
+        :raises DatabaseError: if database operation fails
+        :return: generator of tags (dictionaries)
+        """
+        try:
+            sql = "SELECT * FROM tags"
+            yield from self.db.iterfetch(sql, batch_size=batch_size, record=TagRow)
         except sqlite3.Error as e:
-            raise DatabaseError(f"Failed to get all tags: {str(e)}")
\ No newline at end of file
+            raise DatabaseError(f"Failed to iterate over all tags: {str(e)}")
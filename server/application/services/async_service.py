@@ -0,0 +1,131 @@
+import asyncio
+import functools
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+from server.application.services.notebook_service import NotebookService
+from server.application.services.note_service import NoteService
+from server.application.services.note_tag_service import NoteTagService
+from server.application.services.tag_service import TagService
+
+class AsyncServiceProxy:
+    def __init__(self, service, executor, chunk_size=100):
+        """
+        Expose the public methods of a service as coroutines running on an executor
+        Generator methods (e.g. iter_all_notes) become async generators
+        :param service: synchronous service
+        :param executor: executor the service methods run on
+        :param chunk_size: number of items an async generator pulls per executor call
+        """
+        self.__service = service
+        self.__executor = executor
+        self.__chunk_size = chunk_size
+        self.__methods = {}
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        method = self.__methods.get(name)
+        if method is None:
+            attribute = getattr(self.__service, name)
+            if not callable(attribute):
+                return attribute
+            if inspect.isgeneratorfunction(attribute):
+                method = self.__wrap_generator(attribute)
+            else:
+                method = self.__wrap(attribute)
+            self.__methods[name] = method
+        return method
+
+    def __wrap(self, function):
+        """
+        Wrap a service method into a coroutine function
+        :param function: bound service method
+        :return: coroutine function
+        """
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.__executor, functools.partial(function, *args, **kwargs))
+        return wrapper
+
+    def __wrap_generator(self, function):
+        """
+        Wrap a service generator method into an async generator function
+        :param function: bound service generator method
+        :return: async generator function
+        """
+        chunk_size = self.__chunk_size
+
+        def next_chunk(generator):
+            chunk = []
+            for item in generator:
+                chunk.append(item)
+                if len(chunk) >= chunk_size:
+                    break
+            return chunk
+
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            generator = function(*args, **kwargs)
+            try:
+                while True:
+                    chunk = await loop.run_in_executor(self.__executor, next_chunk, generator)
+                    if not chunk:
+                        break
+                    for item in chunk:
+                        yield item
+            finally:
+                # Release the connection held by an unfinished generator on a worker thread
+                await loop.run_in_executor(self.__executor, generator.close)
+        return wrapper
+
+class AsyncKnowgent:
+    def __init__(self, db, max_workers=None):
+        """
+        Initialize the asyncio facade over the services
+        Every service method runs on a dedicated thread pool, each worker uses its own
+        connection checked out of the database pool, so awaiting callers never block the event loop
+        :param db: connection to the database
+        :param max_workers: number of worker threads (size of the connection pool if None)
+        """
+        self.__db = db
+        if max_workers is None:
+            max_workers = db.get_pool_stats()["size"]
+        self.__executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="knowgent-async")
+        # Initialize the services and inject the dependencies as the GUI does
+        self.__notebook_service = NotebookService(db)
+        self.__note_service = NoteService(db)
+        self.__note_tag_service = NoteTagService(db)
+        self.__tag_service = TagService(db)
+        self.__note_service.notebook_service = self.__notebook_service
+        self.__note_tag_service.note_service = self.__note_service
+        self.__note_tag_service.tag_service = self.__tag_service
+        self.notebooks = AsyncServiceProxy(self.__notebook_service, self.__executor)
+        self.notes = AsyncServiceProxy(self.__note_service, self.__executor)
+        self.note_tags = AsyncServiceProxy(self.__note_tag_service, self.__executor)
+        self.tags = AsyncServiceProxy(self.__tag_service, self.__executor)
+
+    async def run(self, function, *args, **kwargs):
+        """
+        Run any blocking callable (e.g. a transaction spanning several services) on the executor
+        :param function: callable to run
+        :return: result of the callable
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.__executor, functools.partial(function, *args, **kwargs))
+
+    def close(self, wait=True):
+        """
+        Shut down the executor
+        :param wait: wait for the running operations to finish
+        :return: None
+        """
+        self.__executor.shutdown(wait=wait)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.close)
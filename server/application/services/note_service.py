@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 from server.application.models.note_model import NoteModel
 from server.application.exceptions import (
@@ -47,12 +48,11 @@ class NoteService:
         :return: True if the note is created successfully, False otherwise
         """
         try:
-            # Try to get the notebook
+            # Try to get the notebook's ID
             try:
-                notebook = self.notebook_service.get_notebook(notebook_name)
+                notebook_id = self.notebook_service.get_notebook_id(notebook_name)
             except NotebookError as e:
                 raise e
-            notebook_id = notebook["id"]
             # Create note file path
             file_path = Path(f"{self.__base_path}/{notebook_name}/{title}.md")
             # Try to create the note
@@ -99,10 +99,9 @@ class NoteService:
         try:
             # Try to get notebook_id
             try:
-                notebook = self.notebook_service.get_notebook(notebook_name)
+                notebook_id = self.notebook_service.get_notebook_id(notebook_name)
             except NotebookError as e:
                 raise e
-            notebook_id = notebook["id"]
             note_id = self.__note_model.get_note_id(title, notebook_id)
             return self.__note_model.get_note(note_id)
         except (ValidationError, NoteNotFoundError, NotebookError, DatabaseError) as e:
@@ -219,6 +218,93 @@ class NoteService:
         except (NoteError, FileSystemError, Exception) as e:
             raise NoteError(f"Failed to get the content of note {title} in notebook {notebook_name}: {str(e)}")
     
+    def open_note(self, title, notebook_name):
+        """
+        Open a note: its details, tags and content in one database query and one file read
+        :param title: title of the note
+        :param notebook_name: name of the notebook which the note belongs to
+        :raises NoteError: if the note cannot be opened
+        :return: dictionary with id, title, notebook_name, created_at, updated_at, tags,
+                 content and size (bytes of the note file)
+        """
+        try:
+            # Try to get notebook_id
+            try:
+                notebook_id = self.notebook_service.get_notebook_id(notebook_name)
+            except NotebookError as e:
+                raise e
+            note = self.__note_model.get_note_with_tags(title, notebook_id)
+            file_path = Path(f"{self.__base_path}/{notebook_name}/{title}.md")
+            # Try to read the note file, with the platform encoding first like get_note_content
+            try:
+                with open(file_path, "r") as file:
+                    content = file.read()
+                    size = os.fstat(file.fileno()).st_size
+            except FileNotFoundError:
+                raise FileSystemError(f"File of note {title} in notebook {notebook_name} does not exist: {file_path}")
+            except UnicodeDecodeError:
+                with open(file_path, "r", encoding="utf-8") as file:
+                    content = file.read()
+                    size = os.fstat(file.fileno()).st_size
+            note["notebook_name"] = notebook_name
+            note["content"] = content
+            note["size"] = size
+            return note
+        except (
+            NotebookError,
+            ValidationError,
+            NoteNotFoundError,
+            NotebookNotFoundError,
+            DatabaseError,
+            FileSystemError,
+            Exception
+        ) as e:
+            raise NoteError(f"Failed to open note {title} in notebook {notebook_name}: {str(e)}")
+
+    def save_note_content(self, title, notebook_name, content):
+        """
+        Save the content of a note and record the new size of its file
+        :param title: title of the note
+        :param notebook_name: name of the notebook which the note belongs to
+        :param content: new content, text or bytes
+        :raises NoteError: if saving fails
+        :return: size of the note file in bytes
+        """
+        try:
+            # Try to get notebook_id
+            try:
+                notebook_id = self.notebook_service.get_notebook_id(notebook_name)
+            except NotebookError as e:
+                raise e
+            note_id = self.__note_model.get_note_id(title, notebook_id)
+            file_path = Path(f"{self.__base_path}/{notebook_name}/{title}.md")
+            # Try to write the note file, with the platform encoding first like the editor did
+            try:
+                if isinstance(content, bytes):
+                    file_path.write_bytes(content)
+                else:
+                    try:
+                        with open(file_path, "w") as file:
+                            file.write(content)
+                    except UnicodeEncodeError:
+                        with open(file_path, "w", encoding="utf-8") as file:
+                            file.write(content)
+                size = file_path.stat().st_size
+            except OSError as e:
+                raise FileSystemError(f"Failed to write the file of note {title} in notebook {notebook_name}: {str(e)}")
+            self.__note_model.set_note_size(note_id, size)
+            return size
+        except (
+            NotebookError,
+            ValidationError,
+            NoteNotFoundError,
+            NotebookNotFoundError,
+            DatabaseError,
+            FileSystemError,
+            Exception
+        ) as e:
+            raise NoteError(f"Failed to save note {title} in notebook {notebook_name}: {str(e)}")
+
     def update_note(self, title, notebook_name, new_title = None, new_notebook_name = None):
         """
         Update a note's details
@@ -248,10 +334,9 @@ class NoteService:
             if new_notebook_name:
                 # Check whether new notebook exists
                 try:
-                    new_notebook = self.notebook_service.get_notebook(new_notebook_name)
+                    new_notebook_id = self.notebook_service.get_notebook_id(new_notebook_name)
                 except NotebookError as e:
                     raise e
-                new_notebook_id = new_notebook["id"]
                 if new_title and not new_notebook_name: # Only rename the note
                     new_file_path = Path(f"{self.__base_path}/{notebook_name}/{new_title}.md")
                 elif not new_title and new_notebook_name: # Transfer to new notebook with same title
@@ -376,6 +461,48 @@ class NoteService:
         except (DatabaseError, Exception) as e:
             raise NoteError(f"Failed to get all notes: {str(e)}")
 
+    def iter_all_notes(self, batch_size=500):
+        """
+        Iterate over all notes, reading them from the database in batches
+        :param batch_size: number of notes read per round trip
+        :raises NoteError: if retrieval fails
+        :return: generator of notes
+        """
+        try:
+            yield from self.__note_model.iter_all_notes(batch_size)
+        except (DatabaseError, Exception) as e:
+            raise NoteError(f"Failed to iterate over all notes: {str(e)}")
+
+    def get_notes_page(self, notebook_name=None, sort="title", cursor=None, limit=100, descending=False):
+        """
+        Get one page of notes in a stable order
+        :param notebook_name: name of the notebook to list, None for all notes
+        :param sort: "title", "created_at" or "updated_at"
+        :param cursor: next_cursor of the previous page, None for the first page
+        :param limit: maximum number of notes in the page
+        :param descending: True to list the notes in descending order
+        :raises NoteError: if retrieval fails
+        :return: dictionary with the notes of the page and the next_cursor (None after the last page)
+        """
+        try:
+            notebook_id = None
+            if notebook_name is not None:
+                # Try to get notebook id
+                try:
+                    notebook_id = self.notebook_service.get_notebook_id(notebook_name)
+                except NotebookError as e:
+                    raise e
+            notes, next_cursor = self.__note_model.get_notes_page(notebook_id, sort, cursor, limit, descending)
+            return {"notes": notes, "next_cursor": next_cursor}
+        except (
+            NotebookError,
+            ValidationError,
+            NotebookNotFoundError,
+            DatabaseError,
+            Exception
+        ) as e:
+            raise NoteError(f"Failed to get page of notes: {str(e)}")
+
     def get_all_notes_in_notebook(self, notebook_name):
         """
         Get all notes in a notebook
@@ -386,10 +513,9 @@ class NoteService:
         try:
             # Try to get notebook id
             try:
-                notebook = self.notebook_service.get_notebook(notebook_name)
+                notebook_id = self.notebook_service.get_notebook_id(notebook_name)
             except NotebookError as e:
                 raise e
-            notebook_id = notebook["id"]
             return self.__note_model.get_all_notes_in_notebook(notebook_id)
         except (
             NotebookError,
@@ -1,11 +1,14 @@
 from server.application.models.note_tag_model import NoteTagModel
 from server.application.models.note_model import NoteModel
+from server.application.models.tag_model import TagModel
 from server.application.exceptions import (
     ValidationError,
     DatabaseError,
     NoteNotFoundError,
+    NotebookNotFoundError,
     TagNotFoundError,
     DuplicateNoteTagError,
+    NotebookError,
     NoteError,
     TagError,
     NoteTagError
@@ -23,6 +26,7 @@ class NoteTagService:
             self.__note_service = None
             self.__tag_service = None
             self.__note_model = NoteModel(db)
+            self.__tag_model = TagModel(db)
         except (ValidationError, NoteError, TagError) as e:
             raise NoteTagError(f"Failed to initialize NoteTagService: {str(e)}")
         except Exception as e:
@@ -67,10 +71,9 @@ class NoteTagService:
             note_id = note["id"]
             # Try to get the tag
             try:
-                tag = self.tag_service.get_tag(tag_name)
+                tag_id = self.tag_service.get_tag_id(tag_name)
             except TagError as e:
                 raise e
-            tag_id = tag["id"]
             # Try to add the tag to the note
             self.__note_tag_model.add_tag_to_note(note_id, tag_id)
             return True
@@ -119,16 +122,83 @@ class NoteTagService:
         try:
             # Try to get the tag
             try:
-                tag = self.tag_service.get_tag(tag_name)
+                tag_id = self.tag_service.get_tag_id(tag_name)
             except TagError as e:
                 raise e
-            tag_id = tag["id"]
             note_ids =  self.__note_tag_model.get_notes_for_tag(tag_id)
-            notes = [self.__note_model.get_note(note_id) for note_id in note_ids]
+            # Fetch all notes with one query instead of one per note
+            notes = self.__note_model.get_notes_by_ids(note_ids)
             return notes
         except (TagError, ValidationError, TagNotFoundError, DatabaseError, Exception) as e:
             raise NoteTagError(f"Failed to get notes for tag {tag_name}: {str(e)}")
 
+    def get_tags_for_notes(self, notes):
+        """
+        Get the tags of many notes at once
+        :param notes: notes as returned by NoteService (e.g. get_all_notes_in_notebook)
+        :raises NoteTagError: if retrieval fails
+        :return: dictionary mapping each note's ID to the list of its tag names
+        """
+        try:
+            return self.__note_tag_model.get_tags_for_notes(note["id"] for note in notes)
+        except (ValidationError, NoteNotFoundError, DatabaseError, Exception) as e:
+            raise NoteTagError(f"Failed to get tags for notes: {str(e)}")
+
+    def get_notes_for_tags(self, tag_names):
+        """
+        Get the notes of many tags at once
+        :param tag_names: names of the tags
+        :raises NoteTagError: if retrieval fails
+        :return: dictionary mapping each tag name to the list of its notes
+        """
+        try:
+            tag_ids = self.__tag_model.get_tag_ids(tag_names)
+            note_ids = self.__note_tag_model.get_notes_for_tags(tag_ids.values())
+            # Notes shared by several tags are fetched once
+            notes = {
+                note["id"]: note
+                for note in self.__note_model.get_notes_by_ids(
+                    {note_id for ids in note_ids.values() for note_id in ids}
+                )
+            }
+            return {
+                tag_name: [notes[note_id] for note_id in note_ids[tag_id]]
+                for tag_name, tag_id in tag_ids.items()
+            }
+        except (ValidationError, TagNotFoundError, NoteNotFoundError, DatabaseError, Exception) as e:
+            raise NoteTagError(f"Failed to get notes for tags: {str(e)}")
+
+    def set_tags_for_note(self, title, notebook_name, tag_names):
+        """
+        Set the tags of a note, creating missing tags and removing the ones not listed
+        All changes are committed together
+        :param title: title of the note
+        :param notebook_name: name of the notebook which the note belongs to
+        :param tag_names: names of all tags the note should carry
+        :raises NoteTagError: if setting the tags fails
+        :return: dictionary with the number of tags created, links added and links removed
+        """
+        try:
+            # Try to get the note's ID
+            try:
+                notebook_id = self.note_service.notebook_service.get_notebook_id(notebook_name)
+            except (NoteError, NotebookError) as e:
+                raise e
+            note_id = self.__note_model.get_note_id(title, notebook_id)
+            return self.__note_tag_model.set_tags_for_note(note_id, tag_names)
+        except (
+            NoteError,
+            NotebookError,
+            ValidationError,
+            NoteNotFoundError,
+            NotebookNotFoundError,
+            DatabaseError,
+            Exception
+        ) as e:
+            raise NoteTagError(
+                f"Failed to set tags for note {title} in notebook {notebook_name}: {str(e)}"
+            )
+
     def remove_tag_from_note(self, title, notebook_name, tag_name):
         """
         Remove a tag from a note
@@ -147,10 +217,9 @@ class NoteTagService:
             note_id = note["id"]
             # Try to get the tag
             try:
-                tag = self.tag_service.get_tag(tag_name)
+                tag_id = self.tag_service.get_tag_id(tag_name)
             except TagError as e:
                 raise e
-            tag_id = tag["id"]
             # Remove the tag from the note
             self.__note_tag_model.remove_tag_from_note(note_id, tag_id)
             return True
@@ -206,10 +275,9 @@ class NoteTagService:
         try:
             # Try to get the tag
             try:
-                tag = self.tag_service.get_tag(tag_name)
+                tag_id = self.tag_service.get_tag_id(tag_name)
             except TagError as e:
                 raise e
-            tag_id = tag["id"]
             # Remove all notes associated with the tag
             self.__note_tag_model.remove_all_notes_for_tag(tag_id)
             return True
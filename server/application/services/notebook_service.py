@@ -1,6 +1,6 @@
+import shutil
 from pathlib import Path
 from server.application.models.notebook_model import NotebookModel
-from server.application.models.note_model import NoteModel
 from server.application.exceptions import (
     ValidationError,
     DatabaseError,
@@ -20,7 +20,6 @@ class NotebookService:
         """
         try:
             self.__notebook_model = NotebookModel(db)
-            self.__note_model = NoteModel(db)
             self.__base_path = self.__notebook_model.db.get_base_path()
             # self.__note_service = None
         except ValidationError as e:
@@ -85,6 +84,18 @@ class NotebookService:
         except (ValidationError, NotebookNotFoundError, DatabaseError, Exception) as e:
             raise NotebookError(f"Failed to get notebook {notebook_name}: {str(e)}")
         
+    def get_notebook_id(self, notebook_name):
+        """
+        Get the ID of a notebook by its name, resolved through the name registry
+        :param notebook_name: name of the notebook
+        :raises NotebookError: if the notebook does not exist or retrieval fails
+        :return: ID of the notebook
+        """
+        try:
+            return self.__notebook_model.get_notebook_id(notebook_name)
+        except (ValidationError, NotebookNotFoundError, DatabaseError, Exception) as e:
+            raise NotebookError(f"Failed to get notebook {notebook_name}: {str(e)}")
+
     def update_notebook(self, notebook_name, new_name = None, new_description = None):
         """
         Update a notebook's details
@@ -152,9 +163,8 @@ class NotebookService:
         try:
             notebook_id = self.__notebook_model.get_notebook_id(notebook_name)
             notebook_path = Path(self.__base_path) / notebook_name
-            # Delete all related notes in database
-            self.__note_model.delete_all_notes_in_notebook(notebook_id)
-            # Delete the notebook from the database
+            # Delete the notebook from the database, its notes and their tag links are removed
+            # by ON DELETE CASCADE in the same statement
             self.__notebook_model.delete_notebook(notebook_id)
             # Delete the notebook directory (delete all notes belong to the notebook at the same time)
             if notebook_path.exists():
@@ -167,6 +177,18 @@ class NotebookService:
                 Exception) as e:
             raise NotebookError(f"Failed to delete notebook {notebook_name}: {str(e)}")
         
+    def get_tree(self, include_notes=True):
+        """
+        Get the whole notebook and note hierarchy with one query
+        :param include_notes: False to only read the counters of every notebook
+        :raises NotebookError: if retrieval fails
+        :return: list of notebooks, each with its note_count, total_size and notes (id, title, updated_at, size)
+        """
+        try:
+            return self.__notebook_model.get_tree(include_notes)
+        except (DatabaseError, Exception) as e:
+            raise NotebookError(f"Failed to get notebook tree: {str(e)}")
+
     def get_all_notebooks(self):
         """
         Get all notebooks from the database
@@ -187,11 +209,6 @@ class NotebookService:
         """
         try:
             if path.exists():
-                for item in path.iterdir():
-                    if item.is_file():
-                        item.unlink()
-                    elif item.is_dir():
-                        self._remove_dir(item)
-                path.rmdir()
+                shutil.rmtree(path)
         except Exception as e:
             raise FileSystemError(f"Failed to remove directory {path}: {str(e)}")
\ No newline at end of file
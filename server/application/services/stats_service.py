@@ -0,0 +1,124 @@
+"""
+Note counters of notebooks and tags, and their consistency check
+
+Usage: python -m server.application.services.stats_service <base_path> [--repair] [--scan-files]
+"""
+import os
+import sys
+from pathlib import Path
+from server.application.models.stats_model import StatsModel
+from server.application.models.notebook_model import NotebookModel
+from server.application.models.tag_model import TagModel
+from server.application.exceptions import (
+    ValidationError,
+    DatabaseError,
+    NotebookNotFoundError,
+    TagNotFoundError,
+    StatsError
+)
+
+class StatsService:
+    def __init__(self, db):
+        """
+        Initialize the StatsService with a connection to the database
+        :param db: connection to the database
+        :raises StatsError: if service initialization fails
+        """
+        try:
+            self.__stats_model = StatsModel(db)
+            self.__notebook_model = NotebookModel(db)
+            self.__tag_model = TagModel(db)
+            self.__base_path = db.get_base_path()
+        except ValidationError as e:
+            raise StatsError(f"Failed to initialize StatsService: {str(e)}")
+        except Exception as e:
+            raise StatsError(f"Unexpected error during StatsService initialization: {str(e)}")
+
+    def get_notebook_stats(self, notebook_name):
+        """
+        Get the number of notes and the total size of a notebook
+        :param notebook_name: name of the notebook
+        :raises StatsError: if retrieval fails
+        :return: dictionary with note_count and total_size (bytes)
+        """
+        try:
+            notebook_id = self.__notebook_model.get_notebook_id(notebook_name)
+            return self.__stats_model.get_notebook_stats(notebook_id)
+        except (ValidationError, NotebookNotFoundError, DatabaseError, Exception) as e:
+            raise StatsError(f"Failed to get stats of notebook {notebook_name}: {str(e)}")
+
+    def get_tag_stats(self, tag_name):
+        """
+        Get the number of notes carrying a tag
+        :param tag_name: name of the tag
+        :raises StatsError: if retrieval fails
+        :return: dictionary with note_count
+        """
+        try:
+            tag_id = self.__tag_model.get_tag_id(tag_name)
+            return self.__stats_model.get_tag_stats(tag_id)
+        except (ValidationError, TagNotFoundError, DatabaseError, Exception) as e:
+            raise StatsError(f"Failed to get stats of tag {tag_name}: {str(e)}")
+
+    def get_all_tag_stats(self):
+        """
+        Get the number of notes of every tag
+        :raises StatsError: if retrieval fails
+        :return: dictionary mapping each tag name to its note count
+        """
+        try:
+            return self.__stats_model.get_all_tag_stats()
+        except (DatabaseError, Exception) as e:
+            raise StatsError(f"Failed to get stats of all tags: {str(e)}")
+
+    def check_counters(self, repair=False, scan_files=False):
+        """
+        Check the counters against the notes and note-tag links, and optionally rebuild them
+        :param repair: rebuild all counters if any of them is wrong
+        :param scan_files: first compare the recorded note sizes with the files on disk and fix them
+        :raises StatsError: if the check fails
+        :return: dictionary with sizes_fixed, mismatches found and whether the counters were repaired
+        """
+        try:
+            sizes_fixed = 0
+            if scan_files:
+                sizes = {}
+                for notebook in self.__notebook_model.get_tree():
+                    for note in notebook["notes"]:
+                        path = Path(self.__base_path) / notebook["notebook_name"] / f"{note['title']}.md"
+                        try:
+                            sizes[note["id"]] = os.stat(path).st_size
+                        except OSError:
+                            sizes[note["id"]] = 0
+                sizes_fixed = self.__stats_model.update_sizes(sizes)
+            mismatches = self.__stats_model.check()
+            repaired = False
+            if mismatches and repair:
+                self.__stats_model.rebuild()
+                repaired = True
+            return {"sizes_fixed": sizes_fixed, "mismatches": mismatches, "repaired": repaired}
+        except (DatabaseError, Exception) as e:
+            raise StatsError(f"Failed to check counters: {str(e)}")
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__.strip())
+        sys.exit(1)
+    from server.database.database import Database
+    db = Database(sys.argv[1])
+    try:
+        report = StatsService(db).check_counters(
+            repair="--repair" in sys.argv[2:], scan_files="--scan-files" in sys.argv[2:]
+        )
+        print(f"{report['sizes_fixed']} note sizes fixed")
+        for mismatch in report["mismatches"]:
+            print(f"{mismatch['table']} {mismatch['id']}: stored {mismatch['stored']}, actual {mismatch['actual']}")
+        if not report["mismatches"]:
+            print("All counters are consistent")
+        elif report["repaired"]:
+            print("Counters rebuilt")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
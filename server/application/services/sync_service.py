@@ -0,0 +1,565 @@
+"""
+Incremental two-way sync of two repositories
+
+Usage: python -m server.application.services.sync_service <base_path> <peer_base_path> [keep_both|prefer_local|prefer_remote]
+"""
+import difflib
+import hashlib
+import json
+import os
+import sys
+from pathlib import Path
+from server.application.services.notebook_service import NotebookService
+from server.application.services.note_service import NoteService
+from server.application.services.note_tag_service import NoteTagService
+from server.application.services.tag_service import TagService
+from server.application.exceptions import (
+    DatabaseError,
+    NotebookError,
+    NoteError,
+    TagError,
+    NoteTagError,
+    SyncError
+)
+
+# Kinds of synced items, in the order they are created
+KINDS = ("notebook", "tag", "note", "link")
+CONFLICT_POLICIES = ("keep_both", "prefer_local", "prefer_remote")
+# Fingerprint of items that only exist or not (tags and note-tag links)
+PRESENT = "1"
+# Bytes of the signature of one line, sent by the target of a note transfer to its source
+SIGNATURE_SIZE = 8
+
+def note_key(notebook_name, title):
+    """
+    Key identifying a note in both repositories
+    :param notebook_name: name of the notebook
+    :param title: title of the note
+    :return: key of the note
+    """
+    return json.dumps([notebook_name, title], ensure_ascii=False)
+
+def link_key(notebook_name, title, tag_name):
+    """
+    Key identifying a note-tag link in both repositories
+    :param notebook_name: name of the notebook
+    :param title: title of the note
+    :param tag_name: name of the tag
+    :return: key of the link
+    """
+    return json.dumps([notebook_name, title, tag_name], ensure_ascii=False)
+
+def key_note(key):
+    """
+    Get the key of the note of a link
+    :param key: key of the link
+    :return: key of the note
+    """
+    notebook_name, title, _ = json.loads(key)
+    return note_key(notebook_name, title)
+
+def content_hash(content):
+    """
+    Fingerprint of the content of a note
+    :param content: bytes of the note file
+    :return: hex digest
+    """
+    return hashlib.sha256(content).hexdigest()
+
+def line_signatures(content):
+    """
+    Compute the signatures of the lines of a note, computed by the target of a transfer
+    :param content: bytes of the version the target has
+    :return: list of SIGNATURE_SIZE byte digests, one per line
+    """
+    return [
+        hashlib.blake2b(line, digest_size=SIGNATURE_SIZE).digest()
+        for line in content.splitlines(keepends=True)
+    ]
+
+def make_delta(signatures, new):
+    """
+    Compute a line based delta turning the target's content into new content, computed by the source
+    The source only knows the signatures of the target's lines, not the lines themselves
+    :param signatures: line signatures of the target's content
+    :param new: bytes of the new content
+    :return: list of (start, end, lines) replacing old lines [start, end) by lines
+    """
+    new_lines = new.splitlines(keepends=True)
+    matcher = difflib.SequenceMatcher(None, signatures, line_signatures(new), autojunk=False)
+    return [
+        (i1, i2, new_lines[j1:j2])
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        if tag != "equal"
+    ]
+
+def apply_delta(old, delta):
+    """
+    Apply a delta computed by make_delta()
+    :param old: bytes of the old content
+    :param delta: list of (start, end, lines)
+    :return: bytes of the new content
+    """
+    old_lines = old.splitlines(keepends=True)
+    result = []
+    position = 0
+    for start, end, lines in delta:
+        result.extend(old_lines[position:start])
+        result.extend(lines)
+        position = end
+    result.extend(old_lines[position:])
+    return b"".join(result)
+
+def delta_size(delta):
+    """
+    Number of bytes needed to transfer a delta (inserted lines plus two integers per operation)
+    :param delta: list of (start, end, lines)
+    :return: size in bytes
+    """
+    return sum(16 + sum(len(line) for line in lines) for _, _, lines in delta)
+
+class _Replica:
+    def __init__(self, db):
+        """
+        One side of a sync, wraps the services of a repository
+        :param db: connection to the database of the repository
+        """
+        self.db = db
+        self.base_path = Path(db.get_base_path())
+        # Peers identify each other by the resolved path of the repository
+        self.id = str(self.base_path.resolve())
+        self.name = self.base_path.name
+        self.notebook_service = NotebookService(db)
+        self.note_service = NoteService(db)
+        self.note_tag_service = NoteTagService(db)
+        self.tag_service = TagService(db)
+        self.note_service.notebook_service = self.notebook_service
+        self.note_tag_service.note_service = self.note_service
+        self.note_tag_service.tag_service = self.tag_service
+
+    def note_path(self, key):
+        """
+        Get the path of the file of a note
+        :param key: key of the note
+        :return: path of the note file
+        """
+        notebook_name, title = json.loads(key)
+        return self.base_path / notebook_name / f"{title}.md"
+
+    def read_note(self, key):
+        """
+        Read the content of a note
+        :param key: key of the note
+        :return: bytes of the note file, empty if the file does not exist
+        """
+        try:
+            return self.note_path(key).read_bytes()
+        except FileNotFoundError:
+            return b""
+
+    def send_note(self, key, signatures=None):
+        """
+        Source side of a note transfer, only the returned delta or content reaches the target
+        :param key: key of the note
+        :param signatures: line signatures of the version the target has, None if it has none
+        :return: (delta or None, content or None, size of the content), the delta is returned
+        if it is smaller than the content
+        """
+        content = self.read_note(key)
+        if signatures is not None:
+            delta = make_delta(signatures, content)
+            if delta_size(delta) < len(content):
+                return delta, None, len(content)
+        return None, content, len(content)
+
+    def load_base(self, peer):
+        """
+        Load the state agreed on at the last sync with a peer
+        :param peer: id of the peer repository
+        :return: (last change sequence or None, {kind: {key: (fingerprint, mtime, size)}})
+        """
+        base = {kind: {} for kind in KINDS}
+        last_seq = self.db.fetchvalue("SELECT last_seq FROM sync_state WHERE peer = ?", [peer])
+        for kind, key, fingerprint, mtime, size in self.db.iterfetch(
+            "SELECT kind, item_key, fingerprint, mtime, size FROM sync_items WHERE peer = ?",
+            [peer],
+            row_format="tuple"
+        ):
+            base[kind][key] = (fingerprint, mtime, size)
+        return last_seq, base
+
+    def current_state(self, last_seq, base, stats):
+        """
+        Get the current state of the repository
+        If the change sequence did not move since the last sync, the database part is taken
+        from the base and only note files are checked, a file is only hashed if its size or mtime changed
+        :param last_seq: change sequence at the last sync, None if never synced
+        :param base: state agreed on at the last sync
+        :param stats: counters of the sync, updated in place
+        :return: {kind: {key: fingerprint}}
+        """
+        # The sequence is compared rather than the logged changes, which may have been pruned
+        if last_seq is not None and self.db.get_change_seq() <= last_seq:
+            state = {kind: {key: item[0] for key, item in base[kind].items()} for kind in KINDS}
+        else:
+            stats["scanned"].append(self.name)
+            state = {
+                "notebook": {
+                    name: description or ""
+                    for name, description in self.db.fetchall(
+                        "SELECT notebook_name, description FROM notebooks", row_format="tuple"
+                    )
+                },
+                "tag": {
+                    name: PRESENT
+                    for name, in self.db.fetchall("SELECT tag_name FROM tags", row_format="tuple")
+                },
+                "note": {
+                    note_key(notebook_name, title): None
+                    for notebook_name, title in self.db.fetchall(
+                        "SELECT nb.notebook_name, n.title FROM notes n JOIN notebooks nb ON nb.id = n.notebook_id",
+                        row_format="tuple"
+                    )
+                },
+                "link": {
+                    link_key(notebook_name, title, tag_name): PRESENT
+                    for notebook_name, title, tag_name in self.db.fetchall(
+                        """
+                        SELECT nb.notebook_name, n.title, t.tag_name
+                        FROM note_tags nt
+                        JOIN notes n ON n.id = nt.note_id
+                        JOIN notebooks nb ON nb.id = n.notebook_id
+                        JOIN tags t ON t.id = nt.tag_id
+                        """,
+                        row_format="tuple"
+                    )
+                }
+            }
+        for key in state["note"]:
+            known = base["note"].get(key)
+            try:
+                status = os.stat(self.note_path(key))
+                signature = (status.st_mtime, status.st_size)
+            except OSError:
+                signature = None
+            if known is not None and signature is not None and (known[1], known[2]) == signature:
+                state["note"][key] = known[0]
+            else:
+                stats["hashed"] += 1
+                state["note"][key] = content_hash(self.read_note(key))
+        return state
+
+    def apply(self, merged, current, sources, stats, seq):
+        """
+        Change the repository so that it matches the merged state
+        The changes of the sync itself are excluded from the returned change sequence, unless another
+        connection committed since seq was read, then seq is returned and the next sync scans again
+        :param merged: {kind: {key: fingerprint}} to reach
+        :param current: {kind: {key: fingerprint}} of the repository
+        :param sources: {key: (replica, key)} telling where the content of each merged note is read from
+        :param stats: counters of the sync, updated in place
+        :param seq: change sequence read before the sync started
+        :return: (list of applied operations, change sequence to store as synced)
+        """
+        # All writes go through one connection, so its data version only moves on commits of others
+        with self.db.hold_connection():
+            version = self.db.get_data_version()
+            unchanged = self.db.get_change_seq() == seq
+            operations = self.__apply(merged, current, sources, stats)
+            applied_seq = self.db.get_change_seq()
+            unchanged = unchanged and self.db.get_data_version() == version
+        return operations, applied_seq if unchanged else seq
+
+    def __apply(self, merged, current, sources, stats):
+        """
+        Write the operations turning the current state into the merged state
+        :param merged: {kind: {key: fingerprint}} to reach
+        :param current: {kind: {key: fingerprint}} of the repository
+        :param sources: {key: (replica, key)} telling where the content of each merged note is read from
+        :param stats: counters of the sync, updated in place
+        :return: list of applied operations
+        """
+        operations = []
+        # Create and update, parents first
+        for name, description in merged["notebook"].items():
+            if name not in current["notebook"]:
+                self.notebook_service.create_notebook(name, description or None)
+                operations.append(f"create notebook {name}")
+            elif current["notebook"][name] != description:
+                self.db.update_record("notebooks", {"description": description or None}, {"notebook_name": name})
+                operations.append(f"update notebook {name}")
+        for name in merged["tag"].keys() - current["tag"].keys():
+            self.tag_service.create_tag(name)
+            operations.append(f"create tag {name}")
+        for key, fingerprint in merged["note"].items():
+            existing = current["note"].get(key)
+            if existing == fingerprint:
+                continue
+            notebook_name, title = json.loads(key)
+            source, source_key = sources[key]
+            if existing is None:
+                _, content, size = source.send_note(source_key)
+                stats["bytes_full"] += size
+                self.note_service.create_note(title, notebook_name)
+                self.note_service.save_note_content(title, notebook_name, content)
+                stats["bytes_sent"] += size
+                operations.append(f"create note {title} in {notebook_name}")
+                continue
+            # The signatures of the version present here go to the source, which answers with a line delta
+            # Signatures of short lines would cost more than they save, then the content is requested
+            old = self.read_note(key)
+            signatures = line_signatures(old)
+            if len(signatures) * SIGNATURE_SIZE * 4 > len(old):
+                signatures = []
+            delta, content, size = source.send_note(source_key, signatures or None)
+            stats["bytes_full"] += size
+            stats["bytes_sent"] += len(signatures) * SIGNATURE_SIZE
+            if delta is not None:
+                patched = apply_delta(old, delta)
+                if content_hash(patched) == fingerprint:
+                    self.note_service.save_note_content(title, notebook_name, patched)
+                    stats["bytes_sent"] += delta_size(delta)
+                    operations.append(f"patch note {title} in {notebook_name}")
+                    continue
+                # Two different lines with the same signature, the full content is transferred instead
+                stats["bytes_sent"] += delta_size(delta)
+                _, content, _ = source.send_note(source_key)
+            self.note_service.save_note_content(title, notebook_name, content)
+            stats["bytes_sent"] += len(content)
+            operations.append(f"replace note {title} in {notebook_name}")
+        for key in merged["link"].keys() - current["link"].keys():
+            notebook_name, title, tag_name = json.loads(key)
+            self.note_tag_service.add_tag_to_note(title, notebook_name, tag_name)
+            operations.append(f"tag note {title} in {notebook_name} with {tag_name}")
+        # Delete, children first
+        for key in current["link"].keys() - merged["link"].keys():
+            notebook_name, title, tag_name = json.loads(key)
+            if key_note(key) in merged["note"] and tag_name in merged["tag"]:
+                self.note_tag_service.remove_tag_from_note(title, notebook_name, tag_name)
+                operations.append(f"untag note {title} in {notebook_name} from {tag_name}")
+        for key in current["note"].keys() - merged["note"].keys():
+            notebook_name, title = json.loads(key)
+            self.note_service.delete_note(title, notebook_name)
+            operations.append(f"delete note {title} in {notebook_name}")
+        for name in current["tag"].keys() - merged["tag"].keys():
+            self.tag_service.delete_tag(name)
+            operations.append(f"delete tag {name}")
+        for name in current["notebook"].keys() - merged["notebook"].keys():
+            self.notebook_service.delete_notebook(name)
+            operations.append(f"delete notebook {name}")
+        return operations
+
+    def save_base(self, peer, merged, seq):
+        """
+        Store the merged state as the base of the next sync with a peer
+        :param peer: id of the peer repository
+        :param merged: {kind: {key: fingerprint}} both repositories agreed on
+        :param seq: change sequence covered by the merged state
+        :return: None
+        """
+        rows = []
+        for kind in KINDS:
+            for key, fingerprint in merged[kind].items():
+                mtime = size = None
+                if kind == "note":
+                    try:
+                        status = os.stat(self.note_path(key))
+                        mtime, size = status.st_mtime, status.st_size
+                    except OSError:
+                        pass
+                rows.append((peer, kind, key, fingerprint, mtime, size))
+        with self.db.transaction():
+            self.db.execute("DELETE FROM sync_items WHERE peer = ?", [peer])
+            self.db.executemany(
+                "INSERT INTO sync_items (peer, kind, item_key, fingerprint, mtime, size) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self.db.execute(
+                """
+                INSERT INTO sync_state (peer, last_seq) VALUES (?, ?)
+                ON CONFLICT (peer) DO UPDATE SET last_seq = excluded.last_seq, synced_at = CURRENT_TIMESTAMP
+                """,
+                [peer, seq]
+            )
+
+    def prune_changes(self):
+        """
+        Delete the logged changes that every peer has already synced
+        :return: number of deleted changes
+        """
+        seq = self.db.fetchvalue("SELECT min(last_seq) FROM sync_state")
+        return self.db.prune_changes(seq) if seq else 0
+
+class SyncService:
+    def __init__(self, db, peer_db, conflict_policy="keep_both"):
+        """
+        Initialize the sync of two repositories
+        :param db: connection to the database of the local repository
+        :param peer_db: connection to the database of the remote repository
+        :param conflict_policy: what to do with a note changed differently on both sides,
+        "keep_both" keeps the local version and adds the remote one as a conflict copy,
+        "prefer_local" or "prefer_remote" keep one version only
+        :raises SyncError: if the repositories cannot be synced
+        """
+        if conflict_policy not in CONFLICT_POLICIES:
+            raise SyncError(
+                f"Unknown conflict policy {conflict_policy}, expected one of {', '.join(CONFLICT_POLICIES)}"
+            )
+        # The database file is named after the folder of the repository
+        if Path(db.get_db_path()).resolve() == Path(peer_db.get_db_path()).resolve():
+            raise SyncError(
+                "Both repositories use the same database file, rename one of the repository folders"
+            )
+        try:
+            self.__local = _Replica(db)
+            self.__remote = _Replica(peer_db)
+        except (NotebookError, NoteError, TagError, NoteTagError) as e:
+            raise SyncError(f"Failed to initialize SyncService: {str(e)}")
+        self.__conflict_policy = conflict_policy
+
+    def __fingerprints(self, base):
+        """
+        Strip the file signatures from a base state
+        :param base: {kind: {key: (fingerprint, mtime, size)}}
+        :return: {kind: {key: fingerprint}}
+        """
+        return {kind: {key: item[0] for key, item in base[kind].items()} for kind in KINDS}
+
+    def __conflict_key(self, key, taken):
+        """
+        Find a free key for the conflict copy of a note
+        :param key: key of the conflicting note
+        :param taken: keys already in use
+        :return: key of the conflict copy
+        """
+        notebook_name, title = json.loads(key)
+        candidate = note_key(notebook_name, f"{title} (conflict {self.__remote.name})")
+        number = 2
+        while candidate in taken:
+            candidate = note_key(notebook_name, f"{title} (conflict {self.__remote.name} {number})")
+            number += 1
+        return candidate
+
+    def __merge(self, base, local, remote):
+        """
+        Three-way merge of the two states against the state agreed on at the last sync
+        :param base: {kind: {key: (fingerprint, mtime, size)}}
+        :param local: {kind: {key: fingerprint}} of the local repository
+        :param remote: {kind: {key: fingerprint}} of the remote repository
+        :return: (merged state, sources of the note contents, list of conflicts)
+        """
+        merged = {kind: {} for kind in KINDS}
+        sources = {}
+        conflicts = []
+        for kind in KINDS:
+            for key in local[kind].keys() | remote[kind].keys() | base[kind].keys():
+                local_value = local[kind].get(key)
+                remote_value = remote[kind].get(key)
+                base_value = base[kind][key][0] if key in base[kind] else None
+                side = self.__local
+                if local_value == remote_value or remote_value == base_value:
+                    value = local_value
+                elif local_value == base_value:
+                    value, side = remote_value, self.__remote
+                elif local_value is None or remote_value is None:
+                    # Changed on one side and deleted on the other, the change wins
+                    value = local_value if remote_value is None else remote_value
+                    side = self.__local if remote_value is None else self.__remote
+                    conflicts.append({"kind": kind, "key": key, "resolution": "kept the modified version"})
+                elif self.__conflict_policy == "prefer_remote":
+                    value, side = remote_value, self.__remote
+                    conflicts.append({"kind": kind, "key": key, "resolution": "kept the remote version"})
+                elif self.__conflict_policy == "keep_both" and kind == "note":
+                    value = local_value
+                    copy = self.__conflict_key(key, local["note"].keys() | remote["note"].keys() | merged["note"].keys())
+                    merged["note"][copy] = remote_value
+                    sources[copy] = (self.__remote, key)
+                    conflicts.append({"kind": kind, "key": key, "resolution": f"remote version saved as {copy}"})
+                else:
+                    value = local_value
+                    conflicts.append({"kind": kind, "key": key, "resolution": "kept the local version"})
+                if value is not None:
+                    merged[kind][key] = value
+                    if kind == "note":
+                        sources[key] = (side, key)
+        # Keep the parents of the merged notes and links
+        for key in list(merged["note"]):
+            notebook_name, _ = json.loads(key)
+            if notebook_name not in merged["notebook"]:
+                merged["notebook"][notebook_name] = local["notebook"].get(
+                    notebook_name, remote["notebook"].get(notebook_name, "")
+                )
+                conflicts.append({
+                    "kind": "notebook", "key": notebook_name, "resolution": "kept because it still has notes"
+                })
+        for key in list(merged["link"]):
+            tag_name = json.loads(key)[2]
+            if key_note(key) not in merged["note"]:
+                # Links of deleted notes go with them
+                del merged["link"][key]
+            elif tag_name not in merged["tag"]:
+                merged["tag"][tag_name] = PRESENT
+                conflicts.append({"kind": "tag", "key": tag_name, "resolution": "kept because it is still used"})
+        return merged, sources, conflicts
+
+    def sync(self):
+        """
+        Exchange the changes made in both repositories since their last sync
+        :raises SyncError: if the sync fails, the next sync resumes from the last completed one
+        :return: report with applied operations, conflicts and transferred bytes
+        """
+        stats = {"scanned": [], "hashed": 0, "bytes_full": 0, "bytes_sent": 0}
+        try:
+            # Sequences are read first, so changes made while syncing are picked up next time
+            local_seq = self.__local.db.get_change_seq()
+            remote_seq = self.__remote.db.get_change_seq()
+            local_last_seq, local_base = self.__local.load_base(self.__remote.id)
+            remote_last_seq, remote_base = self.__remote.load_base(self.__local.id)
+            # Both sides store the same fingerprints, only mtime and size of the note files differ
+            if self.__fingerprints(local_base) != self.__fingerprints(remote_base):
+                # One side lost its sync state (e.g. a restored backup), fall back to a full merge
+                local_base = {kind: {} for kind in KINDS}
+                remote_base = {kind: {} for kind in KINDS}
+                local_last_seq = remote_last_seq = None
+            local = self.__local.current_state(local_last_seq, local_base, stats)
+            remote = self.__remote.current_state(remote_last_seq, remote_base, stats)
+            merged, sources, conflicts = self.__merge(local_base, local, remote)
+            local_operations, local_seq = self.__local.apply(merged, local, sources, stats, local_seq)
+            remote_operations, remote_seq = self.__remote.apply(merged, remote, sources, stats, remote_seq)
+            self.__local.save_base(self.__remote.id, merged, local_seq)
+            self.__remote.save_base(self.__local.id, merged, remote_seq)
+            self.__local.prune_changes()
+            self.__remote.prune_changes()
+        except (NotebookError, NoteError, TagError, NoteTagError, DatabaseError, OSError) as e:
+            raise SyncError(f"Failed to sync {self.__local.name} with {self.__remote.name}: {str(e)}")
+        return {
+            "local": local_operations,
+            "remote": remote_operations,
+            "conflicts": conflicts,
+            "scanned": stats["scanned"],
+            "hashed": stats["hashed"],
+            "bytes_full": stats["bytes_full"],
+            "bytes_sent": stats["bytes_sent"]
+        }
+
+def main():
+    if len(sys.argv) < 3:
+        print(__doc__.strip())
+        sys.exit(1)
+    from server.database.database import Database
+    db = Database(sys.argv[1])
+    peer_db = Database(sys.argv[2])
+    try:
+        report = SyncService(db, peer_db, *sys.argv[3:4]).sync()
+        for side in ("local", "remote"):
+            for operation in report[side]:
+                print(f"{side:<7} {operation}")
+        for conflict in report["conflicts"]:
+            print(f"conflict {conflict['kind']} {conflict['key']}: {conflict['resolution']}")
+        print(f"{report['bytes_sent']} of {report['bytes_full']} bytes transferred, {report['hashed']} files hashed")
+    finally:
+        db.close()
+        peer_db.close()
+
+if __name__ == "__main__":
+    main()
@@ -47,6 +47,18 @@ class TagService:
         except (ValidationError, TagNotFoundError, DatabaseError, Exception) as e:
             raise TagError(f"Failed to get tag {tag_name}: {str(e)}")
 
+    def get_tag_id(self, tag_name):
+        """
+        Get the ID of a tag by its name, resolved through the name registry
+        :param tag_name: name of the tag
+        :raises TagError: if the tag does not exist or retrieval fails
+        :return: ID of the tag
+        """
+        try:
+            return self.__tag_model.get_tag_id(tag_name)
+        except (ValidationError, TagNotFoundError, DatabaseError, Exception) as e:
+            raise TagError(f"Failed to get tag {tag_name}: {str(e)}")
+
     def update_tag(self, tag_name, new_name):
         """
         Update a tag's name
@@ -88,4 +100,17 @@ class TagService:
             tags = self.__tag_model.get_all_tags()
             return [tag["tag_name"] for tag in tags]
         except (DatabaseError, Exception) as e:
-            raise TagError(f"Failed to get all tags: {str(e)}")
\ No newline at end of file
+            raise TagError(f"Failed to get all tags: {str(e)}")
+
+    def iter_all_tags(self, batch_size=500):
+        """
+        Iterate over all tag names, reading them from the database in batches
+        :param batch_size: number of tags read per round trip
+        :raises TagError: if retrieval fails
+        :return: generator of tag names
+        """
+        try:
+            for tag in self.__tag_model.iter_all_tags(batch_size):
+                yield tag["tag_name"]
+        except (DatabaseError, Exception) as e:
+            raise TagError(f"Failed to iterate over all tags: {str(e)}")
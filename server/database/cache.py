@@ -0,0 +1,169 @@
+import threading
+from collections import OrderedDict
+
+class EntityCache:
+    def __init__(self, capacity=1024):
+        """
+        Bounded identity map of rows, keyed by table and ID and by table and natural key
+        (e.g. notebook name, (title, notebook_id) of a note or tag name)
+        The least recently used entries are evicted once the capacity is reached
+        Writes of the models drop their entries, commits of other connections (e.g. other processes
+        writing to the same repository) are noticed by the Database, which then clears the cache
+        :param capacity: maximum number of cached rows and natural keys together
+        """
+        if not isinstance(capacity, int) or capacity <= 0:
+            raise ValueError("Cache capacity must be a positive integer")
+        self.__capacity = capacity
+        self.__lock = threading.Lock()
+        # ("row", table, id) -> row and ("key", table, natural key) -> id, in LRU order
+        self.__entries = OrderedDict()
+        # (table, id) -> natural keys pointing to the row, to drop them with the row
+        self.__keys = {}
+        # Incremented by every invalidation, rows read before an invalidation are not stored
+        self.__generation = 0
+        # Metrics
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+
+    def get_generation(self):
+        """
+        Get the invalidation counter, to be read before the database is queried
+        :return: current generation
+        """
+        return self.__generation
+
+    def __lookup(self, entry):
+        """
+        Look up an entry and mark it as recently used
+        :param entry: key of the entry
+        :return: the cached value, None if not cached
+        """
+        with self.__lock:
+            value = self.__entries.get(entry)
+            if value is None:
+                self.__misses += 1
+                return None
+            self.__entries.move_to_end(entry)
+            self.__hits += 1
+            return value
+
+    def __store(self, entry, value, generation):
+        """
+        Store an entry, evicting the least recently used ones if the cache is full
+        Must be called with the lock held
+        :param entry: key of the entry
+        :param value: value to be cached
+        :param generation: generation read before the value was queried
+        :return: True if the entry was stored, False if it may be stale
+        """
+        if generation != self.__generation:
+            return False
+        self.__entries[entry] = value
+        self.__entries.move_to_end(entry)
+        while len(self.__entries) > self.__capacity:
+            evicted, evicted_value = self.__entries.popitem(last=False)
+            self.__evictions += 1
+            if evicted[0] == "key":
+                keys = self.__keys.get((evicted[1], evicted_value))
+                if keys is not None:
+                    keys.discard(evicted[2])
+                    if not keys:
+                        del self.__keys[(evicted[1], evicted_value)]
+        return True
+
+    def get(self, table, entity_id):
+        """
+        Get a cached row by ID
+        :param table: name of the table
+        :param entity_id: ID of the row
+        :return: the row, None if not cached (dictionaries are returned as copies)
+        """
+        row = self.__lookup(("row", table, entity_id))
+        return dict(row) if isinstance(row, dict) else row
+
+    def get_id(self, table, key):
+        """
+        Get the cached ID of a row by its natural key
+        :param table: name of the table
+        :param key: natural key of the row
+        :return: ID of the row, None if not cached
+        """
+        return self.__lookup(("key", table, key))
+
+    def put(self, table, entity_id, row, generation):
+        """
+        Cache a row read from the database
+        :param table: name of the table
+        :param entity_id: ID of the row
+        :param row: the row (dictionaries are stored as copies)
+        :param generation: generation read before the row was queried
+        :return: None
+        """
+        with self.__lock:
+            self.__store(("row", table, entity_id), dict(row) if isinstance(row, dict) else row, generation)
+
+    def put_id(self, table, key, entity_id, generation):
+        """
+        Cache the ID of a row under its natural key
+        :param table: name of the table
+        :param key: natural key of the row
+        :param entity_id: ID of the row
+        :param generation: generation read before the ID was queried
+        :return: None
+        """
+        with self.__lock:
+            if self.__store(("key", table, key), entity_id, generation):
+                self.__keys.setdefault((table, entity_id), set()).add(key)
+
+    def invalidate(self, table, entity_id):
+        """
+        Drop a row and its natural keys, called after the row was written
+        :param table: name of the table
+        :param entity_id: ID of the row
+        :return: None
+        """
+        with self.__lock:
+            self.__generation += 1
+            self.__entries.pop(("row", table, entity_id), None)
+            for key in self.__keys.pop((table, entity_id), ()):
+                self.__entries.pop(("key", table, key), None)
+
+    def invalidate_table(self, table):
+        """
+        Drop all rows and natural keys of a table, e.g. after a cascading delete
+        :param table: name of the table
+        :return: None
+        """
+        with self.__lock:
+            self.__generation += 1
+            for entry in [entry for entry in self.__entries if entry[1] == table]:
+                del self.__entries[entry]
+            for owner in [owner for owner in self.__keys if owner[0] == table]:
+                del self.__keys[owner]
+
+    def clear(self):
+        """
+        Drop all cached entries
+        :return: None
+        """
+        with self.__lock:
+            self.__generation += 1
+            self.__entries.clear()
+            self.__keys.clear()
+
+    def get_stats(self):
+        """
+        Get the cache metrics
+        :return: dictionary with capacity, size, hits, misses, hit rate and evictions
+        """
+        with self.__lock:
+            lookups = self.__hits + self.__misses
+            return {
+                "capacity": self.__capacity,
+                "size": len(self.__entries),
+                "hits": self.__hits,
+                "misses": self.__misses,
+                "hit_rate": self.__hits / lookups if lookups else 0.0,
+                "evictions": self.__evictions
+            }
@@ -1,173 +1,1024 @@
 from pathlib import Path
+import json
+import os
 import sqlite3
-from contextlib import contextmanager
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager, nullcontext
+from server.database.pool import ConnectionPool
+from server.database.instrumentation import QueryStats
+from server.database.migrations import MIGRATIONS, SCHEMA_VERSION
+from server.database.writer import WriteQueue
+from server.database.retry import RetryPolicy, LockStats, run_with_retry
+from server.database.cache import EntityCache
+from server.database.names import NameRegistry
 from server.application.exceptions import (
     ValidationError,
     DatabaseError)
 
+# Performance profiles applied to every connection, selectable by name
+# cache_size is negative to be read as KiB, mmap_size is in bytes, busy_timeout in milliseconds
+PERFORMANCE_PROFILES = {
+    # Durable on power loss, every commit is synced to disk
+    "safe": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "cache_size": -2000,
+        "mmap_size": 0,
+        "temp_store": "DEFAULT",
+        "busy_timeout": 5000
+    },
+    # Durable on application crash, WAL is synced only at checkpoints
+    "balanced": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -16000,
+        "mmap_size": 64 * 1024 * 1024,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000
+    },
+    # No syncs at all, recent commits may be lost on power loss
+    "fast": {
+        "journal_mode": "WAL",
+        "synchronous": "OFF",
+        "cache_size": -64000,
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000
+    }
+}
+
+DEFAULT_PROFILE = "balanced"
+
+# Representations of fetched rows:
+# "dict" (default) a new dictionary per row
+# "row" the sqlite3.Row returned by the driver
+# "record" a __slots__ record class of the queried table (see server.database.records)
+# "tuple" plain tuples in column order, only meant for per-call use since services read rows by key
+ROW_FORMATS = ("dict", "row", "record", "tuple")
+DEFAULT_ROW_FORMAT = "dict"
+
+# Tables whose rows are kept in the entity cache
+CACHED_TABLES = ("notebooks", "notes", "tags")
+# Changes of other processes read from the change log at most, beyond that the cache is cleared
+MAX_REPLAYED_CHANGES = 1000
+
 class Database:
-    def __init__(self, base_path):
+    def __init__(
+        self,
+        base_path,
+        pool_size=5,
+        pool_timeout=30.0,
+        profile=DEFAULT_PROFILE,
+        row_format=DEFAULT_ROW_FORMAT,
+        busy_timeout=None,
+        retry_policy=None,
+        cache_size=1024
+    ):
         """
         Initialize the database object
         :base_path: the path containing all notebooks and notes
+        :pool_size: maximum number of connections shared by all threads
+        :pool_timeout: seconds a thread waits for a free connection before failing
+        :profile: name of the performance profile ("safe", "balanced" or "fast")
+        :row_format: default representation of fetched rows ("dict", "row" or "record")
+        :busy_timeout: milliseconds SQLite waits for a lock held by another connection (profile default if None)
+        :retry_policy: RetryPolicy applied when the lock is still held after the busy timeout
+        :cache_size: maximum number of entries of the entity cache shared by the models
+                     (0 disables it together with the name registries)
         """
         if not base_path:
             raise ValueError("Base path not set")
+        if profile not in PERFORMANCE_PROFILES:
+            raise ValueError(
+                f"Unknown performance profile {profile}, expected one of {', '.join(PERFORMANCE_PROFILES)}"
+            )
+        self.__profile = profile
+        if row_format not in ROW_FORMATS or row_format == "tuple":
+            raise ValueError(f"Unknown row format {row_format}, expected one of dict, row, record")
+        self.__row_format = row_format
+        if busy_timeout is None:
+            busy_timeout = PERFORMANCE_PROFILES[profile]["busy_timeout"]
+        if busy_timeout < 0:
+            raise ValueError("Busy timeout cannot be negative")
+        self.__busy_timeout = busy_timeout
+        self.__retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        # Waits and retries of write transactions and autocommit statements
+        self.__lock_stats = LockStats()
         self.__base_path = base_path
         self.__repository_name = Path(base_path).name
         # Path of the database file (attention that the name of database file is fixed)
         self.__db_path = Path(__file__).parent / f"{self.__repository_name}.db"
-        # Connection to the database
-        self.__connection = None
-        # The cursor of the database
-        self.__cursor = None
+        self.__pool_size = pool_size
+        self.__pool_timeout = pool_timeout
+        # Pool of connections, every thread checks out its own connection
+        self.__pool = None
+        # Pool of read-only connections used by snapshots
+        self.__read_pool = None
+        # Connection pinned to the current thread and its transaction depth
+        self.__local = threading.local()
+        # Query statistics, None unless instrumentation is enabled
+        self.__query_stats = None
+        # Single writer thread with group commit, None unless started
+        self.__write_queue = None
+        # Rows of notebooks, notes and tags read by the models, None if disabled
+        self.__cache = EntityCache(cache_size) if cache_size else None
+        # Change sequence the cache reflects, commits of other processes are found in the change log after it
+        self.__cache_seq = None
+        self.__cache_seq_lock = threading.Lock()
+        # The change log only exists once the migrations ran
+        self.__track_changes = False
+        # Sizes and modification times of the database and WAL files at the last check
+        self.__checked_files = None
+        # Notebook and tag names interned to their IDs, empty if caching is disabled
+        self.__name_registries = {
+            "notebooks": NameRegistry(self, "notebooks", "notebook_name"),
+            "tags": NameRegistry(self, "tags", "tag_name")
+        } if cache_size else {}
         # Execute initialization
         self.initialize()
 
-    def connect(self):
+    def __create_connection(self):
         """
-        Connect to the database
+        Create a new connection to the database file
+        :return: sqlite3 connection
         """
         # Database file will be created if it does not exist
-        self.__connection = sqlite3.connect(self.__db_path)
+        # Connections are handed between threads by the pool, which guarantees exclusive use
+        connection = sqlite3.connect(
+            self.__db_path, timeout=self.__busy_timeout / 1000, check_same_thread=False
+        )
+        # Autocommit mode, transactions are opened explicitly by begin_transaction()
+        connection.isolation_level = None
+        # Enforce the foreign keys so that ON DELETE CASCADE removes notes and note-tag links
+        connection.execute("PRAGMA foreign_keys = ON")
         # Return by sqlite3.Row
-        self.__connection.row_factory = sqlite3.Row
-        self.__cursor = self.__connection.cursor()
+        connection.row_factory = sqlite3.Row
+        self.__apply_profile(connection)
+        return connection
+
+    def __create_read_connection(self):
+        """
+        Create a new read-only connection to the database file for snapshots
+        :return: sqlite3 connection
+        """
+        connection = sqlite3.connect(
+            f"{self.__db_path.as_uri()}?mode=ro",
+            uri=True,
+            timeout=self.__busy_timeout / 1000,
+            check_same_thread=False
+        )
+        connection.isolation_level = None
+        connection.row_factory = sqlite3.Row
+        settings = PERFORMANCE_PROFILES[self.__profile]
+        connection.execute(f"PRAGMA cache_size = {int(settings['cache_size'])}")
+        connection.execute(f"PRAGMA mmap_size = {int(settings['mmap_size'])}")
+        connection.execute(f"PRAGMA temp_store = {settings['temp_store']}")
+        connection.execute(f"PRAGMA busy_timeout = {int(self.__busy_timeout)}")
+        return connection
+
+    def __apply_profile(self, connection):
+        """
+        Apply the pragmas of the performance profile to a connection
+        :param connection: sqlite3 connection
+        :return: None
+        """
+        settings = PERFORMANCE_PROFILES[self.__profile]
+        # journal_mode is persistent in the database file, the others only last for the connection
+        connection.execute(f"PRAGMA journal_mode = {settings['journal_mode']}")
+        connection.execute(f"PRAGMA synchronous = {settings['synchronous']}")
+        connection.execute(f"PRAGMA cache_size = {int(settings['cache_size'])}")
+        connection.execute(f"PRAGMA mmap_size = {int(settings['mmap_size'])}")
+        connection.execute(f"PRAGMA temp_store = {settings['temp_store']}")
+        connection.execute(f"PRAGMA busy_timeout = {int(self.__busy_timeout)}")
+
+    def get_row_format(self):
+        """
+        Get the default representation of fetched rows
+        :return: name of the row format
+        """
+        return self.__row_format
+
+    def get_busy_timeout(self):
+        """
+        Get the time SQLite waits for a lock before reporting the database as locked
+        :return: busy timeout in milliseconds
+        """
+        return self.__busy_timeout
+
+    def get_retry_policy(self):
+        """
+        Get the retry policy applied to lock errors
+        :return: RetryPolicy
+        """
+        return self.__retry_policy
+
+    def get_lock_stats(self):
+        """
+        Get metrics of lock waits, retries and failures of write transactions and autocommit statements
+        :return: dictionary of metrics
+        """
+        return self.__lock_stats.get_stats()
+
+    def get_entity_cache(self):
+        """
+        Get the entity cache shared by the models
+        :return: EntityCache, None if caching is disabled
+        """
+        return self.__cache
+
+    def get_cache_stats(self):
+        """
+        Get the hit and miss counters of the entity cache and the name registries
+        :return: dictionary of cache metrics, None if caching is disabled
+        """
+        if not self.__cache:
+            return None
+        stats = self.__cache.get_stats()
+        stats["names"] = {table: registry.get_stats() for table, registry in self.__name_registries.items()}
+        return stats
+
+    def resolve_name(self, table, name, loader):
+        """
+        Get the ID of a notebook or tag by its unique name through the name registry of the table
+        :param table: name of the table ("notebooks" or "tags")
+        :param name: unique name of the row
+        :param loader: function reading the ID from the database if the name is not registered
+        :return: ID of the row, None if it does not exist
+        """
+        registry = self.__name_registries.get(table)
+        if registry is None or self.in_snapshot():
+            return loader()
+        self.__poll_changes()
+        # Names read inside a transaction are not registered since it may still be rolled back
+        return registry.resolve(name, loader, store=not self.in_transaction())
+
+    def __check_changes(self, connection, seq=None):
+        """
+        Drop the cached rows changed by other connections since the last check
+        Runs once per checkout and per transaction, cache lookups only run it if the database or WAL file
+        changed since the last check
+        Commits of this process also move the change sequence, but writes of the models already drop
+        their rows and transactions record their own changes as seen when they commit
+        Only the rows named in the change log are dropped, the whole cache only if the log was pruned
+        past the last check or more than MAX_REPLAYED_CHANGES rows were changed
+        :param connection: connection to read the change log on
+        :param seq: current change sequence if it was already read on the connection
+        :return: None
+        """
+        if self.__cache is None or not self.__track_changes:
+            return
+        # Read before the sequence, so a commit after it is noticed by the next lookup
+        self.__checked_files = self.__file_signature()
+        if seq is None:
+            seq = self.__read_change_seq(connection)
+        with self.__cache_seq_lock:
+            known = self.__cache_seq
+        if known is not None and seq <= known:
+            return
+        changes = None
+        if known is not None and seq - known <= MAX_REPLAYED_CHANGES:
+            changes = connection.execute(
+                "SELECT table_name, row_id FROM changes WHERE seq > ? AND seq <= ?", [known, seq]
+            ).fetchall()
+        # Sequence numbers have no gaps, missing ones were pruned
+        if changes is None or len(changes) != seq - known:
+            self.__cache.clear()
+            for registry in self.__name_registries.values():
+                registry.invalidate()
+        else:
+            # Registered names are dropped one by one as well, the rest stays loaded
+            for table, row_id in changes:
+                if table in CACHED_TABLES:
+                    self.__drop_cached(table, row_id)
+        with self.__cache_seq_lock:
+            if self.__cache_seq is None or self.__cache_seq < seq:
+                self.__cache_seq = seq
+
+    def __file_signature(self):
+        """
+        Get sizes and modification times of the database and WAL files, which change on every commit
+        :return: tuple of (mtime, size) per file, None for a missing file
+        """
+        signature = []
+        for suffix in ("", "-wal"):
+            try:
+                status = os.stat(f"{self.__db_path}{suffix}")
+                signature.append((status.st_mtime_ns, status.st_size))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    def __poll_changes(self):
+        """
+        Run the change check before a cache lookup if any connection committed since the last check
+        A lookup only compares the file signature, the change log is read at most once per commit
+        :return: None
+        """
+        if self.__track_changes and self.__file_signature() != self.__checked_files:
+            # Checking out a connection runs the check, a transaction already ran it when it began
+            with self.connection():
+                pass
+
+    def __read_change_seq(self, connection):
+        """
+        Read the sequence number of the latest change on a connection
+        :param connection: sqlite3 connection
+        :return: latest sequence number, 0 if nothing was changed yet
+        """
+        row = connection.execute("SELECT seq FROM sqlite_sequence WHERE name = 'changes'").fetchone()
+        return row[0] if row else 0
+
+    def cached(self, table, entity_id, loader):
+        """
+        Get a row through the entity cache, loading it from the database on a miss
+        Snapshots bypass the cache, and rows read inside a transaction are not stored
+        since the transaction may still be rolled back
+        :param table: name of the table
+        :param entity_id: ID of the row
+        :param loader: function reading the row from the database
+        :return: the row
+        """
+        if self.__cache is None or self.in_snapshot():
+            return loader()
+        self.__poll_changes()
+        row = self.__cache.get(table, entity_id)
+        if row is not None:
+            return row
+        generation = self.__cache.get_generation()
+        row = loader()
+        if row is not None and not self.in_transaction():
+            self.__cache.put(table, entity_id, row, generation)
+        return row
+
+    def cached_id(self, table, key, loader):
+        """
+        Get the ID of a row by its natural key through the entity cache, loading it on a miss
+        :param table: name of the table
+        :param key: natural key of the row (e.g. its name)
+        :param loader: function reading the ID from the database
+        :return: ID of the row
+        """
+        if self.__cache is None or self.in_snapshot():
+            return loader()
+        self.__poll_changes()
+        entity_id = self.__cache.get_id(table, key)
+        if entity_id is not None:
+            return entity_id
+        generation = self.__cache.get_generation()
+        entity_id = loader()
+        if entity_id is not None and not self.in_transaction():
+            self.__cache.put_id(table, key, entity_id, generation)
+        return entity_id
+
+    def invalidate_cached(self, table, entity_id=None):
+        """
+        Drop a written row from the entity cache
+        Inside a transaction the row is dropped again when the transaction ends, so that
+        rows read by other threads before the commit do not outlive it
+        :param table: name of the table
+        :param entity_id: ID of the row, None to drop the whole table
+        :return: None
+        """
+        if self.__cache is None:
+            return
+        self.__drop_cached(table, entity_id)
+        if self.in_transaction():
+            self.__local.invalidated.append((table, entity_id))
+
+    def __drop_cached(self, table, entity_id):
+        """
+        Drop a row or a whole table from the entity cache
+        :param table: name of the table
+        :param entity_id: ID of the row, None for the whole table
+        :return: None
+        """
+        registry = self.__name_registries.get(table)
+        if entity_id is None:
+            self.__cache.invalidate_table(table)
+            if registry is not None:
+                registry.invalidate()
+        else:
+            self.__cache.invalidate(table, entity_id)
+            if registry is not None:
+                registry.discard(entity_id)
+
+    def __end_invalidations(self):
+        """
+        Drop the rows written by the transaction that just ended once more
+        :return: None
+        """
+        invalidated = getattr(self.__local, "invalidated", None)
+        self.__local.invalidated = []
+        for table, entity_id in invalidated or ():
+            self.__drop_cached(table, entity_id)
+
+    def get_profile(self):
+        """
+        Get the name of the performance profile in use
+        :return: name of the profile
+        """
+        return self.__profile
+
+    def connect(self):
+        """
+        Connect to the database
+        """
+        if self.__pool:
+            self.__pool.close()
+        if self.__read_pool:
+            self.__read_pool.close()
+        self.__pool = ConnectionPool(
+            self.__create_connection,
+            size=self.__pool_size,
+            timeout=self.__pool_timeout
+        )
+        # Read-only connections are only created when a snapshot is taken
+        self.__read_pool = ConnectionPool(
+            self.__create_read_connection,
+            size=self.__pool_size,
+            timeout=self.__pool_timeout
+        )
+        with self.__cache_seq_lock:
+            self.__cache_seq = None
 
     def close(self):
         """
         Close the database
         """
-        if not self.__connection:
+        if not self.__pool:
+            raise DatabaseError("Database connection is not initialized")
+        self.stop_write_queue()
+        self.__pool.close()
+        self.__read_pool.close()
+        if self.__cache:
+            self.__cache.clear()
+        for registry in self.__name_registries.values():
+            registry.invalidate()
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager providing a connection for the current thread
+        The connection pinned to the thread is reused, otherwise one is checked out of the pool
+        :return: None
+        """
+        if not self.__pool:
             raise DatabaseError("Database connection is not initialized")
-        self.__connection.close()
+        pinned = getattr(self.__local, "connection", None)
+        if pinned is not None:
+            yield pinned
+            return
+        with self.__pool.connection() as connection:
+            self.__prepare_connection(connection)
+            self.__check_changes(connection)
+            yield connection
+
+    def __prepare_connection(self, connection):
+        """
+        Install or remove the trace callback of a checked out connection
+        :param connection: sqlite3 connection
+        :return: None
+        """
+        stats = self.__query_stats
+        connection.set_trace_callback(stats.trace if stats else None)
+
+    def __pin_connection(self):
+        """
+        Check out a connection and pin it to the current thread
+        :return: the pinned connection
+        """
+        if not self.__pool:
+            raise DatabaseError("Database connection is not initialized")
+        if getattr(self.__local, "connection", None) is None:
+            connection = self.__pool.checkout()
+            self.__prepare_connection(connection)
+            self.__local.connection = connection
+        return self.__local.connection
+
+    def __unpin_connection(self):
+        """
+        Return the connection pinned to the current thread to the pool
+        A connection held by hold_connection() stays pinned until the block ends
+        :return: None
+        """
+        if getattr(self.__local, "held", False):
+            return
+        connection = getattr(self.__local, "connection", None)
+        if connection is not None:
+            self.__local.connection = None
+            self.__pool.checkin(connection)
+
+    @contextmanager
+    def hold_connection(self):
+        """
+        Context manager running all statements and transactions of the current thread in the block
+        on one connection, so that get_data_version() only changes when another connection commits
+        Nested blocks and blocks inside a transaction reuse the connection already pinned
+        :raises DatabaseError: if the current thread reads from a snapshot
+        :return: None
+        """
+        if getattr(self.__local, "snapshot", False):
+            raise DatabaseError("Cannot hold a connection inside a read-only snapshot")
+        if getattr(self.__local, "connection", None) is not None:
+            yield
+            return
+        self.__pin_connection()
+        self.__local.held = True
+        try:
+            yield
+        finally:
+            self.__local.held = False
+            if not self.in_transaction():
+                self.__unpin_connection()
+
+    def get_data_version(self):
+        """
+        Get PRAGMA data_version of the connection of the current thread
+        The value changes whenever another connection, also one of another process, commits
+        It is only comparable between reads on the same connection, see hold_connection()
+        :return: data version
+        """
+        with self.connection() as connection:
+            return connection.execute("PRAGMA data_version").fetchone()[0]
+
+    @contextmanager
+    def snapshot(self):
+        """
+        Context manager giving the current thread a consistent read-only view of the database
+        The view is taken when the block starts, commits made meanwhile by other connections
+        are not visible until the block ends, and they are not blocked by it (WAL mode)
+        Queries run by models inside the block read the snapshot, writes raise DatabaseError
+        Nested snapshots reuse the outer one
+        :raises DatabaseError: if a transaction is open on the current thread
+        :return: None
+        """
+        if not self.__read_pool:
+            raise DatabaseError("Database connection is not initialized")
+        if getattr(self.__local, "snapshot", False):
+            yield
+            return
+        if getattr(self.__local, "connection", None) is not None:
+            raise DatabaseError("Cannot take a snapshot inside a transaction")
+        connection = self.__read_pool.checkout()
+        try:
+            self.__prepare_connection(connection)
+            # A deferred transaction only takes its snapshot at the first read, so read right away
+            connection.execute("BEGIN")
+            connection.execute("SELECT count(*) FROM sqlite_master").fetchone()
+        except sqlite3.Error as e:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            self.__read_pool.checkin(connection)
+            raise DatabaseError(f"Failed to take a snapshot: {str(e)}")
+        self.__local.connection = connection
+        self.__local.snapshot = True
+        try:
+            yield
+        finally:
+            self.__local.connection = None
+            self.__local.snapshot = False
+            try:
+                connection.execute("ROLLBACK")
+            finally:
+                self.__read_pool.checkin(connection)
+
+    def in_snapshot(self):
+        """
+        Check whether the current thread reads from a snapshot
+        :return: True if inside snapshot(), False otherwise
+        """
+        return getattr(self.__local, "snapshot", False)
+
+    def get_pool_stats(self):
+        """
+        Get metrics of the connection pool
+        :return: dictionary with pool size, connections in use, checkouts and wait times
+        """
+        if not self.__pool:
+            raise DatabaseError("Database connection is not initialized")
+        return self.__pool.get_stats()
+
+    def enable_instrumentation(self, slow_query_threshold=0.1):
+        """
+        Start collecting per statement timings, slow queries and user action reports
+        :param slow_query_threshold: seconds above which a query is logged with its query plan
+        :return: the QueryStats collecting the statistics
+        """
+        if self.__query_stats is None:
+            self.__query_stats = QueryStats(slow_query_threshold=slow_query_threshold)
+        else:
+            self.__query_stats.slow_query_threshold = slow_query_threshold
+        return self.__query_stats
+
+    def disable_instrumentation(self):
+        """
+        Stop collecting query statistics
+        :return: the QueryStats collected so far, or None if instrumentation was not enabled
+        """
+        stats = self.__query_stats
+        self.__query_stats = None
+        return stats
+
+    def get_query_stats(self):
+        """
+        Get the collector of query statistics
+        :return: QueryStats, or None if instrumentation is not enabled
+        """
+        return self.__query_stats
+
+    def action(self, name):
+        """
+        Context manager grouping the queries of the current thread under a user action
+        Does nothing unless instrumentation is enabled
+        :param name: name of the action
+        :return: context manager
+        """
+        stats = self.__query_stats
+        return stats.action(name) if stats else nullcontext()
+
+    @contextmanager
+    def __measure(self, connection, sql, params, explain=True):
+        """
+        Time a statement and record it if instrumentation is enabled
+        :param connection: connection the statement runs on
+        :param sql: sql statement
+        :param params: parameters of the statement
+        :param explain: whether the query plan can be captured when the statement is slow
+        :return: None
+        """
+        stats = self.__query_stats
+        if stats is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stats.record(
+                sql,
+                params,
+                time.perf_counter() - start,
+                explain=(lambda: self.__explain(connection, sql, params)) if explain else None
+            )
+
+    def __explain(self, connection, sql, params):
+        """
+        Capture the query plan of a statement
+        :param connection: connection the statement ran on
+        :param sql: sql statement
+        :param params: parameters of the statement
+        :return: list of plan steps
+        """
+        cursor = connection.cursor()
+        cursor.row_factory = None
+        rows = cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+        return [detail for _, _, _, detail in rows]
+
+    def start_write_queue(self, window=0.002, max_batch=256):
+        """
+        Start a single writer thread that group commits the jobs given to submit_write()
+        The write queue is opt-in: the models and services write directly on the calling thread,
+        only the writes handed to submit_write() go through the queue (e.g. bulk imports or
+        background taggers writing many small jobs concurrently)
+        :param window: seconds the writer waits for more jobs before committing a batch
+        :param max_batch: maximum number of jobs committed together
+        :return: None
+        """
+        if self.__write_queue is not None and self.__write_queue.is_running():
+            return
+        self.__write_queue = WriteQueue(self, window=window, max_batch=max_batch)
+        self.__write_queue.start()
+
+    def stop_write_queue(self):
+        """
+        Commit the queued write jobs and stop the writer thread
+        :return: None
+        """
+        if self.__write_queue is not None:
+            self.__write_queue.stop()
+
+    def get_write_queue_stats(self):
+        """
+        Get metrics of the write queue
+        :return: dictionary of metrics, or None if the write queue was never started
+        """
+        return self.__write_queue.get_stats() if self.__write_queue else None
+
+    def submit_write(self, fn, *args, **kwargs):
+        """
+        Run a write job, through the writer thread if the write queue is running
+        Jobs arriving close together are committed in one transaction (group commit)
+        :param fn: callable performing the writes, e.g. a model method
+        :return: Future of the result of fn, resolved once the job is committed
+        """
+        write_queue = self.__write_queue
+        if write_queue is not None and write_queue.is_running() and not write_queue.is_writer_thread():
+            return write_queue.submit(fn, *args, **kwargs)
+        # Without a writer thread (or from inside a job) the job runs right away in its own transaction
+        future = Future()
+        try:
+            with self.transaction():
+                result = fn(*args, **kwargs)
+            future.set_result(result)
+        except Exception as e:
+            future.set_exception(e)
+        return future
 
     def commit(self):
         """
         Commit changes to the database
+        Statements outside transaction() are committed on their own, so this only
+        matters for transactions opened by hand with begin_transaction()
+        :raises DatabaseError: if called inside a transaction() block, which commits when it ends
         """
-        if not self.__connection:
-            raise DatabaseError("Database connection is not initialized")
-        self.__connection.commit()
+        if getattr(self.__local, "blocks", 0) > 0:
+            raise DatabaseError("Cannot commit inside a transaction() block, it is committed when the block ends")
+        while self.in_transaction():
+            self.commit_transaction()
 
     def execute(self, sql, params=None):
         """
         Execute a SQL statement on the database
+        The statement is committed immediately unless a transaction is open on this thread,
+        in which case it is committed together with the rest of the transaction
         :param sql: sql statement to be executed
         :param params: parameters to be passed into the sql statement
-        :return: None
+        :return: number of rows inserted, updated or deleted by the statement
+        """
+        if getattr(self.__local, "snapshot", False):
+            raise DatabaseError("Cannot write inside a read-only snapshot")
+        if params is None:
+            params = []
+        with self.connection() as connection:
+            # Execute the SQL statement
+            with self.__measure(connection, sql, params):
+                if connection.in_transaction:
+                    cursor = connection.execute(sql, params)
+                else:
+                    # An autocommit statement is atomic, so it can be repeated while the database is locked
+                    cursor = run_with_retry(
+                        lambda: connection.execute(sql, params), self.__retry_policy, self.__lock_stats
+                    )
+            return cursor.rowcount
+
+    def executemany(self, sql, seq_of_params):
+        """
+        Execute a SQL statement once for every set of parameters
+        All executions are committed together (or joined to the transaction open on this thread)
+        :param sql: sql statement to be executed
+        :param seq_of_params: iterable of parameter lists
+        :return: total number of rows inserted, updated or deleted
+        """
+        with self.transaction():
+            with self.connection() as connection:
+                with self.__measure(connection, sql, None, explain=False):
+                    cursor = connection.executemany(sql, seq_of_params)
+        return cursor.rowcount
+
+    def __open_cursor(self, connection, sql, params, row_format):
+        """
+        Execute a query on a cursor whose row factory matches the row format
+        :param connection: connection to run the query on
+        :param sql: sql statement to be executed
+        :param params: parameters to be passed into the sql statement
+        :param row_format: "dict", "row", "record" or "tuple"
+        :return: the cursor
+        """
+        cursor = connection.cursor()
+        # Only "row" needs sqlite3.Row, the other formats are built from plain tuples
+        cursor.row_factory = sqlite3.Row if row_format == "row" else None
+        cursor.execute(sql, params)
+        return cursor
+
+    def __row_converter(self, cursor, row_format, record):
+        """
+        Get the function converting a fetched row into the requested format
+        :param cursor: cursor the rows are fetched from
+        :param row_format: "dict", "row", "record" or "tuple"
+        :param record: Record class of the queried table, used by the "record" format
+        :return: conversion function, or None if rows are returned as fetched
+        """
+        if row_format in ("row", "tuple"):
+            return None
+        columns = [description[0] for description in cursor.description]
+        if row_format == "record" and record is not None:
+            return record.converter(columns)
+        # Queries without a record class (e.g. joins) fall back to dictionaries
+        return lambda values: dict(zip(columns, values))
+
+    def __resolve_row_format(self, row_format):
+        """
+        Get the row format of a call, defaulting to the format of the database
+        :param row_format: row format requested by the caller or None
+        :return: the row format to use
+        """
+        if row_format is None:
+            return self.__row_format
+        if row_format not in ROW_FORMATS:
+            raise ValueError(f"Unknown row format {row_format}, expected one of {', '.join(ROW_FORMATS)}")
+        return row_format
+
+    def fetchvalue(self, sql, params=None):
+        """
+        Fetch the first column of the first row from the query result
+        :param sql: sql statement to be executed
+        :param params: parameters to be passed into the sql statement
+        :return: the value, if nothing matches the sql statement, return None
         """
-        if not self.__cursor:
-            raise DatabaseError("Cursor is not initialized. Please check the database connection")
         if params is None:
             params = []
-        # Execute the SQL statement
-        self.__cursor.execute(sql, params)
-        # Commit changes
-        self.commit()
+        with self.connection() as connection:
+            with self.__measure(connection, sql, params):
+                cursor = self.__open_cursor(connection, sql, params, "tuple")
+                result = cursor.fetchone()
+        return result[0] if result else None
 
-    def fetchone(self, sql, params=None):
+    def fetchone(self, sql, params=None, record=None, row_format=None):
         """
         Fetch one row from the query result
         :param sql: sql statement to be executed
         :param params: parameters to be passed into the sql statement
-        :return: dictionary of the result, if nothing matches the sql statement, return None
+        :param record: Record class of the queried table, used by the "record" format
+        :param row_format: overrides the row format of the database for this call
+        :return: the row (dictionary by default), if nothing matches the sql statement, return None
         """
-        if not self.__cursor:
-            raise DatabaseError("Cursor is not initialized. Please check the database connection")
         if params is None:
             params = []
-        self.__cursor.execute(sql, params)
-        result = self.__cursor.fetchone()
-        # If the result is not None, convert it to a dictionary
-        return dict(result) if result else None
+        row_format = self.__resolve_row_format(row_format)
+        with self.connection() as connection:
+            with self.__measure(connection, sql, params):
+                cursor = self.__open_cursor(connection, sql, params, row_format)
+                result = cursor.fetchone()
+            convert = self.__row_converter(cursor, row_format, record)
+        if result is None:
+            return None
+        return convert(result) if convert else result
 
-    def fetchall(self, sql, params=None):
+    def fetchall(self, sql, params=None, record=None, row_format=None):
         """
         Fetch all rows from the query result
         :param sql: sql statement to be executed
         :param params: parameters to be passed into the sql statement
-        :return: a list of dictionaries, each dictionary is one row of the result
+        :param record: Record class of the queried table, used by the "record" format
+        :param row_format: overrides the row format of the database for this call
+        :return: a list of rows (dictionaries by default)
         """
-        if not self.__cursor:
-            raise DatabaseError("Cursor is not initialized. Please check the database connection")
         if params is None:
             params = []
-        self.__cursor.execute(sql, params)
-        # Return list of dictionaries
-        return [dict(result) for result in self.__cursor.fetchall()]
+        row_format = self.__resolve_row_format(row_format)
+        with self.connection() as connection:
+            with self.__measure(connection, sql, params):
+                cursor = self.__open_cursor(connection, sql, params, row_format)
+                results = cursor.fetchall()
+            convert = self.__row_converter(cursor, row_format, record)
+        return [convert(result) for result in results] if convert else results
         
+    def iterfetch(self, sql, params=None, batch_size=500, record=None, row_format=None):
+        """
+        Iterate over the query result without loading it into memory at once
+        Rows are read from the cursor batch_size at a time, the connection is held
+        until the iteration finishes or the generator is closed
+        :param sql: sql statement to be executed
+        :param params: parameters to be passed into the sql statement
+        :param batch_size: number of rows fetched from the cursor per round trip
+        :param record: Record class of the queried table, used by the "record" format
+        :param row_format: overrides the row format of the database for this call
+        :return: generator of rows (dictionaries by default)
+        """
+        if not isinstance(batch_size, int) or batch_size <= 0:
+            raise ValueError("Batch size must be a positive integer")
+        if params is None:
+            params = []
+        row_format = self.__resolve_row_format(row_format)
+        stats = self.__query_stats
+        with self.connection() as connection:
+            # Only the time spent in SQLite is measured, not the time the caller holds the generator
+            elapsed = 0.0
+            start = time.perf_counter()
+            cursor = self.__open_cursor(connection, sql, params, row_format)
+            try:
+                convert = self.__row_converter(cursor, row_format, record)
+                while True:
+                    results = cursor.fetchmany(batch_size)
+                    elapsed += time.perf_counter() - start
+                    if not results:
+                        break
+                    if convert:
+                        results = map(convert, results)
+                    yield from results
+                    start = time.perf_counter()
+            finally:
+                cursor.close()
+                if stats is not None:
+                    stats.record(sql, params, elapsed, explain=lambda: self.__explain(connection, sql, params))
+
     def initialize(self):
         """
         Initialize the database
         :return: None
         """
         self.connect()
-        self.create_tables()
-        self.crete_indices()
+        self.migrate()
+        self.__track_changes = True
 
-    def create_tables(self):
+    def get_schema_version(self):
         """
-        Create the tables in the database
-        :return: None
+        Get the version of the schema stored in the database file
+        :return: value of PRAGMA user_version
         """
-        # Create table of notebooks
-        create_notebooks_table = """
-            CREATE TABLE IF NOT EXISTS notebooks (
-                id INTEGER PRIMARY KEY,
-                notebook_name TEXT NOT NULL UNIQUE,
-                description TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
+        return self.fetchvalue("PRAGMA user_version")
+
+    def migrate(self):
         """
-        # Create table of notes, notebook_id is a foreign key
-        create_notes_table = """
-            CREATE TABLE IF NOT EXISTS notes (
-                id INTEGER PRIMARY KEY,
-                title TEXT NOT NULL,
-                notebook_id INTEGER NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (notebook_id) REFERENCES notebooks (id) ON DELETE CASCADE
-                UNIQUE (title, notebook_id)
-            )
+        Apply the migrations newer than the schema version of the database file
+        Nothing is executed if the schema is already up to date
+        :raises DatabaseError: if a migration fails
+        :return: list of versions that were applied
         """
-        # Create table of tags
-        create_tags_table = """
-            CREATE TABLE IF NOT EXISTS tags (
-                id INTEGER PRIMARY KEY,
-                tag_name TEXT NOT NULL UNIQUE
-            )
+        if self.get_schema_version() >= SCHEMA_VERSION:
+            return []
+        applied = []
+        analyze = False
+        for migration in MIGRATIONS:
+            try:
+                if migration.transactional:
+                    # BEGIN IMMEDIATE takes the write lock, so concurrent instances migrate one at a time
+                    with self.connection() as connection:
+                        run_with_retry(
+                            lambda: connection.execute("BEGIN IMMEDIATE"), self.__retry_policy, self.__lock_stats
+                        )
+                        try:
+                            # Another instance may have applied the migration in the meantime
+                            if connection.execute("PRAGMA user_version").fetchone()[0] >= migration.version:
+                                connection.execute("ROLLBACK")
+                                continue
+                            for statement in migration.statements:
+                                connection.execute(statement)
+                            if migration.backfill is not None:
+                                migration.backfill(connection, self.__base_path)
+                            connection.execute(f"PRAGMA user_version = {int(migration.version)}")
+                            connection.execute("COMMIT")
+                        except Exception:
+                            connection.execute("ROLLBACK")
+                            raise
+                else:
+                    if self.get_schema_version() >= migration.version:
+                        continue
+                    with self.connection() as connection:
+                        for statement in migration.statements:
+                            connection.execute(statement)
+                        if migration.backfill is not None:
+                            migration.backfill(connection, self.__base_path)
+                        connection.execute(f"PRAGMA user_version = {int(migration.version)}")
+            except sqlite3.Error as e:
+                raise DatabaseError(
+                    f"Failed to apply migration {migration.version} ({migration.description}): {str(e)}"
+                )
+            applied.append(migration.version)
+            analyze = analyze or migration.analyze
+        if analyze:
+            # Refresh the statistics used by the query planner for the new indexes
+            self.execute("ANALYZE")
+        return applied
+
+    def get_change_seq(self):
         """
-        # Create association table for notes and tags
-        create_note_tags_table = """
-            CREATE TABLE IF NOT EXISTS note_tags (
-                note_id INTEGER,
-                tag_id INTEGER,
-                PRIMARY KEY (note_id, tag_id),
-                FOREIGN KEY (note_id) REFERENCES notes (id) ON DELETE CASCADE,
-                FOREIGN KEY (tag_id) REFERENCES tags (id) ON DELETE CASCADE
-            )
+        Get the sequence number of the latest change
+        Consumers doing a full scan first read this number, then follow changes_since() from it
+        :return: latest sequence number, 0 if nothing was changed yet
         """
-        # Execute creation
-        self.execute(create_notebooks_table)
-        self.execute(create_notes_table)
-        self.execute(create_tags_table)
-        self.execute(create_note_tags_table)
+        seq = self.fetchvalue("SELECT seq FROM sqlite_sequence WHERE name = 'changes'")
+        return seq or 0
 
-    def crete_indices(self):
+    def changes_since(self, seq, limit=1000, tables=None):
         """
-        Create indices of the tables in the database
-        :return: None
+        Get the changes logged after a sequence number, in order
+        :param seq: sequence number of the last change already consumed (0 for all)
+        :param limit: maximum number of changes returned
+        :param tables: names of the tables to include (all if None)
+        :return: list of changes with seq, table_name, row_id, ref_id, op ("insert", "update" or "delete")
+        and changed_at, the seq of the last one is the position to continue from
         """
-        create_notebook_index = "CREATE INDEX IF NOT EXISTS notebook_name_idx ON notebooks (notebook_name)"
-        create_note_index = "CREATE INDEX IF NOT EXISTS title_idx ON notes (title)"
-        create_tag_index = "CREATE INDEX IF NOT EXISTS tag_name_idx ON tags (tag_name)"
-        # Execute creation of indices
-        self.execute(create_notebook_index)
-        self.execute(create_note_index)
-        self.execute(create_tag_index)
+        sql = "SELECT seq, table_name, row_id, ref_id, op, changed_at FROM changes WHERE seq > ?"
+        params = [seq]
+        if tables is not None:
+            sql += " AND table_name IN (SELECT value FROM json_each(?))"
+            params.append(json.dumps(list(tables)))
+        sql += " ORDER BY seq LIMIT ?"
+        params.append(limit)
+        return self.fetchall(sql, params)
+
+    def prune_changes(self, up_to_seq):
+        """
+        Delete the changes every consumer has already processed
+        :param up_to_seq: sequence number of the last change to delete
+        :return: number of deleted changes
+        """
+        with self.transaction():
+            self.execute("DELETE FROM changes WHERE seq <= ?", [up_to_seq])
+            return self.fetchvalue("SELECT changes()")
 
     def update_record(self, table, data, conditions):
         """
@@ -184,54 +1035,131 @@ class Database:
         params = list(data.values()) + list(conditions.values())
         # Execute update
         self.execute(sql, params)
+        # The conditions may match any rows, so the whole table is dropped from the cache
+        self.invalidate_cached(table)
+
+    def in_transaction(self):
+        """
+        Check whether a transaction is open on the current thread
+        :return: True if a transaction is open, False otherwise
+        """
+        return getattr(self.__local, "depth", 0) > 0
 
     def begin_transaction(self):
         """
-        Begin a transaction
+        Begin a transaction on the connection of the current thread
+        If a transaction is already open, a savepoint is created instead
         :return: None
         """
-        # Disable auto-commit
-        self.__connection.isolation_level = None
-        # Begin a transaction
-        self.__cursor.execute("BEGIN;")
+        if getattr(self.__local, "snapshot", False):
+            raise DatabaseError("Cannot write inside a read-only snapshot")
+        # The connection stays with this thread until the outermost transaction ends
+        connection = self.__pin_connection()
+        depth = getattr(self.__local, "depth", 0)
+        try:
+            if depth == 0:
+                # Take the write lock up front, a deferred transaction upgrading to a writer
+                # later fails with SQLITE_BUSY without waiting for the busy timeout
+                run_with_retry(
+                    lambda: connection.execute("BEGIN IMMEDIATE"), self.__retry_policy, self.__lock_stats
+                )
+                # Holding the write lock, every change logged until the commit is one of this transaction
+                start_seq = None
+                if self.__cache is not None and self.__track_changes:
+                    start_seq = self.__read_change_seq(connection)
+                    self.__check_changes(connection, start_seq)
+            else:
+                connection.execute(f"SAVEPOINT sp_{depth}")
+        except Exception:
+            if depth == 0:
+                if connection.in_transaction:
+                    connection.execute("ROLLBACK")
+                self.__unpin_connection()
+            raise
+        if depth == 0:
+            self.__local.start_seq = start_seq
+            self.__local.invalidated = []
+        self.__local.depth = depth + 1
 
     def commit_transaction(self):
         """
-        Commit a transaction
+        Commit a transaction, or release the innermost savepoint
+        :raises DatabaseError: if no transaction is open
         :return: None
         """
-        # Enable auto-commit
-        self.__connection.isolation_level = ''
-        self.__connection.commit()
+        depth = getattr(self.__local, "depth", 0)
+        if depth == 0:
+            raise DatabaseError("No transaction in progress")
+        connection = self.__local.connection
+        if depth == 1:
+            # Only the outermost transaction really commits
+            start_seq = self.__local.start_seq
+            end_seq = self.__read_change_seq(connection) if start_seq is not None else None
+            connection.execute("COMMIT")
+            self.__local.depth = 0
+            self.__unpin_connection()
+            self.__end_invalidations()
+            # The changes of the transaction are already dropped from the cache, they need no replay
+            if end_seq is not None:
+                with self.__cache_seq_lock:
+                    if self.__cache_seq == start_seq:
+                        self.__cache_seq = end_seq
+        else:
+            connection.execute(f"RELEASE SAVEPOINT sp_{depth - 1}")
+            self.__local.depth = depth - 1
 
     def rollback_transaction(self):
         """
-        Rollback a transaction
+        Rollback a transaction, or rollback to the innermost savepoint
+        :raises DatabaseError: if no transaction is open
         :return: None
         """
-        self.__connection.rollback()
+        depth = getattr(self.__local, "depth", 0)
+        if depth == 0:
+            raise DatabaseError("No transaction in progress")
+        connection = self.__local.connection
+        if depth == 1:
+            try:
+                if connection.in_transaction:
+                    connection.execute("ROLLBACK")
+            finally:
+                self.__local.depth = 0
+                self.__unpin_connection()
+                self.__end_invalidations()
+        else:
+            # Undo the changes since the savepoint, then discard it
+            connection.execute(f"ROLLBACK TO SAVEPOINT sp_{depth - 1}")
+            connection.execute(f"RELEASE SAVEPOINT sp_{depth - 1}")
+            self.__local.depth = depth - 1
         
     @contextmanager
     def transaction(self):
         """
         Context manager for database transactions
+        All statements in the block are committed together, nested blocks become savepoints
         :return: None
         """
         # Checking conditions before beginning a transaction
-        if not self.__connection:
+        if not self.__pool:
             raise DatabaseError("Database connection is not initialized")
-        if not self.__cursor:
-            raise DatabaseError("Cursor is not initialized. Please check the database connection")
+        # Begin a transaction
+        self.begin_transaction()
+        # Open transaction() blocks, commit() must not end their levels
+        self.__local.blocks = getattr(self.__local, "blocks", 0) + 1
         try:
-            # Begin a transaction
-            self.begin_transaction()
             yield # Back to the with block to execute sql operations
-            # Commit if successful, other wise jump to the except block
-            self.commit_transaction()
-        except Exception:
+        except BaseException:
             # Rollback if an error occurs
+            self.__local.blocks -= 1
             self.rollback_transaction()
             raise # Raise the error
+        self.__local.blocks -= 1
+        try:
+            # Commit if successful
+            self.commit_transaction()
+        except Exception:
+            self.rollback_transaction()
+            raise
         
     def get_base_path(self):
         """
@@ -239,3 +1167,10 @@ class Database:
         :return: base path
         """
         return self.__base_path
+
+    def get_db_path(self):
+        """
+        Get the path of the database file
+        :return: path of the database file
+        """
+        return self.__db_path
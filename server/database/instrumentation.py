@@ -0,0 +1,204 @@
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Upper bounds (in seconds) of the latency histogram buckets, the last bucket is unbounded
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, float("inf"))
+
+_WHITESPACE = re.compile(r"\s+")
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_PARAMETER_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+
+def normalize_sql(sql):
+    """
+    Normalize a SQL statement so that statements differing only in literals are grouped together
+    :param sql: sql statement
+    :return: normalized statement
+    """
+    sql = _STRING_LITERAL.sub("?", sql)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    sql = _WHITESPACE.sub(" ", sql).strip()
+    # IN lists of any length count as the same statement
+    return _PARAMETER_LIST.sub("IN (?)", sql)
+
+class _StatementStats:
+    """
+    Count and latency histogram of one normalized statement
+    """
+    __slots__ = ("count", "total_time", "max_time", "histogram")
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.histogram = [0] * len(LATENCY_BUCKETS)
+
+    def add(self, elapsed):
+        self.count += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if elapsed <= bound:
+                self.histogram[i] += 1
+                break
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "total_time": self.total_time,
+            "avg_time": self.total_time / self.count if self.count else 0.0,
+            "max_time": self.max_time,
+            "histogram": {
+                ("inf" if bound == float("inf") else f"<={bound}"): count
+                for bound, count in zip(LATENCY_BUCKETS, self.histogram)
+            }
+        }
+
+class QueryStats:
+    def __init__(self, slow_query_threshold=0.1, max_slow_queries=100, max_actions=100):
+        """
+        Initialize the collector of query statistics
+        :param slow_query_threshold: seconds above which a query is logged together with its plan
+        :param max_slow_queries: number of slow queries kept (oldest are dropped first)
+        :param max_actions: number of user action reports kept (oldest are dropped first)
+        """
+        self.slow_query_threshold = slow_query_threshold
+        self.__lock = threading.Lock()
+        self.__statements = {}
+        self.__traced = {}
+        self.__slow_queries = deque(maxlen=max_slow_queries)
+        self.__actions = deque(maxlen=max_actions)
+        # Action currently running on each thread
+        self.__local = threading.local()
+
+    def record(self, sql, params, elapsed, explain=None):
+        """
+        Record one statement executed through the Database wrappers
+        :param sql: sql statement
+        :param params: parameters of the statement
+        :param elapsed: seconds spent executing and fetching
+        :param explain: callable returning the query plan, only called for slow queries
+        :return: None
+        """
+        normalized = normalize_sql(sql)
+        with self.__lock:
+            self.__statements.setdefault(normalized, _StatementStats()).add(elapsed)
+        action = getattr(self.__local, "action", None)
+        if action is not None:
+            action["queries"] += 1
+            action["query_time"] += elapsed
+            action["statements"][normalized] = action["statements"].get(normalized, 0) + 1
+        if elapsed >= self.slow_query_threshold:
+            plan = None
+            if explain is not None:
+                try:
+                    plan = explain()
+                except Exception as e:
+                    plan = [f"Failed to explain query: {str(e)}"]
+            with self.__lock:
+                self.__slow_queries.append({
+                    "sql": normalized,
+                    "params": list(params) if params else [],
+                    "elapsed": elapsed,
+                    "plan": plan,
+                    "action": action["name"] if action else None
+                })
+
+    def trace(self, statement):
+        """
+        Record a statement reported by sqlite3's trace callback
+        This also counts statements issued implicitly (BEGIN, COMMIT, SAVEPOINT, PRAGMA)
+        :param statement: expanded sql statement
+        :return: None
+        """
+        normalized = normalize_sql(statement)
+        with self.__lock:
+            self.__traced[normalized] = self.__traced.get(normalized, 0) + 1
+        action = getattr(self.__local, "action", None)
+        if action is not None:
+            action["traced"] += 1
+
+    @contextmanager
+    def action(self, name):
+        """
+        Group all queries run by the current thread under a user action
+        :param name: name of the action (e.g. "open note")
+        :return: None
+        """
+        parent = getattr(self.__local, "action", None)
+        if parent is not None:
+            # Nested actions are reported as part of the outer action
+            yield
+            return
+        action = {"name": name, "queries": 0, "traced": 0, "query_time": 0.0, "statements": {}}
+        self.__local.action = action
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.__local.action = None
+            action["wall_time"] = time.perf_counter() - start
+            with self.__lock:
+                self.__actions.append(action)
+
+    def get_report(self):
+        """
+        Get the collected statistics
+        :return: dictionary with per statement stats, traced statement counts, slow queries and action reports
+        """
+        with self.__lock:
+            return {
+                "statements": {
+                    sql: stats.to_dict()
+                    for sql, stats in sorted(
+                        self.__statements.items(), key=lambda item: item[1].total_time, reverse=True
+                    )
+                },
+                "traced": dict(self.__traced),
+                "slow_queries": list(self.__slow_queries),
+                "actions": [dict(action, statements=dict(action["statements"])) for action in self.__actions]
+            }
+
+    def format_report(self, top=20):
+        """
+        Format the collected statistics as readable text
+        :param top: number of statements listed (ordered by total time)
+        :return: the report
+        """
+        report = self.get_report()
+        lines = ["Statements by total time:"]
+        for sql, stats in list(report["statements"].items())[:top]:
+            lines.append(
+                f"  {stats['count']:>7} calls {stats['total_time'] * 1000:>10.2f} ms total "
+                f"{stats['avg_time'] * 1000:>8.3f} ms avg {stats['max_time'] * 1000:>8.3f} ms max  {sql}"
+            )
+        if report["slow_queries"]:
+            lines.append(f"Slow queries (>= {self.slow_query_threshold * 1000:.0f} ms):")
+            for query in report["slow_queries"]:
+                lines.append(f"  {query['elapsed'] * 1000:.2f} ms  {query['sql']}")
+                for step in query["plan"] or []:
+                    lines.append(f"      {step}")
+        if report["actions"]:
+            lines.append("User actions:")
+            for action in report["actions"]:
+                lines.append(
+                    f"  {action['name']}: {action['queries']} queries ({action['traced']} traced statements), "
+                    f"{action['query_time'] * 1000:.2f} ms in queries, {action['wall_time'] * 1000:.2f} ms wall"
+                )
+                for sql, count in sorted(action["statements"].items(), key=lambda item: -item[1]):
+                    lines.append(f"      {count:>5} x {sql}")
+        return "\n".join(lines)
+
+    def reset(self):
+        """
+        Discard all collected statistics
+        :return: None
+        """
+        with self.__lock:
+            self.__statements.clear()
+            self.__traced.clear()
+            self.__slow_queries.clear()
+            self.__actions.clear()
@@ -0,0 +1,270 @@
+"""
+Database maintenance: incremental vacuum, WAL checkpoint, ANALYZE and PRAGMA optimize
+
+Usage: python -m server.database.maintenance <base_path> [step ...]
+"""
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from server.application.exceptions import DatabaseError
+
+# Steps run when none are given, in order
+# Freed pages are moved to the end of the file by incremental_vacuum, the checkpoint then writes them back
+DEFAULT_STEPS = ("incremental_vacuum", "checkpoint", "optimize")
+STEPS = ("incremental_vacuum", "checkpoint", "analyze", "optimize")
+
+class Maintenance:
+    def __init__(self, db):
+        """
+        Initialize the maintenance routine of a database
+        :param db: connection to the database
+        """
+        self.__db = db
+        self.__lock = threading.Lock()
+
+    def __file_size(self, suffix=""):
+        """
+        Get the size of the database file or one of its companion files
+        :param suffix: "" for the database file, "-wal" for the write-ahead log
+        :return: size in bytes, 0 if the file does not exist
+        """
+        try:
+            return os.path.getsize(f"{self.__db.get_db_path()}{suffix}")
+        except OSError:
+            return 0
+
+    def __page_stats(self):
+        """
+        Get the page size, page count and number of free pages
+        :return: (page_size, page_count, freelist_count)
+        """
+        return (
+            self.__db.fetchvalue("PRAGMA page_size"),
+            self.__db.fetchvalue("PRAGMA page_count"),
+            self.__db.fetchvalue("PRAGMA freelist_count")
+        )
+
+    def __incremental_vacuum(self):
+        """
+        Return the free pages of the database to the file system
+        :return: (bytes reclaimed, details)
+        """
+        page_size, page_count, free_pages = self.__page_stats()
+        # sqlite3 steps a statement without result columns only once, which frees a single page,
+        # executescript steps it until all free pages are released
+        with self.__db.connection() as connection:
+            connection.executescript("PRAGMA incremental_vacuum;")
+        _, page_count_after, free_pages_after = self.__page_stats()
+        return (page_count - page_count_after) * page_size, {
+            "auto_vacuum": self.__db.fetchvalue("PRAGMA auto_vacuum"),
+            "free_pages_before": free_pages,
+            "free_pages_after": free_pages_after
+        }
+
+    def __checkpoint(self):
+        """
+        Copy the pages of the write-ahead log into the database file without blocking readers or writers
+        A passive checkpoint does not shrink the log file, later commits reuse it from the start,
+        so space is only reclaimed if the log was truncated meanwhile
+        :return: (bytes reclaimed from the log file, details)
+        """
+        wal_size = self.__file_size("-wal")
+        busy, log_frames, checkpointed = self.__db.fetchone("PRAGMA wal_checkpoint(PASSIVE)", row_format="tuple")
+        wal_size_after = self.__file_size("-wal")
+        return max(wal_size - wal_size_after, 0), {
+            "busy": bool(busy),
+            "log_frames": log_frames,
+            "checkpointed_frames": checkpointed,
+            "checkpointed_bytes": max(checkpointed, 0) * self.__db.fetchvalue("PRAGMA page_size"),
+            "wal_size_before": wal_size,
+            "wal_size_after": wal_size_after
+        }
+
+    def __analyze(self):
+        """
+        Rebuild the statistics of all tables and indexes
+        :return: (bytes reclaimed, details)
+        """
+        self.__db.execute("ANALYZE")
+        return 0, {}
+
+    def __optimize(self):
+        """
+        Let SQLite analyze the tables whose statistics are missing or stale
+        :return: (bytes reclaimed, details)
+        """
+        self.__db.fetchall("PRAGMA optimize", row_format="tuple")
+        return 0, {}
+
+    def run(self, steps=None):
+        """
+        Run maintenance steps and log them in the maintenance_log table
+        :param steps: names of the steps to run (DEFAULT_STEPS if None)
+        :raises ValueError: if a step is unknown
+        :raises DatabaseError: if a step fails
+        :return: list of step reports with name, duration in seconds, bytes reclaimed and details
+        """
+        steps = DEFAULT_STEPS if steps is None else tuple(steps)
+        unknown = [step for step in steps if step not in STEPS]
+        if unknown:
+            raise ValueError(f"Unknown maintenance steps {', '.join(unknown)}, expected any of {', '.join(STEPS)}")
+        handlers = {
+            "incremental_vacuum": self.__incremental_vacuum,
+            "checkpoint": self.__checkpoint,
+            "analyze": self.__analyze,
+            "optimize": self.__optimize
+        }
+        reports = []
+        # Concurrent runs (scheduler and CLI in the same process) would only repeat the work
+        with self.__lock:
+            for step in steps:
+                start = time.perf_counter()
+                try:
+                    reclaimed, details = handlers[step]()
+                except (DatabaseError, sqlite3.Error) as e:
+                    raise DatabaseError(f"Maintenance step {step} failed: {str(e)}")
+                report = {
+                    "step": step,
+                    "duration": time.perf_counter() - start,
+                    "bytes_reclaimed": reclaimed,
+                    "details": details
+                }
+                self.__db.execute(
+                    "INSERT INTO maintenance_log (step, duration, bytes_reclaimed, details) VALUES (?, ?, ?, ?)",
+                    [step, report["duration"], reclaimed, json.dumps(details)]
+                )
+                reports.append(report)
+        return reports
+
+    def get_history(self, limit=20):
+        """
+        Get the latest logged maintenance steps
+        :param limit: maximum number of steps
+        :return: list of logged steps, newest first
+        """
+        return self.__db.fetchall(
+            "SELECT * FROM maintenance_log ORDER BY id DESC LIMIT ?",
+            [limit]
+        )
+
+class MaintenanceScheduler:
+    def __init__(self, db, interval=3600.0, idle_time=30.0, poll_interval=5.0, steps=None):
+        """
+        Run the maintenance routine in a background thread while the database is idle
+        The database counts as idle when no connection was checked out of its pool for idle_time seconds
+        :param db: connection to the database
+        :param interval: minimum seconds between two maintenance runs
+        :param idle_time: seconds without database activity before a run may start
+        :param poll_interval: seconds between two activity checks
+        :param steps: names of the steps to run (DEFAULT_STEPS if None)
+        """
+        self.__db = db
+        self.__maintenance = Maintenance(db)
+        self.__interval = interval
+        self.__idle_time = idle_time
+        self.__poll_interval = poll_interval
+        self.__steps = steps
+        self.__stop = threading.Event()
+        self.__thread = None
+        self.__last_reports = []
+        self.__last_error = None
+
+    def start(self):
+        """
+        Start the scheduler thread
+        :return: None
+        """
+        if self.__thread is not None:
+            return
+        self.__stop.clear()
+        self.__thread = threading.Thread(target=self.__run, name="knowgent-db-maintenance", daemon=True)
+        self.__thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Stop the scheduler thread, a running maintenance step is completed first
+        :param timeout: seconds to wait for the thread
+        :return: None
+        """
+        thread = self.__thread
+        if thread is None:
+            return
+        self.__thread = None
+        self.__stop.set()
+        thread.join(timeout)
+
+    def get_last_reports(self):
+        """
+        Get the reports of the last maintenance run
+        :return: list of step reports, empty if maintenance has not run yet
+        """
+        return list(self.__last_reports)
+
+    def get_last_error(self):
+        """
+        Get the error of the last failed maintenance run
+        :return: error message, None if the last run succeeded
+        """
+        return self.__last_error
+
+    def __activity(self):
+        """
+        Get a counter that changes whenever the database is used
+        :return: (number of checkouts, connections in use)
+        """
+        stats = self.__db.get_pool_stats()
+        return stats["checkouts"], stats["in_use"]
+
+    def __run(self):
+        """
+        Main loop of the scheduler thread
+        :return: None
+        """
+        last_run = time.monotonic()
+        checkouts, _ = self.__activity()
+        idle_since = time.monotonic()
+        while not self.__stop.wait(self.__poll_interval):
+            try:
+                current, in_use = self.__activity()
+            except DatabaseError:
+                # The database was closed
+                return
+            now = time.monotonic()
+            if current != checkouts or in_use:
+                checkouts = current
+                idle_since = now
+                continue
+            if now - idle_since < self.__idle_time or now - last_run < self.__interval:
+                continue
+            try:
+                self.__last_reports = self.__maintenance.run(self.__steps)
+                self.__last_error = None
+            except Exception as e:
+                self.__last_error = str(e)
+            last_run = time.monotonic()
+            # The checkouts of the maintenance run itself are not user activity
+            try:
+                checkouts, _ = self.__activity()
+            except DatabaseError:
+                return
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__.strip())
+        sys.exit(1)
+    from server.database.database import Database
+    db = Database(sys.argv[1])
+    try:
+        for report in Maintenance(db).run(sys.argv[2:] or None):
+            print(
+                f"{report['step']:<20}{report['duration'] * 1000:>10.2f} ms"
+                f"{report['bytes_reclaimed'] / 1024:>12.1f} KiB reclaimed  {report['details']}"
+            )
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+import os
+from pathlib import Path
+
+class Migration:
+    def __init__(self, version, description, statements, analyze=False, transactional=True, backfill=None):
+        """
+        A numbered schema change, applied once and recorded in PRAGMA user_version
+        :param version: schema version reached after the migration
+        :param description: short description of the change
+        :param statements: list of sql statements
+        :param analyze: run ANALYZE after the migration (e.g. after creating indexes)
+        :param transactional: False for statements that cannot run inside a transaction (e.g. VACUUM)
+        :param backfill: function run after the statements with the connection and the base path of the
+                         repository, for data that is not in the database (e.g. taken from the note files)
+        """
+        self.version = version
+        self.description = description
+        self.statements = statements
+        self.analyze = analyze
+        self.transactional = transactional
+        self.backfill = backfill
+
+def backfill_note_sizes(connection, base_path):
+    """
+    Set the size of the existing notes from their files, the notebook counters follow through the triggers
+    :param connection: connection running the migration
+    :param base_path: the path containing all notebooks and notes
+    :return: None
+    """
+    rows = connection.execute(
+        "SELECT notes.id, notebooks.notebook_name, notes.title "
+        "FROM notes JOIN notebooks ON notebooks.id = notes.notebook_id"
+    ).fetchall()
+    sizes = []
+    for note_id, notebook_name, title in rows:
+        try:
+            sizes.append((os.stat(Path(base_path) / notebook_name / f"{title}.md").st_size, note_id))
+        except OSError:
+            # Missing files keep size 0
+            continue
+    connection.executemany("UPDATE notes SET size = ? WHERE id = ?", sizes)
+
+MIGRATIONS = [
+    Migration(1, "Create tables and name indices", [
+        # Create table of notebooks
+        """
+        CREATE TABLE IF NOT EXISTS notebooks (
+            id INTEGER PRIMARY KEY,
+            notebook_name TEXT NOT NULL UNIQUE,
+            description TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        # Create table of notes, notebook_id is a foreign key
+        """
+        CREATE TABLE IF NOT EXISTS notes (
+            id INTEGER PRIMARY KEY,
+            title TEXT NOT NULL,
+            notebook_id INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (notebook_id) REFERENCES notebooks (id) ON DELETE CASCADE
+            UNIQUE (title, notebook_id)
+        )
+        """,
+        # Create table of tags
+        """
+        CREATE TABLE IF NOT EXISTS tags (
+            id INTEGER PRIMARY KEY,
+            tag_name TEXT NOT NULL UNIQUE
+        )
+        """,
+        # Create association table for notes and tags
+        """
+        CREATE TABLE IF NOT EXISTS note_tags (
+            note_id INTEGER,
+            tag_id INTEGER,
+            PRIMARY KEY (note_id, tag_id),
+            FOREIGN KEY (note_id) REFERENCES notes (id) ON DELETE CASCADE,
+            FOREIGN KEY (tag_id) REFERENCES tags (id) ON DELETE CASCADE
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS notebook_name_idx ON notebooks (notebook_name)",
+        "CREATE INDEX IF NOT EXISTS title_idx ON notes (title)",
+        "CREATE INDEX IF NOT EXISTS tag_name_idx ON tags (tag_name)"
+    ]),
+    Migration(2, "Covering indexes for notes of a notebook and notes of a tag", [
+        # get_all_notes_in_notebook and title lookups inside a notebook
+        "CREATE INDEX IF NOT EXISTS notes_notebook_title_idx ON notes (notebook_id, title)",
+        # get_notes_for_tag, the primary key only covers (note_id, tag_id)
+        "CREATE INDEX IF NOT EXISTS note_tags_tag_note_idx ON note_tags (tag_id, note_id)"
+    ], analyze=True),
+    Migration(3, "Remove rows orphaned while foreign keys were not enforced", [
+        "DELETE FROM notes WHERE notebook_id NOT IN (SELECT id FROM notebooks)",
+        "DELETE FROM note_tags WHERE note_id NOT IN (SELECT id FROM notes) OR tag_id NOT IN (SELECT id FROM tags)"
+    ]),
+    Migration(4, "Switch to incremental auto vacuum", [
+        # Changing auto_vacuum of an existing database only takes effect after a full VACUUM
+        "PRAGMA auto_vacuum = INCREMENTAL",
+        "VACUUM"
+    ], transactional=False),
+    Migration(5, "Log of maintenance runs", [
+        """
+        CREATE TABLE IF NOT EXISTS maintenance_log (
+            id INTEGER PRIMARY KEY,
+            step TEXT NOT NULL,
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            duration REAL NOT NULL,
+            bytes_reclaimed INTEGER NOT NULL DEFAULT 0,
+            details TEXT
+        )
+        """
+    ]),
+    Migration(6, "Change log filled by triggers", [
+        # One row per changed row, seq never goes back even after pruning (AUTOINCREMENT)
+        # note_tags rows are identified by row_id (note id) and ref_id (tag id)
+        """
+        CREATE TABLE IF NOT EXISTS changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            ref_id INTEGER,
+            op TEXT NOT NULL,
+            changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS notebooks_insert_log AFTER INSERT ON notebooks
+        BEGIN
+            INSERT INTO changes (table_name, row_id, ref_id, op) VALUES ('notebooks', NEW.id, NULL, 'insert');
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS notebooks_update_log AFTER UPDATE ON notebooks
+        BEGIN
+            INSERT INTO changes (table_name, row_id, ref_id, op) VALUES ('notebooks', NEW.id, NULL, 'update');
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS notebooks_delete_log AFTER DELETE ON notebooks
+        BEGIN
+            INSERT INTO changes (table_name, row_id, ref_id, op) VALUES ('notebooks', OLD.id, NULL, 'delete');
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS notes_insert_log AFTER INSERT ON notes
+        BEGIN
+            INSERT INTO changes (table_name, row_id, ref_id, op) VALUES ('notes', NEW.id, NULL, 'insert');
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS notes_update_log AFTER UPDATE ON notes
+        BEGIN
+            INSERT INTO changes (table_name, row_id, ref_id, op) VALUES ('notes', NEW.id, NULL, 'update');
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS notes_delete_log AFTER DELETE ON notes
+        BEGIN
+            INSERT INTO changes (table_name, row_id, ref_id, op) VALUES ('notes', OLD.id, NULL, 'delete');
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS tags_insert_log AFTER INSERT ON tags
+        BEGIN
+            INSERT INTO changes (table_name, row_id, ref_id, op) VALUES ('tags', NEW.id, NULL, 'insert');
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS tags_update_log AFTER UPDATE ON tags
+        BEGIN
+            INSERT INTO changes (table_name, row_id, ref_id, op) VALUES ('tags', NEW.id, NULL, 'update');
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS tags_delete_log AFTER DELETE ON tags
+        BEGIN
+            INSERT INTO changes (table_name, row_id, ref_id, op) VALUES ('tags', OLD.id, NULL, 'delete');
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS note_tags_insert_log AFTER INSERT ON note_tags
+        BEGIN
+            INSERT INTO changes (table_name, row_id, ref_id, op) VALUES ('note_tags', NEW.note_id, NEW.tag_id, 'insert');
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS note_tags_delete_log AFTER DELETE ON note_tags
+        BEGIN
+            INSERT INTO changes (table_name, row_id, ref_id, op) VALUES ('note_tags', OLD.note_id, OLD.tag_id, 'delete');
+        END
+        """
+    ]),
+    Migration(7, "Sync points and synced state per peer repository", [
+        # Change sequence of this repository at the last sync with each peer
+        """
+        CREATE TABLE IF NOT EXISTS sync_state (
+            peer TEXT PRIMARY KEY,
+            last_seq INTEGER NOT NULL,
+            synced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        # Items both repositories agreed on at the last sync, the base of the three-way merge
+        # mtime and size of note files let unchanged files skip hashing
+        """
+        CREATE TABLE IF NOT EXISTS sync_items (
+            peer TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            item_key TEXT NOT NULL,
+            fingerprint TEXT NOT NULL,
+            mtime REAL,
+            size INTEGER,
+            PRIMARY KEY (peer, kind, item_key)
+        ) WITHOUT ROWID
+        """
+    ]),
+    Migration(8, "Note sizes and counters of notebooks and tags maintained by triggers", [
+        # Size of the note file in bytes, set when the content is saved
+        "ALTER TABLE notes ADD COLUMN size INTEGER NOT NULL DEFAULT 0",
+        """
+        CREATE TABLE IF NOT EXISTS notebook_stats (
+            notebook_id INTEGER PRIMARY KEY,
+            note_count INTEGER NOT NULL DEFAULT 0,
+            total_size INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (notebook_id) REFERENCES notebooks (id) ON DELETE CASCADE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS tag_stats (
+            tag_id INTEGER PRIMARY KEY,
+            note_count INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (tag_id) REFERENCES tags (id) ON DELETE CASCADE
+        )
+        """,
+        # Counters of the existing rows
+        """
+        INSERT OR REPLACE INTO notebook_stats (notebook_id, note_count, total_size)
+        SELECT notebooks.id, count(notes.id), coalesce(sum(notes.size), 0)
+        FROM notebooks
+        LEFT JOIN notes ON notes.notebook_id = notebooks.id
+        GROUP BY notebooks.id
+        """,
+        """
+        INSERT OR REPLACE INTO tag_stats (tag_id, note_count)
+        SELECT tags.id, count(note_tags.note_id)
+        FROM tags
+        LEFT JOIN note_tags ON note_tags.tag_id = tags.id
+        GROUP BY tags.id
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS notebooks_insert_stats AFTER INSERT ON notebooks
+        BEGIN
+            INSERT INTO notebook_stats (notebook_id) VALUES (NEW.id);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS tags_insert_stats AFTER INSERT ON tags
+        BEGIN
+            INSERT INTO tag_stats (tag_id) VALUES (NEW.id);
+        END
+        """,
+        # Cascading deletes fire these triggers as well
+        """
+        CREATE TRIGGER IF NOT EXISTS notes_insert_stats AFTER INSERT ON notes
+        BEGIN
+            UPDATE notebook_stats SET note_count = note_count + 1, total_size = total_size + NEW.size
+            WHERE notebook_id = NEW.notebook_id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS notes_delete_stats AFTER DELETE ON notes
+        BEGIN
+            UPDATE notebook_stats SET note_count = note_count - 1, total_size = total_size - OLD.size
+            WHERE notebook_id = OLD.notebook_id;
+        END
+        """,
+        # Moving a note or saving its content
+        """
+        CREATE TRIGGER IF NOT EXISTS notes_update_stats AFTER UPDATE OF notebook_id, size ON notes
+        WHEN OLD.notebook_id IS NOT NEW.notebook_id OR OLD.size IS NOT NEW.size
+        BEGIN
+            UPDATE notebook_stats SET note_count = note_count - 1, total_size = total_size - OLD.size
+            WHERE notebook_id = OLD.notebook_id;
+            UPDATE notebook_stats SET note_count = note_count + 1, total_size = total_size + NEW.size
+            WHERE notebook_id = NEW.notebook_id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS note_tags_insert_stats AFTER INSERT ON note_tags
+        BEGIN
+            UPDATE tag_stats SET note_count = note_count + 1 WHERE tag_id = NEW.tag_id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS note_tags_delete_stats AFTER DELETE ON note_tags
+        BEGIN
+            UPDATE tag_stats SET note_count = note_count - 1 WHERE tag_id = OLD.tag_id;
+        END
+        """
+    ], backfill=backfill_note_sizes),
+    Migration(9, "Indexes for keyset pagination of notes by creation and update time", [
+        # Ordering by title already uses title_idx and notes_notebook_title_idx,
+        # every index ends with the rowid, which is the tie breaker of the pages
+        "CREATE INDEX IF NOT EXISTS notes_created_idx ON notes (created_at)",
+        "CREATE INDEX IF NOT EXISTS notes_updated_idx ON notes (updated_at)",
+        "CREATE INDEX IF NOT EXISTS notes_notebook_created_idx ON notes (notebook_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS notes_notebook_updated_idx ON notes (notebook_id, updated_at)"
+    ], analyze=True)
+]
+
+# Version of the schema after all migrations are applied
+SCHEMA_VERSION = MIGRATIONS[-1].version
@@ -0,0 +1,114 @@
+import threading
+
+class NameRegistry:
+    def __init__(self, db, table, name_column):
+        """
+        Interning map of the unique names of a table to their IDs (e.g. notebook and tag names)
+        All names are loaded with one query on first use, later lookups are dictionary lookups
+        Names missing from the map are looked up in the database, so rows created
+        since the load are found as well, the Database discards the names of rows changed by other processes
+        :param db: connection to the database
+        :param table: name of the table
+        :param name_column: column holding the unique name
+        """
+        self.__db = db
+        self.__table = table
+        self.__name_column = name_column
+        self.__lock = threading.Lock()
+        self.__ids = {}
+        self.__names = {}
+        self.__loaded = False
+        # Incremented by every change, names read before a change are not stored
+        self.__generation = 0
+        # Metrics
+        self.__hits = 0
+        self.__misses = 0
+        self.__loads = 0
+
+    def __add(self, name, entity_id):
+        """
+        Add a name, must be called with the lock held
+        :param name: unique name of the row
+        :param entity_id: ID of the row
+        :return: None
+        """
+        self.__ids[name] = entity_id
+        self.__names[entity_id] = name
+
+    def __load(self):
+        """
+        Load all names of the table
+        :return: None
+        """
+        generation = self.__generation
+        rows = self.__db.fetchall(f"SELECT {self.__name_column}, id FROM {self.__table}", row_format="tuple")
+        with self.__lock:
+            if generation != self.__generation:
+                return
+            self.__ids.clear()
+            self.__names.clear()
+            for name, entity_id in rows:
+                self.__add(name, entity_id)
+            self.__loaded = True
+            self.__loads += 1
+
+    def resolve(self, name, loader, store=True):
+        """
+        Get the ID of a name
+        :param name: unique name of the row
+        :param loader: function reading the ID of the name from the database, used on a miss
+        :param store: False to leave the map untouched (e.g. inside a transaction)
+        :return: ID of the row, None if it does not exist
+        """
+        if store and not self.__loaded:
+            self.__load()
+        with self.__lock:
+            entity_id = self.__ids.get(name)
+            if entity_id is not None:
+                self.__hits += 1
+                return entity_id
+            self.__misses += 1
+            generation = self.__generation
+        entity_id = loader()
+        if entity_id is not None and store:
+            with self.__lock:
+                if generation == self.__generation:
+                    self.__add(name, entity_id)
+        return entity_id
+
+    def discard(self, entity_id):
+        """
+        Drop the name of a renamed or deleted row
+        :param entity_id: ID of the row
+        :return: None
+        """
+        with self.__lock:
+            self.__generation += 1
+            name = self.__names.pop(entity_id, None)
+            if name is not None:
+                self.__ids.pop(name, None)
+
+    def invalidate(self):
+        """
+        Drop all names, they are loaded again on next use
+        :return: None
+        """
+        with self.__lock:
+            self.__generation += 1
+            self.__ids.clear()
+            self.__names.clear()
+            self.__loaded = False
+
+    def get_stats(self):
+        """
+        Get the registry metrics
+        :return: dictionary with number of names, hits, misses and full loads
+        """
+        with self.__lock:
+            return {
+                "size": len(self.__ids),
+                "loaded": self.__loaded,
+                "hits": self.__hits,
+                "misses": self.__misses,
+                "loads": self.__loads
+            }
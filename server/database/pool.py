@@ -0,0 +1,149 @@
+import threading
+import time
+from contextlib import contextmanager
+from server.application.exceptions import DatabaseError
+
+class ConnectionPool:
+    def __init__(self, factory, size=5, timeout=30.0):
+        """
+        Initialize a bounded pool of database connections
+        :param factory: callable returning a new connection
+        :param size: maximum number of connections held by the pool
+        :param timeout: seconds to wait for a free connection before failing
+        """
+        if not callable(factory):
+            raise ValueError("Connection factory must be callable")
+        if not isinstance(size, int) or size <= 0:
+            raise ValueError("Pool size must be a positive integer")
+        self.__factory = factory
+        self.__size = size
+        self.__timeout = timeout
+        # Connections that are ready to be checked out
+        self.__idle = []
+        # Number of connections created and not yet closed
+        self.__created = 0
+        self.__closed = False
+        self.__condition = threading.Condition()
+        # Metrics
+        self.__checkouts = 0
+        self.__waits = 0
+        self.__timeouts = 0
+        self.__total_wait_time = 0.0
+        self.__max_wait_time = 0.0
+        self.__max_in_use = 0
+
+    def checkout(self, timeout=None):
+        """
+        Check out a connection, creating one if the pool is not full yet
+        :param timeout: seconds to wait for a free connection (pool default if None)
+        :raises DatabaseError: if the pool is closed or no connection becomes free in time
+        :return: a connection owned by the caller until checkin()
+        """
+        if timeout is None:
+            timeout = self.__timeout
+        start = time.perf_counter()
+        waited = False
+        with self.__condition:
+            while True:
+                if self.__closed:
+                    raise DatabaseError("Connection pool is closed")
+                if self.__idle:
+                    connection = self.__idle.pop()
+                    break
+                if self.__created < self.__size:
+                    # Reserve the slot before leaving the lock to create the connection
+                    self.__created += 1
+                    connection = None
+                    break
+                remaining = timeout - (time.perf_counter() - start)
+                if remaining <= 0:
+                    self.__timeouts += 1
+                    raise DatabaseError(
+                        f"Timed out after {timeout}s waiting for a database connection"
+                    )
+                waited = True
+                self.__condition.wait(remaining)
+            self.__record_checkout(time.perf_counter() - start, waited)
+        if connection is None:
+            try:
+                connection = self.__factory()
+            except Exception:
+                with self.__condition:
+                    self.__created -= 1
+                    self.__condition.notify()
+                raise
+        return connection
+
+    def checkin(self, connection):
+        """
+        Return a connection to the pool
+        :param connection: connection obtained from checkout()
+        :return: None
+        """
+        with self.__condition:
+            if self.__closed:
+                self.__created -= 1
+                connection.close()
+                return
+            self.__idle.append(connection)
+            self.__condition.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """
+        Context manager that checks a connection out and back in
+        :param timeout: seconds to wait for a free connection
+        :return: None
+        """
+        connection = self.checkout(timeout)
+        try:
+            yield connection
+        finally:
+            self.checkin(connection)
+
+    def close(self):
+        """
+        Close all idle connections, connections in use are closed on checkin
+        :return: None
+        """
+        with self.__condition:
+            self.__closed = True
+            while self.__idle:
+                self.__idle.pop().close()
+                self.__created -= 1
+            self.__condition.notify_all()
+
+    def get_stats(self):
+        """
+        Get usage metrics of the pool
+        :return: dictionary of pool metrics, wait times are in seconds
+        """
+        with self.__condition:
+            in_use = self.__created - len(self.__idle)
+            return {
+                "size": self.__size,
+                "created": self.__created,
+                "idle": len(self.__idle),
+                "in_use": in_use,
+                "max_in_use": self.__max_in_use,
+                "checkouts": self.__checkouts,
+                "waits": self.__waits,
+                "timeouts": self.__timeouts,
+                "total_wait_time": self.__total_wait_time,
+                "max_wait_time": self.__max_wait_time,
+                "avg_wait_time": self.__total_wait_time / self.__checkouts if self.__checkouts else 0.0
+            }
+
+    def __record_checkout(self, wait_time, waited):
+        """
+        Update metrics after a successful checkout (caller holds the lock)
+        :param wait_time: seconds spent waiting for the connection
+        :param waited: True if the caller had to block for a free connection
+        :return: None
+        """
+        self.__checkouts += 1
+        if waited:
+            self.__waits += 1
+        self.__total_wait_time += wait_time
+        self.__max_wait_time = max(self.__max_wait_time, wait_time)
+        self.__max_in_use = max(self.__max_in_use, self.__created - len(self.__idle))
@@ -0,0 +1,103 @@
+from operator import itemgetter
+
+class Record:
+    """
+    Base class of compact, read-only style rows
+    Fields are stored in __slots__ and can be read as attributes or by key like a dictionary
+    """
+    __slots__ = ()
+
+    @classmethod
+    def converter(cls, columns):
+        """
+        Build a function turning a raw result tuple into a record
+        :param columns: column names of the result, in order
+        :return: function taking a tuple of values and returning a record
+        """
+        columns = list(columns)
+        positions = [columns.index(field) if field in columns else None for field in cls.__slots__]
+        if None not in positions:
+            getter = itemgetter(*positions)
+            return lambda values: cls(*getter(values))
+        # Columns missing from the result are filled with None
+        return lambda values: cls(*(values[p] if p is not None else None for p in positions))
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            return type(self) is type(other) and self.to_dict() == other.to_dict()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    def __repr__(self):
+        fields = ", ".join(f"{key}={getattr(self, key)!r}" for key in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+    def keys(self):
+        """
+        Get the field names of the record
+        :return: tuple of field names
+        """
+        return self.__slots__
+
+    def get(self, key, default=None):
+        """
+        Get a field by name
+        :param key: name of the field
+        :param default: value returned if the field does not exist
+        :return: value of the field
+        """
+        return getattr(self, key, default) if key in self.__slots__ else default
+
+    def to_dict(self):
+        """
+        Convert the record into a dictionary
+        :return: dictionary of the record
+        """
+        return {key: getattr(self, key) for key in self.__slots__}
+
+class NotebookRow(Record):
+    """
+    Row of the notebooks table
+    """
+    __slots__ = ("id", "notebook_name", "description", "created_at", "updated_at")
+
+    def __init__(self, id, notebook_name, description, created_at, updated_at):
+        self.id = id
+        self.notebook_name = notebook_name
+        self.description = description
+        self.created_at = created_at
+        self.updated_at = updated_at
+
+class NoteRow(Record):
+    """
+    Row of the notes table
+    """
+    __slots__ = ("id", "title", "notebook_id", "created_at", "updated_at", "size")
+
+    def __init__(self, id, title, notebook_id, created_at, updated_at, size):
+        self.id = id
+        self.title = title
+        self.notebook_id = notebook_id
+        self.created_at = created_at
+        self.updated_at = updated_at
+        self.size = size
+
+class TagRow(Record):
+    """
+    Row of the tags table
+    """
+    __slots__ = ("id", "tag_name")
+
+    def __init__(self, id, tag_name):
+        self.id = id
+        self.tag_name = tag_name
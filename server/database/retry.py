@@ -0,0 +1,135 @@
+import random
+import sqlite3
+import threading
+import time
+from server.application.exceptions import DatabaseLockedError
+
+def is_lock_error(error):
+    """
+    Check whether a sqlite3 error was caused by another connection holding the lock
+    :param error: exception raised by sqlite3
+    :return: True for "database is locked" and "database is busy" errors, False otherwise
+    """
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+class RetryPolicy:
+    def __init__(self, max_attempts=5, base_delay=0.02, max_delay=1.0, jitter=0.5):
+        """
+        Retry policy with exponential backoff and random jitter for lock errors
+        Each attempt already waits up to the busy timeout inside SQLite, the backoff is added on top
+        :param max_attempts: number of attempts before giving up (1 disables retrying)
+        :param base_delay: seconds slept after the first failed attempt, doubled every attempt
+        :param max_delay: upper bound of the delay in seconds
+        :param jitter: fraction of the delay randomized so that competing processes spread out
+        """
+        if not isinstance(max_attempts, int) or max_attempts <= 0:
+            raise ValueError("Number of attempts must be a positive integer")
+        if base_delay < 0 or max_delay < 0:
+            raise ValueError("Retry delays cannot be negative")
+        if not 0 <= jitter <= 1:
+            raise ValueError("Jitter must be between 0 and 1")
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+    def delay(self, attempt):
+        """
+        Get the backoff delay after a failed attempt
+        :param attempt: number of the failed attempt, starting at 1
+        :return: seconds to sleep
+        """
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return delay * (1 - self.jitter * random.random())
+
+class LockStats:
+    def __init__(self):
+        """
+        Collector of lock waits, retries and failures
+        """
+        self.__lock = threading.Lock()
+        self.__acquisitions = 0
+        self.__total_wait_time = 0.0
+        self.__max_wait_time = 0.0
+        self.__contended = 0
+        self.__retries = 0
+        self.__failures = 0
+
+    def record(self, wait_time, retries, failed):
+        """
+        Record one guarded operation
+        :param wait_time: seconds spent until the operation succeeded or gave up
+        :param retries: number of retries after lock errors
+        :param failed: True if the operation gave up
+        :return: None
+        """
+        with self.__lock:
+            self.__acquisitions += 1
+            self.__total_wait_time += wait_time
+            self.__max_wait_time = max(self.__max_wait_time, wait_time)
+            if retries:
+                self.__contended += 1
+                self.__retries += retries
+            if failed:
+                self.__failures += 1
+
+    def get_stats(self):
+        """
+        Get the collected metrics
+        :return: dictionary with number of operations, wait times, retries and failures
+        """
+        with self.__lock:
+            return {
+                "acquisitions": self.__acquisitions,
+                "contended": self.__contended,
+                "retries": self.__retries,
+                "failures": self.__failures,
+                "total_wait_time": self.__total_wait_time,
+                "max_wait_time": self.__max_wait_time,
+                "avg_wait_time": self.__total_wait_time / self.__acquisitions if self.__acquisitions else 0.0
+            }
+
+    def reset(self):
+        """
+        Discard the collected metrics
+        :return: None
+        """
+        with self.__lock:
+            self.__acquisitions = 0
+            self.__total_wait_time = 0.0
+            self.__max_wait_time = 0.0
+            self.__contended = 0
+            self.__retries = 0
+            self.__failures = 0
+
+def run_with_retry(function, policy, stats=None):
+    """
+    Run a function, retrying it with backoff while it fails with lock errors
+    The function must be safe to repeat (e.g. BEGIN IMMEDIATE or an autocommit statement)
+    :param function: callable to run
+    :param policy: RetryPolicy
+    :param stats: LockStats recording the waits, optional
+    :raises DatabaseLockedError: if the database is still locked after the last attempt
+    :return: result of the function
+    """
+    start = time.perf_counter()
+    attempt = 1
+    while True:
+        try:
+            result = function()
+        except sqlite3.OperationalError as e:
+            if not is_lock_error(e):
+                raise
+            if attempt >= policy.max_attempts:
+                if stats is not None:
+                    stats.record(time.perf_counter() - start, attempt - 1, True)
+                raise DatabaseLockedError(f"Database is still locked after {attempt} attempts: {str(e)}")
+            time.sleep(policy.delay(attempt))
+            attempt += 1
+            continue
+        if stats is not None:
+            stats.record(time.perf_counter() - start, attempt - 1, False)
+        return result
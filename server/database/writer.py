@@ -0,0 +1,207 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from server.application.exceptions import DatabaseError
+
+class _WriteJob:
+    """
+    A callable waiting in the write queue together with the future of its result
+    """
+    __slots__ = ("fn", "args", "kwargs", "future")
+
+    def __init__(self, fn, args, kwargs):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+
+class WriteQueue:
+    def __init__(self, db, window=0.002, max_batch=256):
+        """
+        Initialize a single writer thread that group commits write jobs
+        The writer holds one connection of the pool while it runs
+        :param db: Database the jobs write to
+        :param window: seconds the writer waits for more jobs before committing a batch
+        :param max_batch: maximum number of jobs committed together
+        """
+        if window < 0:
+            raise ValueError("Group commit window cannot be negative")
+        if not isinstance(max_batch, int) or max_batch <= 0:
+            raise ValueError("Batch size must be a positive integer")
+        self.__db = db
+        self.__window = window
+        self.__max_batch = max_batch
+        self.__queue = queue.Queue()
+        self.__thread = None
+        self.__lock = threading.Lock()
+        # Metrics
+        self.__jobs = 0
+        self.__failed_jobs = 0
+        self.__batches = 0
+        self.__failed_batches = 0
+        self.__max_batch_seen = 0
+
+    def start(self):
+        """
+        Start the writer thread
+        :return: None
+        """
+        with self.__lock:
+            if self.__thread is not None:
+                return
+            self.__thread = threading.Thread(target=self.__run, name="knowgent-db-writer", daemon=True)
+            self.__thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Commit the jobs already queued and stop the writer thread
+        :param timeout: seconds to wait for the writer thread
+        :return: None
+        """
+        with self.__lock:
+            thread = self.__thread
+            if thread is None:
+                return
+            self.__thread = None
+            self.__queue.put(None)
+        thread.join(timeout)
+
+    def is_running(self):
+        """
+        Check whether the writer thread is running
+        :return: True if running, False otherwise
+        """
+        return self.__thread is not None
+
+    def is_writer_thread(self):
+        """
+        Check whether the caller runs on the writer thread
+        :return: True if called from a write job, False otherwise
+        """
+        return threading.current_thread() is self.__thread
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Queue a write job
+        The job runs on the writer thread inside its own savepoint, so models called by it
+        write through the writer connection, its result is available once the batch is committed
+        :param fn: callable performing the writes
+        :raises DatabaseError: if the writer thread is not running
+        :return: Future of the result of fn
+        """
+        job = _WriteJob(fn, args, kwargs)
+        with self.__lock:
+            if self.__thread is None:
+                raise DatabaseError("Write queue is not running")
+            self.__queue.put(job)
+        return job.future
+
+    def get_stats(self):
+        """
+        Get metrics of the write queue
+        :return: dictionary with numbers of jobs and batches and the average batch size
+        """
+        with self.__lock:
+            return {
+                "running": self.__thread is not None,
+                "queued": self.__queue.qsize(),
+                "jobs": self.__jobs,
+                "failed_jobs": self.__failed_jobs,
+                "batches": self.__batches,
+                "failed_batches": self.__failed_batches,
+                "avg_batch_size": self.__jobs / self.__batches if self.__batches else 0.0,
+                "max_batch_size": self.__max_batch_seen
+            }
+
+    def __collect_batch(self, first):
+        """
+        Collect the jobs arriving within the group commit window
+        :param first: job that opened the batch
+        :return: (list of jobs, True if the stop signal was received)
+        """
+        batch = [first]
+        deadline = time.monotonic() + self.__window
+        while len(batch) < self.__max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                job = self.__queue.get(timeout=remaining) if remaining > 0 else self.__queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:
+                return batch, True
+            batch.append(job)
+        return batch, False
+
+    def __run(self):
+        """
+        Main loop of the writer thread
+        :return: None
+        """
+        # The writer keeps one connection of the pool for all its batches
+        with self.__db.hold_connection():
+            stopping = False
+            while not stopping:
+                first = self.__queue.get()
+                if first is None:
+                    break
+                batch, stopping = self.__collect_batch(first)
+                self.__commit_batch(batch)
+            # Commit whatever was queued before stop() was called
+            leftover = []
+            while True:
+                try:
+                    job = self.__queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is not None:
+                    leftover.append(job)
+            for start in range(0, len(leftover), self.__max_batch):
+                self.__commit_batch(leftover[start:start + self.__max_batch])
+
+    def __commit_batch(self, batch):
+        """
+        Run a batch of jobs in one transaction, each job in its own savepoint
+        A failing job is rolled back alone, the futures are resolved after the commit
+        :param batch: list of jobs
+        :return: None
+        """
+        outcomes = []
+        try:
+            with self.__db.transaction():
+                for job in batch:
+                    if not job.future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        with self.__db.transaction():
+                            result = job.fn(*job.args, **job.kwargs)
+                        outcomes.append((job, result, None))
+                    except Exception as e:
+                        outcomes.append((job, None, e))
+        except Exception as e:
+            # The transaction could not be opened or committed, nothing of the batch was written
+            # Every job still waiting is failed, also those that never ran (e.g. BEGIN timed out)
+            failed = 0
+            for job in batch:
+                # Cancelled jobs are already done
+                if not job.future.done():
+                    job.future.set_exception(DatabaseError(f"Failed to commit write batch: {str(e)}"))
+                    failed += 1
+            with self.__lock:
+                self.__batches += 1
+                self.__failed_batches += 1
+                self.__jobs += failed
+                self.__failed_jobs += failed
+            return
+        failed = 0
+        for job, result, error in outcomes:
+            if error is None:
+                job.future.set_result(result)
+            else:
+                failed += 1
+                job.future.set_exception(error)
+        with self.__lock:
+            self.__batches += 1
+            self.__jobs += len(outcomes)
+            self.__failed_jobs += failed
+            self.__max_batch_seen = max(self.__max_batch_seen, len(outcomes))
@@ -0,0 +1,29 @@
+import uuid
+from pathlib import Path
+import pytest
+from server.database.database import Database
+
+@pytest.fixture
+def make_repository(tmp_path):
+    """
+    Create repositories in temporary directories, their database files are removed afterwards
+    The database file is named after the repository folder, so every name is unique
+    """
+    databases = []
+
+    def make(name="Repo"):
+        base_path = tmp_path / f"{name}{uuid.uuid4().hex[:8]}"
+        base_path.mkdir()
+        db = Database(str(base_path))
+        databases.append(db)
+        return db
+
+    yield make
+    for db in databases:
+        db_path = db.get_db_path()
+        try:
+            db.close()
+        except Exception:
+            pass
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"{db_path}{suffix}").unlink(missing_ok=True)
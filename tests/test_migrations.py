@@ -0,0 +1,29 @@
+from pathlib import Path
+import server.database.database as database
+from server.database.migrations import MIGRATIONS
+from server.application.services.stats_service import StatsService
+
+def test_note_sizes_are_taken_from_the_files_when_migrating_to_version_8(make_repository, monkeypatch):
+    # A repository created before the note sizes were recorded
+    monkeypatch.setattr(database, "MIGRATIONS", [m for m in MIGRATIONS if m.version < 8])
+    monkeypatch.setattr(database, "SCHEMA_VERSION", 7)
+    db = make_repository()
+    assert db.get_schema_version() == 7
+    base_path = db.get_base_path()
+    db.execute("INSERT INTO notebooks (notebook_name) VALUES ('nb')")
+    notebook_id = db.fetchvalue("SELECT id FROM notebooks WHERE notebook_name = 'nb'")
+    for title, content in (("a", b"x" * 100), ("b", b"y" * 23), ("missing", None)):
+        db.execute("INSERT INTO notes (title, notebook_id) VALUES (?, ?)", [title, notebook_id])
+        if content is not None:
+            (Path(base_path) / "nb").mkdir(exist_ok=True)
+            (Path(base_path) / "nb" / f"{title}.md").write_bytes(content)
+    db.close()
+    monkeypatch.undo()
+
+    db = database.Database(base_path)
+    try:
+        assert db.get_schema_version() == database.SCHEMA_VERSION
+        assert StatsService(db).get_notebook_stats("nb") == {"note_count": 3, "total_size": 123}
+        assert StatsService(db).check_counters(scan_files=True) == {"sizes_fixed": 0, "mismatches": [], "repaired": False}
+    finally:
+        db.close()
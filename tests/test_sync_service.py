@@ -0,0 +1,89 @@
+from server.application.services.sync_service import SyncService, _Replica, note_key
+
+BODY = b"".join(f"Line {i} of a note that is long enough to be worth a delta\n".encode() for i in range(100))
+
+def write_note(replica, notebook_name, title, content):
+    replica.note_path(note_key(notebook_name, title)).write_bytes(content)
+
+def read_note(replica, notebook_name, title):
+    return replica.read_note(note_key(notebook_name, title))
+
+def titles(replica):
+    return sorted(note["title"] for note in replica.note_service.get_all_notes())
+
+def test_round_trip_between_two_directories(make_repository):
+    local, remote = _Replica(make_repository("Local")), _Replica(make_repository("Remote"))
+    local.notebook_service.create_notebook("nb", "notes")
+    local.note_service.create_note("n1", "nb")
+    write_note(local, "nb", "n1", BODY)
+    local.tag_service.create_tag("t1")
+    local.note_tag_service.add_tag_to_note("n1", "nb", "t1")
+    remote.notebook_service.create_notebook("other", None)
+    sync = SyncService(local.db, remote.db)
+
+    report = sync.sync()
+    assert "create notebook other" in report["local"]
+    assert "create note n1 in nb" in report["remote"]
+    assert read_note(remote, "nb", "n1") == BODY
+    assert remote.note_tag_service.get_tags_for_note("n1", "nb") == ["t1"]
+
+    # Nothing changed, neither side is scanned again
+    report = sync.sync()
+    assert report["local"] == report["remote"] == []
+    assert report["scanned"] == []
+
+    # An edit travels as a line delta
+    write_note(remote, "nb", "n1", BODY + b"A line added on the remote side\n")
+    report = sync.sync()
+    assert report["local"] == ["patch note n1 in nb"]
+    assert read_note(local, "nb", "n1") == BODY + b"A line added on the remote side\n"
+    assert report["bytes_sent"] < report["bytes_full"]
+
+def test_conflicting_edits_keep_both_versions(make_repository):
+    local, remote = _Replica(make_repository("Local")), _Replica(make_repository("Remote"))
+    local.notebook_service.create_notebook("nb", None)
+    local.note_service.create_note("n1", "nb")
+    write_note(local, "nb", "n1", BODY)
+    sync = SyncService(local.db, remote.db)
+    sync.sync()
+
+    write_note(local, "nb", "n1", b"Local version\n" + BODY)
+    write_note(remote, "nb", "n1", BODY + b"Remote version\n")
+    local.tag_service.create_tag("local-tag")
+    remote.tag_service.create_tag("remote-tag")
+    report = sync.sync()
+
+    assert [conflict["kind"] for conflict in report["conflicts"]] == ["note"]
+    copy = f"n1 (conflict {remote.name})"
+    for replica in (local, remote):
+        assert titles(replica) == ["n1", copy]
+        assert read_note(replica, "nb", "n1") == b"Local version\n" + BODY
+        assert read_note(replica, "nb", copy) == BODY + b"Remote version\n"
+        assert sorted(replica.tag_service.get_all_tags()) == ["local-tag", "remote-tag"]
+
+    # Both sides agree, the next sync has nothing to do
+    report = sync.sync()
+    assert report["local"] == report["remote"] == report["conflicts"] == []
+
+def count_changes(replica):
+    return replica.db.fetchvalue("SELECT count(*) FROM changes")
+
+def test_changes_are_pruned_once_every_peer_synced_them(make_repository):
+    local = _Replica(make_repository("Local"))
+    first, second = _Replica(make_repository("First")), _Replica(make_repository("Second"))
+    SyncService(local.db, first.db).sync()
+    SyncService(local.db, second.db).sync()
+    assert count_changes(local) == 0
+
+    local.tag_service.create_tag("t1")
+    local.tag_service.create_tag("t2")
+    assert count_changes(local) == 2
+
+    # The second peer has not seen the tags yet, so their changes are kept
+    SyncService(local.db, first.db).sync()
+    assert count_changes(local) == 2
+    assert count_changes(first) == 0
+
+    SyncService(local.db, second.db).sync()
+    assert count_changes(local) == 0
+    assert sorted(second.tag_service.get_all_tags()) == ["t1", "t2"]